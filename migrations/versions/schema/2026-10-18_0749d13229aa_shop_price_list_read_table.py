@@ -0,0 +1,120 @@
+"""Shop price list read table.
+
+Revision ID: 0749d13229aa
+Revises: 76174876617a
+Create Date: 2026-10-18 10:12:41.118204
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "0749d13229aa"
+down_revision = "76174876617a"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "shop_price_list",
+        sa.Column("id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("shop_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("internal_product_id", sa.String(), nullable=True),
+        sa.Column("active", sa.Boolean(), nullable=True),
+        sa.Column("new", sa.Boolean(), nullable=True),
+        sa.Column("category_id", postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column("category_name", sa.String(length=255), nullable=True),
+        sa.Column("category_name_en", sa.String(length=255), nullable=True),
+        sa.Column("category_icon", sa.String(length=60), nullable=True),
+        sa.Column("category_color", sa.String(length=20), nullable=True),
+        sa.Column("category_order_number", sa.Integer(), nullable=True),
+        sa.Column("category_image_1", sa.String(length=255), nullable=True),
+        sa.Column("category_image_2", sa.String(length=255), nullable=True),
+        sa.Column("category_pricelist_column", sa.String(), nullable=True),
+        sa.Column("category_pricelist_row", sa.Integer(), nullable=True),
+        sa.Column("main_category_id", sa.String(), nullable=True),
+        sa.Column("main_category_name", sa.String(length=255), nullable=True),
+        sa.Column("main_category_name_en", sa.String(length=255), nullable=True),
+        sa.Column("main_category_icon", sa.String(length=60), nullable=True),
+        sa.Column("main_category_order_number", sa.Integer(), nullable=True),
+        sa.Column("kind_id", postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column("kind_image", sa.String(length=255), nullable=True),
+        sa.Column("kind_name", sa.String(length=255), nullable=True),
+        sa.Column("strains", sa.JSON(), nullable=True),
+        sa.Column("kind_short_description_nl", sa.String(), nullable=True),
+        sa.Column("kind_short_description_en", sa.String(), nullable=True),
+        sa.Column("kind_c", sa.Boolean(), nullable=True),
+        sa.Column("kind_h", sa.Boolean(), nullable=True),
+        sa.Column("kind_i", sa.Boolean(), nullable=True),
+        sa.Column("kind_s", sa.Boolean(), nullable=True),
+        sa.Column("product_id", postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column("product_image", sa.String(length=255), nullable=True),
+        sa.Column("product_name", sa.String(length=255), nullable=True),
+        sa.Column("product_short_description_nl", sa.String(), nullable=True),
+        sa.Column("product_short_description_en", sa.String(), nullable=True),
+        sa.Column("half", sa.Float(), nullable=True),
+        sa.Column("one", sa.Float(), nullable=True),
+        sa.Column("two_five", sa.Float(), nullable=True),
+        sa.Column("five", sa.Float(), nullable=True),
+        sa.Column("joint", sa.Float(), nullable=True),
+        sa.Column("piece", sa.Float(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("modified_at", sa.DateTime(), nullable=True),
+        sa.Column("order_number", sa.Integer(), nullable=True),
+        sa.Column("price_half", sa.Float(), nullable=True),
+        sa.Column("price_one", sa.Float(), nullable=True),
+        sa.Column("price_two_five", sa.Float(), nullable=True),
+        sa.Column("price_five", sa.Float(), nullable=True),
+        sa.Column("price_joint", sa.Float(), nullable=True),
+        sa.Column("price_piece", sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(["id"], ["shops_to_price.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["shop_id"], ["shops.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_shop_price_list_shop_id"), "shop_price_list", ["shop_id"], unique=False)
+
+    # Initial fill; from now on the application keeps the rows up to date
+    conn = op.get_bind()
+    conn.execute(
+        sa.text(
+            """
+            INSERT INTO shop_price_list
+            SELECT stp.id, stp.shop_id, p.internal_product_id, stp.active, stp.new,
+                   stp.category_id, c.name, c.name_en, c.icon, c.color, c.order_number, c.image_1, c.image_2,
+                   c.pricelist_column, c.pricelist_row,
+                   COALESCE(mc.id::text, 'Unknown'), COALESCE(mc.name, 'Unknown'), COALESCE(mc.name_en, 'Unknown'),
+                   COALESCE(mc.icon, 'Unknown'), COALESCE(mc.order_number, 0),
+                   stp.kind_id, k.image_1, k.name,
+                   CASE WHEN stp.kind_id IS NULL THEN '[]'::json ELSE COALESCE(
+                       (SELECT json_agg(json_build_object('name', s.name))
+                        FROM kinds_to_strains ks JOIN strains s ON s.id = ks.strain_id
+                        WHERE ks.kind_id = stp.kind_id),
+                       '[]'::json)
+                   END,
+                   k.short_description_nl, k.short_description_en, k.c, k.h, k.i, k.s,
+                   stp.product_id, pr.image_1, pr.name, pr.short_description_nl, pr.short_description_en,
+                   CASE WHEN stp.use_half THEN p.half END,
+                   CASE WHEN stp.use_one THEN p.one END,
+                   CASE WHEN stp.two_five THEN p.two_five END,
+                   CASE WHEN stp.use_five THEN p.five END,
+                   CASE WHEN stp.use_joint THEN p.joint END,
+                   CASE WHEN stp.use_piece THEN p.piece END,
+                   stp.created_at, stp.modified_at, stp.order_number,
+                   p.half, p.one, p.two_five, p.five, p.joint, p.piece
+            FROM shops_to_price stp
+            JOIN prices p ON p.id = stp.price_id
+            JOIN categories c ON c.id = stp.category_id
+            LEFT JOIN main_categories mc ON mc.id = c.main_category_id
+            LEFT JOIN kinds k ON k.id = stp.kind_id
+            LEFT JOIN products pr ON pr.id = stp.product_id
+            WHERE stp.shop_id IS NOT NULL
+        """
+        )
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_shop_price_list_shop_id"), table_name="shop_price_list")
+    op.drop_table("shop_price_list")
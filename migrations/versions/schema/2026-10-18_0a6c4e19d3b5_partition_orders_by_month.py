@@ -0,0 +1,103 @@
+"""Partition the orders table by month.
+
+Revision ID: 0a6c4e19d3b5
+Revises: f3a7d2c19b48
+Create Date: 2026-10-18 22:03:41.702815
+
+"""
+from datetime import date, datetime
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "0a6c4e19d3b5"
+down_revision = "f3a7d2c19b48"
+branch_labels = None
+depends_on = None
+
+COLUMNS = (
+    "id, shop_id, order_info, total, status, created_at, completed_at, customer_order_id, notes, completed_by, table_id"
+)
+INDEXES = ("orders_pkey", "ix_orders_id", "ix_orders_shop_id", "ix_orders_shop_id_status_created_at_id")
+# Months created in advance, see `server.utils.order_partitions`
+MONTHS_AHEAD = 3
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def create_orders_table(primary_key: sa.PrimaryKeyConstraint, **kwargs) -> None:
+    op.create_table(
+        "orders",
+        sa.Column("id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("shop_id", postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column("order_info", sa.JSON(), nullable=True),
+        sa.Column("total", sa.Float(), nullable=True),
+        sa.Column("status", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("completed_at", sa.DateTime(), nullable=True),
+        sa.Column("customer_order_id", sa.Integer(), nullable=True),
+        sa.Column("notes", sa.String(), nullable=True),
+        sa.Column("completed_by", postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column("table_id", postgresql.UUID(as_uuid=True), nullable=True),
+        sa.ForeignKeyConstraint(["completed_by"], ["user.id"], name="orders_completed_by_fkey"),
+        sa.ForeignKeyConstraint(["shop_id"], ["shops.id"], name="orders_shop_id_fkey"),
+        sa.ForeignKeyConstraint(["table_id"], ["shop_tables.id"], name="orders_table_id_fkey"),
+        primary_key,
+        **kwargs,
+    )
+    op.create_index("ix_orders_id", "orders", ["id"], unique=False)
+    op.create_index("ix_orders_shop_id", "orders", ["shop_id"], unique=False)
+    op.create_index(
+        "ix_orders_shop_id_status_created_at_id", "orders", ["shop_id", "status", "created_at", "id"], unique=False
+    )
+
+
+def move_orders_table() -> None:
+    """Rename the current orders table and its indexes out of the way."""
+    op.rename_table("orders", "orders_old")
+    for index in INDEXES:
+        op.execute(f"ALTER INDEX IF EXISTS {index} RENAME TO {index.replace('orders', 'orders_old', 1)}")
+
+
+def upgrade() -> None:
+    # A foreign key to a partitioned table has to include the partition key
+    op.drop_constraint("licenses_order_id_fkey", "licenses", type_="foreignkey")
+    move_orders_table()
+    # The partition key has to be part of the primary key
+    create_orders_table(sa.PrimaryKeyConstraint("id", "created_at"), postgresql_partition_by="RANGE (created_at)")
+
+    op.execute("CREATE TABLE orders_default PARTITION OF orders DEFAULT")
+    first = op.get_bind().execute(sa.text("SELECT min(coalesce(created_at, completed_at)) FROM orders_old")).scalar()
+    month = (first or datetime.utcnow()).date().replace(day=1)
+    last = add_months(datetime.utcnow().date().replace(day=1), MONTHS_AHEAD)
+    while month <= last:
+        end = add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE orders_{month:%Y_%m} PARTITION OF orders "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+        )
+        month = end
+
+    op.execute(
+        f"""
+        INSERT INTO orders ({COLUMNS})
+        SELECT {COLUMNS.replace('created_at', "coalesce(created_at, completed_at, now() AT TIME ZONE 'UTC')")}
+        FROM orders_old
+        """
+    )
+    op.drop_table("orders_old")
+
+
+def downgrade() -> None:
+    move_orders_table()
+    create_orders_table(sa.PrimaryKeyConstraint("id", name="orders_pkey"))
+    op.alter_column("orders", "created_at", nullable=True)
+    op.execute(f"INSERT INTO orders ({COLUMNS}) SELECT {COLUMNS} FROM orders_old")
+    # Drops the partitions as well
+    op.drop_table("orders_old")
+    op.create_foreign_key("licenses_order_id_fkey", "licenses", "orders", ["order_id"], ["id"])
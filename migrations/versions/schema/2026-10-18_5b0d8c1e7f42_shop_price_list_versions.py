@@ -0,0 +1,55 @@
+"""Shop price list versions and deletion log.
+
+Revision ID: 5b0d8c1e7f42
+Revises: 0749d13229aa
+Create Date: 2026-10-18 14:03:27.552017
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "5b0d8c1e7f42"
+down_revision = "0749d13229aa"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(sa.schema.CreateSequence(sa.Sequence("shop_price_list_version_seq")))
+    # The server default numbers the existing rows
+    op.add_column(
+        "shop_price_list",
+        sa.Column(
+            "version",
+            sa.BigInteger(),
+            server_default=sa.text("nextval('shop_price_list_version_seq')"),
+            nullable=False,
+        ),
+    )
+    op.create_index("ix_shop_price_list_shop_id_version", "shop_price_list", ["shop_id", "version"], unique=False)
+
+    op.create_table(
+        "shop_price_list_deletions",
+        sa.Column("version", sa.BigInteger(), nullable=False),
+        sa.Column("id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("shop_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("deleted_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(["shop_id"], ["shops.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("version"),
+    )
+    op.create_index(
+        "ix_shop_price_list_deletions_shop_id_version",
+        "shop_price_list_deletions",
+        ["shop_id", "version"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_shop_price_list_deletions_shop_id_version", table_name="shop_price_list_deletions")
+    op.drop_table("shop_price_list_deletions")
+    op.drop_index("ix_shop_price_list_shop_id_version", table_name="shop_price_list")
+    op.drop_column("shop_price_list", "version")
+    op.execute(sa.schema.DropSequence(sa.Sequence("shop_price_list_version_seq")))
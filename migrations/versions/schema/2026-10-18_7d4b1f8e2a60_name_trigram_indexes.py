@@ -0,0 +1,44 @@
+"""Trigram indexes for the name filters of the list endpoints.
+
+Revision ID: 7d4b1f8e2a60
+Revises: 0a6c4e19d3b5
+Create Date: 2026-10-18 23:11:26.540139
+
+"""
+import logging
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "7d4b1f8e2a60"
+down_revision = "0a6c4e19d3b5"
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+TABLES = ("categories", "flavors", "kinds", "products", "strains", "tags")
+
+
+def upgrade() -> None:
+    available = op.get_bind().execute(sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"))
+    if not available.scalar():
+        # The filters work without them, only slower
+        logger.warning("The pg_trgm extension is not available, skipping the trigram indexes")
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for table in TABLES:
+        op.create_index(
+            f"ix_{table}_name_trgm",
+            table,
+            ["name"],
+            unique=False,
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        )
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.execute(f"DROP INDEX IF EXISTS ix_{table}_name_trgm")
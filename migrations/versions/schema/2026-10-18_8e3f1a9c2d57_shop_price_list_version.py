@@ -0,0 +1,23 @@
+"""Price list version pushed to the websocket clients of a shop.
+
+Revision ID: 8e3f1a9c2d57
+Revises: 5b0d8c1e7f42
+Create Date: 2026-10-18 16:41:09.310274
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "8e3f1a9c2d57"
+down_revision = "5b0d8c1e7f42"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("shops", sa.Column("price_list_version", sa.BigInteger(), server_default="0", nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column("shops", "price_list_version")
@@ -0,0 +1,47 @@
+"""Writing transaction of the shop price list rows and deletions, string price list cursors.
+
+Revision ID: a2c5e8f17b30
+Revises: b7e2c94d1f36
+Create Date: 2026-10-18 19:12:44.108532
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "a2c5e8f17b30"
+down_revision = "b7e2c94d1f36"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # The existing rows get the id of this transaction: they are synced again once, after the migration
+    for table in ("shop_price_list", "shop_price_list_deletions"):
+        op.add_column(
+            table, sa.Column("txid", sa.BigInteger(), server_default=sa.text("txid_current()"), nullable=False)
+        )
+        op.create_index(f"ix_{table}_shop_id_txid", table, ["shop_id", "txid"], unique=False)
+
+    op.alter_column("shops", "price_list_version", server_default=None)
+    op.alter_column(
+        "shops",
+        "price_list_version",
+        type_=sa.String(length=64),
+        postgresql_using="price_list_version::varchar",
+        server_default="0",
+    )
+
+
+def downgrade() -> None:
+    op.alter_column("shops", "price_list_version", server_default=None)
+    op.alter_column(
+        "shops",
+        "price_list_version",
+        type_=sa.BigInteger(),
+        postgresql_using="split_part(price_list_version, '.', 1)::bigint",
+        server_default="0",
+    )
+    for table in ("shop_price_list_deletions", "shop_price_list"):
+        op.drop_index(f"ix_{table}_shop_id_txid", table_name=table)
+        op.drop_column(table, "txid")
@@ -0,0 +1,56 @@
+"""Full-text search vectors on kinds and products.
+
+Revision ID: b7e2c94d1f36
+Revises: 7d4b1f8e2a60
+Create Date: 2026-10-18 23:48:02.318655
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = "b7e2c94d1f36"
+down_revision = "7d4b1f8e2a60"
+branch_labels = None
+depends_on = None
+
+TABLES = ("kinds", "products")
+SOURCE_COLUMNS = ("name", "short_description_nl", "description_nl", "short_description_en", "description_en")
+
+# The name unstemmed, so names match as typed, and the descriptions stemmed in their language. The name weighs most,
+# the short descriptions more than the long ones.
+UPDATE_FUNCTION = """
+CREATE OR REPLACE FUNCTION catalog_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.tsv :=
+        setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('dutch', coalesce(NEW.short_description_nl, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(NEW.short_description_en, '')), 'B') ||
+        setweight(to_tsvector('dutch', coalesce(NEW.description_nl, '')), 'C') ||
+        setweight(to_tsvector('english', coalesce(NEW.description_en, '')), 'C');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+def upgrade() -> None:
+    op.execute(UPDATE_FUNCTION)
+    for table in TABLES:
+        op.add_column(table, sa.Column("tsv", postgresql.TSVECTOR(), nullable=True))
+        op.execute(
+            f"CREATE TRIGGER {table}_tsv_update BEFORE INSERT OR UPDATE OF {', '.join(SOURCE_COLUMNS)} ON {table} "
+            "FOR EACH ROW EXECUTE FUNCTION catalog_search_vector_update()"
+        )
+        # Fires the trigger for the existing rows
+        op.execute(f"UPDATE {table} SET name = name")
+        op.create_index(f"ix_{table}_tsv", table, ["tsv"], unique=False, postgresql_using="gin")
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.drop_index(f"ix_{table}_tsv", table_name=table)
+        op.execute(f"DROP TRIGGER {table}_tsv_update ON {table}")
+        op.drop_column(table, "tsv")
+    op.execute("DROP FUNCTION catalog_search_vector_update()")
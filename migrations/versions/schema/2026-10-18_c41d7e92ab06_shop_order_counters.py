@@ -0,0 +1,45 @@
+"""Per shop customer order number counters.
+
+Revision ID: c41d7e92ab06
+Revises: 8e3f1a9c2d57
+Create Date: 2026-10-18 18:12:45.902113
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+from server.settings import app_settings
+
+# revision identifiers, used by Alembic.
+revision = "c41d7e92ab06"
+down_revision = "8e3f1a9c2d57"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "shop_order_counters",
+        sa.Column("shop_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("last_number", sa.Integer(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.ForeignKeyConstraint(["shop_id"], ["shops.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("shop_id"),
+    )
+    # Continue where the numbering based on the number of orders of the shop left off, on the day of the shop timezone
+    op.execute(
+        sa.text(
+            """
+            INSERT INTO shop_order_counters (shop_id, last_number, day)
+            SELECT shop_id, count(*), (now() AT TIME ZONE :timezone)::date
+            FROM orders
+            WHERE shop_id IS NOT NULL
+            GROUP BY shop_id
+            """
+        ).bindparams(timezone=app_settings.SHOP_TIMEZONE)
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("shop_order_counters")
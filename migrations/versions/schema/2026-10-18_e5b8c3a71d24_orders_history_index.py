@@ -0,0 +1,27 @@
+"""Composite index for the order history of a shop.
+
+Revision ID: e5b8c3a71d24
+Revises: d9a26b4f1c83
+Create Date: 2026-10-18 20:02:51.446187
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "e5b8c3a71d24"
+down_revision = "d9a26b4f1c83"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_orders_shop_id_status_created_at_id",
+        "orders",
+        ["shop_id", "status", "created_at", "id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_orders_shop_id_status_created_at_id", table_name="orders")
@@ -0,0 +1,100 @@
+"""Sales rollups of the completed orders per shop.
+
+Revision ID: f3a7d2c19b48
+Revises: e5b8c3a71d24
+Create Date: 2026-10-18 21:14:07.318524
+
+"""
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+from server.settings import app_settings
+
+# revision identifiers, used by Alembic.
+revision = "f3a7d2c19b48"
+down_revision = "e5b8c3a71d24"
+branch_labels = None
+depends_on = None
+
+# The orders the rollups count, see `server.crud.crud_sales_rollup`
+COMPLETED_ORDERS = """
+    SELECT id, shop_id, order_info, total, coalesce(completed_at, created_at) AS moment
+    FROM orders
+    WHERE status = 'complete'
+      AND shop_id IS NOT NULL
+      AND table_id IS DISTINCT FROM '0999fbcd-a72b-4cc2-abbe-41ccd466cdaf'
+"""
+
+ORDER_ITEMS = f"""
+    SELECT o.id, o.shop_id, o.total, o.moment, item,
+           coalesce((item->>'quantity')::int, 0) AS quantity,
+           coalesce((item->>'quantity')::int, 0) * CASE item->>'description'
+               WHEN '0,5 gram' THEN 0.5 WHEN '1 gram' THEN 1 WHEN '2,5 gram' THEN 2.5
+               WHEN '5 gram' THEN 5 WHEN 'joint' THEN 0.4 ELSE 0
+           END AS grams
+    FROM ({COMPLETED_ORDERS}) o
+    CROSS JOIN LATERAL json_array_elements(
+        CASE WHEN json_typeof(o.order_info) = 'array' THEN o.order_info ELSE '[]'::json END
+    ) AS item
+"""
+
+
+def upgrade() -> None:
+    op.create_table(
+        "shop_sales_rollups",
+        sa.Column("shop_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("hour", sa.DateTime(), nullable=False),
+        sa.Column("orders", sa.Integer(), nullable=False),
+        sa.Column("revenue", sa.Float(), nullable=False),
+        sa.Column("grams", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["shop_id"], ["shops.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("shop_id", "hour"),
+    )
+    op.create_table(
+        "shop_product_sales_rollups",
+        sa.Column("shop_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("item_id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("name", sa.String(length=255), nullable=True),
+        sa.Column("quantity", sa.Integer(), nullable=False),
+        sa.Column("revenue", sa.Float(), nullable=False),
+        sa.Column("grams", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["shop_id"], ["shops.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("shop_id", "day", "item_id"),
+    )
+
+    # Backfill from the existing orders
+    op.execute(
+        f"""
+        INSERT INTO shop_sales_rollups (shop_id, hour, orders, revenue, grams)
+        SELECT o.shop_id, date_trunc('hour', o.moment), count(*), coalesce(sum(o.total), 0),
+               coalesce(sum(g.grams), 0)
+        FROM ({COMPLETED_ORDERS}) o
+        LEFT JOIN (SELECT id, sum(grams) AS grams FROM ({ORDER_ITEMS}) i GROUP BY id) g ON g.id = o.id
+        GROUP BY o.shop_id, date_trunc('hour', o.moment)
+        """
+    )
+    # The days in the same timezone as the live updates
+    op.execute(
+        sa.text(
+            f"""
+            INSERT INTO shop_product_sales_rollups (shop_id, day, item_id, name, quantity, revenue, grams)
+            SELECT shop_id,
+                   (moment AT TIME ZONE 'UTC' AT TIME ZONE :timezone)::date,
+                   coalesce(item->>'kind_id', item->>'product_id')::uuid,
+                   max(coalesce(item->>'kind_name', item->>'product_name')),
+                   sum(quantity),
+                   sum(coalesce((item->>'price')::float, 0) * quantity),
+                   sum(grams)
+            FROM ({ORDER_ITEMS}) i
+            WHERE coalesce(item->>'kind_id', item->>'product_id') IS NOT NULL
+            GROUP BY 1, 2, 3
+            """
+        ).bindparams(timezone=app_settings.SHOP_TIMEZONE)
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("shop_product_sales_rollups")
+    op.drop_table("shop_sales_rollups")
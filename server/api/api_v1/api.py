@@ -36,6 +36,7 @@ from server.api.api_v1.endpoints import (  # forms,
     prices,
     product_images,
     products,
+    search,
     shop_groups,
     shops,
     shops_to_prices,
@@ -95,6 +96,9 @@ api_router.include_router(
 # )
 api_router.include_router(products.router, prefix="/products", tags=["products"])
 api_router.include_router(kinds.router, prefix="/kinds", tags=["kinds"])
+api_router.include_router(
+    search.router, prefix="/search", tags=["search"], dependencies=[Depends(deps.get_current_active_employee)]
+)
 api_router.include_router(
     kinds_to_flavors.router,
     prefix="/kinds-to-flavors",
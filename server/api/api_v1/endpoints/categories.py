@@ -44,7 +44,11 @@ router = APIRouter()
 @router.get("/", response_model=List[CategoryWithNames])
 def get_multi(response: Response, common: dict = Depends(common_parameters)) -> List[CategorySchema]:
     categories, header_range = category_crud.get_multi(
-        skip=common["skip"], limit=common["limit"], filter_parameters=common["filter"], sort_parameters=common["sort"]
+        skip=common["skip"],
+        limit=common["limit"],
+        filter_parameters=common["filter"],
+        sort_parameters=common["sort"],
+        count_mode=common["count"],
     )
     for category in categories:
         category.main_category_name = category.main_category.name if category.main_category else "Unknown"
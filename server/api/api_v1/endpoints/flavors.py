@@ -33,7 +33,11 @@ router = APIRouter()
 @router.get("/", response_model=List[FlavorSchema])
 def get_multi(response: Response, common: dict = Depends(common_parameters)) -> List[FlavorSchema]:
     flavors, header_range = flavor_crud.get_multi(
-        skip=common["skip"], limit=common["limit"], filter_parameters=common["filter"], sort_parameters=common["sort"]
+        skip=common["skip"],
+        limit=common["limit"],
+        filter_parameters=common["filter"],
+        sort_parameters=common["sort"],
+        count_mode=common["count"],
     )
     response.headers["Content-Range"] = header_range
     return flavors
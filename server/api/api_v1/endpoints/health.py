@@ -12,6 +12,7 @@
 # limitations under the License.
 
 from http import HTTPStatus
+from typing import Dict
 
 import structlog
 from sqlalchemy.exc import OperationalError
@@ -22,6 +23,7 @@ from server.crud.crud_user import user_crud
 from server.db import ProductsTable
 from server.schemas import UserCreate
 from server.settings import app_settings
+from server.utils.cache import reference_caches
 
 logger = structlog.get_logger(__name__)
 
@@ -39,6 +41,12 @@ def get_health() -> str:
     return "OK"
 
 
+@router.get("/caches", response_model=Dict[str, Dict[str, int]])
+def get_cache_stats() -> Dict[str, Dict[str, int]]:
+    """The number of entries, hits and misses of the reference caches in this worker."""
+    return {name: cache.stats() for name, cache in reference_caches.items()}
+
+
 @router.get("/ping")
 def pong():
     """
@@ -24,8 +24,11 @@ from server.api.api_v1.router_fix import APIRouter
 from server.api.deps import common_parameters
 from server.api.error_handling import raise_status
 from server.api.helpers import invalidateShopCache
+from server.crud.crud_flavor import flavor_crud
 from server.crud.crud_kind import kind_crud
 from server.crud.crud_shop_to_price import shop_to_price_crud
+from server.crud.crud_strain import strain_crud
+from server.crud.crud_tag import tag_crud
 from server.db.models import UsersTable
 from server.schemas import KindSchema
 from server.schemas.kind import (
@@ -43,17 +46,26 @@ router = APIRouter()
 
 
 def format_kind_details(kinds: List[KindSchema]) -> list[KindSchema]:
+    # The tags, flavors and strains come from the reference caches instead of a query per relation
     for kind in kinds:
-        kind.tags = [
-            {"id": tag.id, "name": f"{tag.tag.name}: {tag.amount}", "amount": tag.amount} for tag in kind.kind_to_tags
-        ]
+        kind.tags = []
+        for kind_to_tag in kind.kind_to_tags:
+            tag = tag_crud.get(kind_to_tag.tag_id)
+            kind.tags.append(
+                {"id": kind_to_tag.id, "name": f"{tag.name}: {kind_to_tag.amount}", "amount": kind_to_tag.amount}
+            )
         kind.tags_amount = len(kind.tags)
-        kind.flavors = [
-            {"id": flavor.id, "name": flavor.flavor.name, "icon": flavor.flavor.icon, "color": flavor.flavor.color}
-            for flavor in kind.kind_to_flavors
-        ]
+        kind.flavors = []
+        for kind_to_flavor in kind.kind_to_flavors:
+            flavor = flavor_crud.get(kind_to_flavor.flavor_id)
+            kind.flavors.append(
+                {"id": kind_to_flavor.id, "name": flavor.name, "icon": flavor.icon, "color": flavor.color}
+            )
         kind.flavors_amount = len(kind.flavors)
-        kind.strains = [{"id": strain.id, "name": f"{strain.strain.name}"} for strain in kind.kind_to_strains]
+        kind.strains = [
+            {"id": kind_to_strain.id, "name": f"{strain_crud.get(kind_to_strain.strain_id).name}"}
+            for kind_to_strain in kind.kind_to_strains
+        ]
         kind.strains_amount = len(kind.strains)
         kind.images_amount = 0
         for i in [1, 2, 3, 4, 5, 6]:
@@ -77,6 +89,7 @@ def get_multi(
         limit=common["limit"],
         filter_parameters=common["filter"],
         sort_parameters=common["sort"],
+        count_mode=common["count"],
         shop_group_id=shop_group_id,
     )
     format_kind_details(kinds_by_shop_group)
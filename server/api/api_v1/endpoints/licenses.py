@@ -36,7 +36,11 @@ def get_multi(
     current_user: UsersTable = Depends(deps.get_current_active_superuser),
 ) -> List[LicenseSchema]:
     licenses, header_range = license_crud.get_multi(
-        skip=common["skip"], limit=common["limit"], filter_parameters=common["filter"], sort_parameters=common["sort"]
+        skip=common["skip"],
+        limit=common["limit"],
+        filter_parameters=common["filter"],
+        sort_parameters=common["sort"],
+        count_mode=common["count"],
     )
     response.headers["Content-Range"] = header_range
     return licenses
@@ -38,7 +38,11 @@ router = APIRouter()
 @router.get("/", response_model=List[MainCategoryWithNames])
 def get_multi(response: Response, common: dict = Depends(common_parameters)) -> List[MainCategorySchema]:
     main_categories, header_range = main_category_crud.get_multi(
-        skip=common["skip"], limit=common["limit"], filter_parameters=common["filter"], sort_parameters=common["sort"]
+        skip=common["skip"],
+        limit=common["limit"],
+        filter_parameters=common["filter"],
+        sort_parameters=common["sort"],
+        count_mode=common["count"],
     )
     for main_category in main_categories:
         main_category.shop_name = main_category.shop.name
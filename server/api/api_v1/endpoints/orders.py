@@ -10,91 +10,114 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import asyncio
 from datetime import datetime
 from http import HTTPStatus
-from operator import or_
-from typing import Any, List, Optional
+from time import monotonic
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
 from uuid import UUID
 
 import structlog
-from fastapi import HTTPException, Request
-from fastapi.param_functions import Body, Depends
-from starlette.responses import Response
+from fastapi import BackgroundTasks, HTTPException, Request
+from fastapi.param_functions import Body, Depends, Query
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response, StreamingResponse
 
 from server.api import deps
 from server.api.api_v1.router_fix import APIRouter
 from server.api.deps import common_parameters
 from server.api.error_handling import raise_status
-from server.api.helpers import _query_with_filters, invalidateCompletedOrdersCache, invalidatePendingOrdersCache
+from server.api.helpers import _query_with_filters
 from server.api.utils import is_ip_allowed, is_user_allowed_in_shop, raise_on_user_is_allowed, validate_uuid4
-from server.crud.crud_order import order_crud
+from server.crud.crud_order import GRAMS_PER_DESCRIPTION, TEST_TABLE_ID, order_crud
 from server.crud.crud_shop import shop_crud
-from server.crud.crud_shop_to_price import shop_to_price_crud
-from server.db.models import Order, UsersTable
-from server.schemas.order import OrderBase, OrderCreate, OrderCreated, OrderSchema, OrderUpdate, OrderUpdated
+from server.crud.crud_shop_to_price import AvailabilityIndex, shop_to_price_crud
+from server.crud.pagination import NEXT_CURSOR_HEADER
+from server.db import db
+from server.db.models import Order, Shop, UsersTable
+from server.schemas.order import (
+    OrderBase,
+    OrderBatchCreate,
+    OrderBatchCreated,
+    OrderBatchResult,
+    OrderCreate,
+    OrderCreated,
+    OrderSchema,
+    OrderUpdate,
+    OrderUpdated,
+)
+from server.settings import app_settings
+from server.utils.cache import shop_availability_cache
+from server.utils.json import json_dumps_response
+from server.utils.order_events import order_events
+from server.utils.outbox import deliver_outbox
 
 logger = structlog.get_logger(__name__)
 
 router = APIRouter()
 
+MAX_BATCH_ORDERS = 100
+# Order ids per status check; one query whatever the number
+MAX_CHECK_ORDERS = 50
+
+COMPLETED_STATUSES = ("complete", "cancelled")
+# The order of the shop listings without a `sort`: the partitions of `orders` have no natural order
+DEFAULT_LISTING_SORT = ["created_at:ASC"]
+
+# Reconnect delay for the clients of the order event streams
+ORDER_EVENTS_RETRY_MS = 1000
+
 
 def get_price_rules_total(order_items):
     """Calculate the total number of grams."""
-    JOINT = 0.4
-
-    # Todo: add correct order line for 0.5 and 2.5
-    prices = {"0,5 gram": 0.5, "1 gram": 1, "2,5 gram": 2.5, "5 gram": 5, "joint": JOINT}
     total = 0
     for item in order_items:
-        if item.description in prices:
-            total = total + (prices[item.description] * item.quantity)
+        if item.description in GRAMS_PER_DESCRIPTION:
+            total = total + (GRAMS_PER_DESCRIPTION[item.description] * item.quantity)
 
     return total
 
 
-def get_first_unavailable_product_name(order_items, shop_id):
+# Unit of a kind per order item description; kind order items with another description only need an active kind
+KIND_UNIT_DESCRIPTIONS = {
+    "0,5 gram": "half",
+    "1 gram": "one",
+    "2,5 gram": "two_five",
+    "5 gram": "five",
+    "1 joint": "joint",
+}
+
+
+def get_shop_availability(shop: Shop) -> AvailabilityIndex:
+    if app_settings.SHOP_CACHE_ENABLED:
+        availability = shop_availability_cache.get(shop.id, None, shop.modified_at)
+        if availability is not None:
+            return availability
+    availability = shop_to_price_crud.get_availability_by_shop_id(shop_id=shop.id)
+    if app_settings.SHOP_CACHE_ENABLED:
+        shop_availability_cache.set(shop.id, None, shop.modified_at, availability)
+    return availability
+
+
+def get_first_unavailable_product_name(order_items, shop: Shop):
     """Search for the first unavailable product and return it's name."""
-    products = shop_to_price_crud.get_products_with_prices_by_shop_id(shop_id=shop_id)
+    availability = get_shop_availability(shop)
 
     for item in order_items:
-        found_product = False  # Start False
-        for product in products:
-            if item.kind_id == str(product.kind_id):
-                if product.active:
-                    if item.description == "0,5 gram" and (not product.use_half or not product.price.half):
-                        logger.warning("Product is currently not available in 0.5 gram", kind_name=item.kind_name)
-                    elif item.description == "1 gram" and (not product.use_one or not product.price.one):
-                        logger.warning("Product is currently not available in 1 gram", kind_name=item.kind_name)
-                    elif item.description == "2,5 gram" and (not product.use_two_five or not product.price.two_five):
-                        logger.warning("Product is currently not available in 2.5 gram", kind_name=item.kind_name)
-                    elif item.description == "5 gram" and (not product.use_five or not product.price.five):
-                        logger.warning("Product is currently not available in 5 gram", kind_name=item.kind_name)
-                    elif item.description == "1 joint" and (not product.use_joint or not product.price.joint):
-                        logger.warning("Product is currently not available as joint", kind_name=item.kind_name)
-                    else:
-                        logger.info(
-                            "Found product in order item and in available products",
-                            kind_id=item.kind_id,
-                            kind_name=item.kind_name,
-                        )
-                        found_product = True
-                else:
-                    logger.warning("Product is currently not available", kind_name=item.kind_name)
-            if item.product_id == str(product.product_id):
-                if product.active:
-                    if not product.use_piece or not product.price.piece:
-                        logger.warning("Product is currently not available as piece", product_name=item.product_name)
-                    else:
-                        logger.info(
-                            "Found horeca product in order item and in available products",
-                            product_id=item.product_id,
-                            product_name=item.product_name,
-                        )
-                        found_product = True
-                else:
-                    logger.warning("Horeca product is currently not available", product_name=item.product_name)
-        if not found_product:
-            return item.kind_name if item.kind_name else item.product_name
+        kind_units = availability["kinds"].get(item.kind_id)
+        if kind_units is not None:
+            unit = KIND_UNIT_DESCRIPTIONS.get(item.description)
+            if unit is None or unit in kind_units:
+                continue
+        if "piece" in availability["products"].get(item.product_id, ()):
+            continue
+        logger.warning(
+            "Product is currently not available",
+            kind_name=item.kind_name,
+            product_name=item.product_name,
+            description=item.description,
+        )
+        return item.kind_name if item.kind_name else item.product_name
     return None
 
 
@@ -105,13 +128,13 @@ def get_multi(
     current_user: UsersTable = Depends(deps.get_current_active_superuser),
 ) -> List[OrderSchema]:
     orders, header_range = order_crud.get_multi(
-        skip=common["skip"], limit=common["limit"], filter_parameters=common["filter"], sort_parameters=common["sort"]
+        query_parameter=order_crud.listing_query(),
+        skip=common["skip"],
+        limit=common["limit"],
+        filter_parameters=common["filter"],
+        sort_parameters=common["sort"],
+        count_mode=common["count"],
     )
-    for order in orders:
-        if (order.status == "complete" or order.status == "cancelled") and order.completed_by:
-            order.completed_by_name = order.user.first_name
-        if order.table_id:
-            order.table_name = order.table.name
     response.headers["Content-Range"] = header_range
     return orders
 
@@ -125,18 +148,97 @@ def show_all_pending_orders_per_shop(
 ) -> List[OrderSchema]:
     raise_on_user_is_allowed(is_user_allowed_in_shop(user=current_user, shop_id=shop_id))
 
-    query = Order.query.filter(Order.shop_id == shop_id).filter(Order.status == "pending")
+    query = order_crud.listing_query().filter(Order.shop_id == shop_id, Order.status == "pending")
     orders, header_range = order_crud.get_multi(
         query_parameter=query,
         skip=common["skip"],
         limit=common["limit"],
         filter_parameters=common["filter"],
-        sort_parameters=common["sort"],
+        sort_parameters=common["sort"] or DEFAULT_LISTING_SORT,
+        count_mode=common["count"],
     )
     response.headers["Content-Range"] = header_range
     return orders
 
 
+def load_shop_orders(shop_id: UUID, order_ids: Optional[Set[UUID]] = None) -> List[Dict[str, Any]]:
+    """The given orders of a shop, or all its pending orders; in a database scope of its own."""
+    with db.database_scope():
+        query = order_crud.listing_query().filter(Order.shop_id == shop_id)
+        if order_ids is None:
+            query = query.filter(Order.status == "pending")
+        else:
+            query = query.filter(Order.id.in_(order_ids))
+        return [OrderSchema.from_orm(order).dict() for order in query.order_by(Order.created_at)]
+
+
+def server_sent_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json_dumps_response(data)}\n\n"
+
+
+async def pending_order_events(shop_id: UUID, timeout: int) -> AsyncIterator[str]:
+    subscription = order_events.subscribe(shop_id)
+    try:
+        deadline = monotonic() + timeout
+        # Subscribed before the snapshot is read: changes in between are sent twice rather than not at all
+        orders = await run_in_threadpool(load_shop_orders, shop_id)
+        pending_ids = {order["id"] for order in orders}
+        yield f"retry: {ORDER_EVENTS_RETRY_MS}\n" + server_sent_event("snapshot", orders)
+
+        while True:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            try:
+                order_id = await asyncio.wait_for(
+                    subscription.queue.get(), min(remaining, app_settings.ORDER_EVENTS_KEEPALIVE)
+                )
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            order_ids = {order_id}
+            while not subscription.queue.empty():
+                order_ids.add(subscription.queue.get_nowait())
+
+            orders = await run_in_threadpool(load_shop_orders, shop_id, order_ids)
+            for order in orders:
+                if order["status"] == "pending":
+                    pending_ids.add(order["id"])
+                    yield server_sent_event("order", order)
+                elif order["id"] in pending_ids:
+                    pending_ids.discard(order["id"])
+                    yield server_sent_event("removed", {"id": order["id"]})
+            # Deleted orders
+            for order_id in (order_ids & pending_ids) - {order["id"] for order in orders}:
+                pending_ids.discard(order_id)
+                yield server_sent_event("removed", {"id": order_id})
+    finally:
+        order_events.unsubscribe(subscription)
+
+
+@router.get("/shop/{shop_id}/pending/events", response_class=StreamingResponse)
+def stream_pending_orders_per_shop(
+    shop_id: UUID,
+    timeout: int = Query(None, ge=1, description="Seconds after which the stream ends, defaults to the server setting"),
+    current_user: UsersTable = Depends(deps.get_current_active_table_moderator),
+) -> StreamingResponse:
+    """Server-Sent Events with the pending orders of a shop, to replace polling `/shop/{shop_id}/pending`.
+
+    The stream starts with a `snapshot` event with all pending orders. Then it sends an `order` event for every new or
+    changed pending order and a `removed` event (`{"id": ...}`) when an order is no longer pending. The stream ends
+    after `timeout` seconds; EventSource clients reconnect by themselves and get a new snapshot. The user is
+    authorized once per stream, with the `Authorization` header like the other endpoints.
+    """
+    raise_on_user_is_allowed(is_user_allowed_in_shop(user=current_user, shop_id=shop_id))
+    timeout = min(timeout or app_settings.ORDER_EVENTS_TIMEOUT, app_settings.ORDER_EVENTS_TIMEOUT)
+    return StreamingResponse(
+        pending_order_events(shop_id, timeout),
+        media_type="text/event-stream",
+        # No buffering in proxies
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.get("/shop/{shop_id}/complete", response_model=List[OrderSchema])
 def show_all_complete_orders_per_shop(
     shop_id: UUID,
@@ -144,26 +246,32 @@ def show_all_complete_orders_per_shop(
     common: dict = Depends(common_parameters),
     current_user: UsersTable = Depends(deps.get_current_active_table_moderator),
 ) -> List[OrderSchema]:
-    raise_on_user_is_allowed(is_user_allowed_in_shop(user=current_user, shop_id=shop_id))
+    """The completed and cancelled orders of a shop
 
-    query = Order.query.filter(Order.shop_id == shop_id).filter(
-        or_(Order.status == "complete", Order.status == "cancelled")
-    )
-    orders, header_range = order_crud.get_multi(
-        query_parameter=query,
-        skip=common["skip"],
-        limit=common["limit"],
-        filter_parameters=common["filter"],
-        sort_parameters=common["sort"],
-    )
-
-    for order in orders:
-        if (order.status == "complete" or order.status == "cancelled") and order.completed_by:
-            order.completed_by_name = order.user.first_name
-        if order.table_id:
-            order.table_name = order.table.name
+    With a `cursor` and no `filter` or `sort`, the pages are newest first, served by the order history index.
+    """
+    raise_on_user_is_allowed(is_user_allowed_in_shop(user=current_user, shop_id=shop_id))
 
-    response.headers["Content-Range"] = header_range
+    if common["cursor"] is not None and not common["filter"] and not common["sort"]:
+        try:
+            orders, next_cursor = order_crud.get_page_by_shop_id(
+                shop_id=shop_id, statuses=COMPLETED_STATUSES, limit=common["limit"] or 100, cursor=common["cursor"]
+            )
+        except ValueError as e:
+            raise_status(HTTPStatus.BAD_REQUEST, str(e))
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    else:
+        query = order_crud.listing_query().filter(Order.shop_id == shop_id, Order.status.in_(COMPLETED_STATUSES))
+        orders, header_range = order_crud.get_multi(
+            query_parameter=query,
+            skip=common["skip"],
+            limit=common["limit"],
+            filter_parameters=common["filter"],
+            sort_parameters=common["sort"] or DEFAULT_LISTING_SORT,
+            count_mode=common["count"],
+        )
+        response.headers["Content-Range"] = header_range
     return orders
 
 
@@ -179,6 +287,10 @@ def get_by_id(id: UUID, current_user: UsersTable = Depends(deps.get_current_acti
 def check(
     ids: str,
 ) -> List[OrderCreated]:
+    """Status of orders of one shop, polled by customers waiting for their orders
+
+    `ids` is a comma separated list of at most `MAX_CHECK_ORDERS` order ids; unknown ids are left out.
+    """
     id_list = ids.split(",")
 
     # Validate input
@@ -186,74 +298,48 @@ def check(
         if not validate_uuid4(id):
             raise_status(HTTPStatus.BAD_REQUEST, f"ID {index + 1} is not valid")
 
-    if len(id_list) > 10:
-        raise_status(HTTPStatus.BAD_REQUEST, "Max 10 orders")
-
-    # Build response
-    items = []
-    items_with_schema = []
-    for id in id_list:
-        # item = load(Order, id, allow_404=True) #the old
-        item = order_crud.get(id)
-        if item:
-            item.table_name = item.table.name
-            items.append(item)
-
-    for item in items:
-        if item.shop_id != items[0].shop_id:
-            raise_status(HTTPStatus.BAD_REQUEST, "All ID's should belong to one shop")
-        else:
-            checked_order = OrderCreated(
-                table_id=item.table_id,
-                total=item.total,
-                customer_order_id=item.customer_order_id,
-                status=item.status,
-                id=item.id,
-                created_at=item.created_at,
-                completed_at=item.completed_at,
-                table_name=item.table.name,
-            )
-            items_with_schema.append(checked_order)
+    if len(id_list) > MAX_CHECK_ORDERS:
+        raise_status(HTTPStatus.BAD_REQUEST, f"Max {MAX_CHECK_ORDERS} orders")
 
-    return items_with_schema
+    rows = {row.id: row for row in order_crud.get_status_rows(ids=[UUID(id) for id in id_list])}
+    if len({row.shop_id for row in rows.values()}) > 1:
+        raise_status(HTTPStatus.BAD_REQUEST, "All ID's should belong to one shop")
 
+    # In the order of the request
+    found = [rows[UUID(id)] for id in id_list if UUID(id) in rows]
+    return [OrderCreated(**row._asdict()) for row in found]
 
-@router.post("/", response_model=OrderCreated, status_code=HTTPStatus.CREATED)
-def create(request: Request, data: OrderCreate = Body(...)) -> OrderCreated:
-    logger.info("Saving order", data=data)
-
-    if data.customer_order_id:
-        del data.customer_order_id
-    shop_id = data.shop_id
-    shop = shop_crud.get(str(shop_id))
-    if not shop:
-        raise_status(HTTPStatus.NOT_FOUND, f"Shop with id {shop_id} not found")
 
-    if not is_ip_allowed(request, shop) and str(data.table_id) != "0999fbcd-a72b-4cc2-abbe-41ccd466cdaf":
+def get_order_error(data: OrderCreate, shop: Shop, ip_allowed: bool) -> Optional[str]:
+    """Validate a new order; returns the reason to refuse it, if any."""
+    if not ip_allowed and str(data.table_id) != TEST_TABLE_ID:
         # allow test table to bypass IP check if any
-        raise_status(HTTPStatus.BAD_REQUEST, "NOT_ON_SHOP_WIFI")
+        return "NOT_ON_SHOP_WIFI"
 
     # 5 gram check
     total_cannabis = get_price_rules_total(data.order_info)
     logger.info("Checked order weight", weight=total_cannabis)
     if total_cannabis > 5:
-        raise_status(HTTPStatus.BAD_REQUEST, "MAX_5_GRAMS_ALLOWED")
+        return "MAX_5_GRAMS_ALLOWED"
 
     # Availability check
-    unavailable_product_name = get_first_unavailable_product_name(data.order_info, data.shop_id)
+    unavailable_product_name = get_first_unavailable_product_name(data.order_info, shop)
     if unavailable_product_name:
-        raise_status(HTTPStatus.BAD_REQUEST, f"{unavailable_product_name}, OUT_OF_STOCK")
+        return f"{unavailable_product_name}, OUT_OF_STOCK"
+    return None
+
 
-    data.customer_order_id = order_crud.get_newest_order_id(shop_id=shop_id)
+def prepare_order(data: OrderCreate) -> None:
+    data.customer_order_id = order_crud.next_customer_order_id(shop_id=data.shop_id)
     data.status = "pending"
-    if str(data.table_id) == "0999fbcd-a72b-4cc2-abbe-41ccd466cdaf":
+    if str(data.table_id) == TEST_TABLE_ID:
         # Test table -> flag it complete
         data.status = "complete"
         data.completed_at = datetime.utcnow()
 
-    order = order_crud.create(obj_in=data)
 
-    created_order = OrderCreated(
+def to_order_created(order: Order) -> OrderCreated:
+    return OrderCreated(
         table_id=order.table_id,
         total=order.total,
         customer_order_id=order.customer_order_id,
@@ -263,17 +349,75 @@ def create(request: Request, data: OrderCreate = Body(...)) -> OrderCreated:
         completed_at=order.completed_at,
         table_name=None,
     )
-    if str(data.table_id) == "0999fbcd-a72b-4cc2-abbe-41ccd466cdaf":
-        # Test table -> invalidate completed orders
-        invalidateCompletedOrdersCache(created_order.id)
-    else:
-        invalidatePendingOrdersCache(created_order.id)
-    return created_order
+
+
+@router.post("/", response_model=OrderCreated, status_code=HTTPStatus.CREATED)
+def create(request: Request, background_tasks: BackgroundTasks, data: OrderCreate = Body(...)) -> OrderCreated:
+    logger.info("Saving order", data=data)
+
+    if data.customer_order_id:
+        del data.customer_order_id
+    shop_id = data.shop_id
+    shop = shop_crud.get(str(shop_id))
+    if not shop:
+        raise_status(HTTPStatus.NOT_FOUND, f"Shop with id {shop_id} not found")
+
+    error = get_order_error(data, shop, is_ip_allowed(request, shop))
+    if error:
+        raise_status(HTTPStatus.BAD_REQUEST, error)
+
+    prepare_order(data)
+    order = order_crud.create(obj_in=data)
+
+    # The notifications were queued in the outbox with the order
+    background_tasks.add_task(deliver_outbox)
+    return to_order_created(order)
+
+
+@router.post("/batch", response_model=OrderBatchCreated, status_code=HTTPStatus.CREATED)
+def create_batch(
+    request: Request, background_tasks: BackgroundTasks, data: OrderBatchCreate = Body(...)
+) -> OrderBatchCreated:
+    """Create the orders a kiosk queued while it was offline.
+
+    The orders are validated like with `POST /orders`; the valid ones are created in one transaction. The result of
+    each order, in the order of the request, tells whether it was created or why it was refused.
+    """
+    logger.info("Saving order batch", shop_id=data.shop_id, orders=len(data.orders))
+    if len(data.orders) > MAX_BATCH_ORDERS:
+        raise_status(HTTPStatus.BAD_REQUEST, f"A batch can have at most {MAX_BATCH_ORDERS} orders")
+    shop = shop_crud.get(str(data.shop_id))
+    if not shop:
+        raise_status(HTTPStatus.NOT_FOUND, f"Shop with id {data.shop_id} not found")
+    ip_allowed = is_ip_allowed(request, shop)
+
+    results = []
+    accepted = []
+    for index, item in enumerate(data.orders):
+        order_in = OrderCreate(shop_id=data.shop_id, **item.dict(exclude={"customer_order_id", "client_reference"}))
+        result = OrderBatchResult(index=index, client_reference=item.client_reference)
+        result.error = get_order_error(order_in, shop, ip_allowed)
+        if not result.error:
+            prepare_order(order_in)
+            accepted.append((result, order_in))
+        results.append(result)
+
+    orders = order_crud.create_many(objs_in=[order_in for _, order_in in accepted]) if accepted else []
+    for (result, _), order in zip(accepted, orders):
+        result.order = to_order_created(order)
+
+    # The outbox coalesces the notifications of the batch
+    background_tasks.add_task(deliver_outbox)
+    return OrderBatchCreated(shop_id=data.shop_id, results=results)
 
 
 @router.patch("/{order_id}", response_model=OrderUpdated, status_code=HTTPStatus.CREATED)
 def patch(
-    *, order_id: UUID, item_in: OrderBase, current_user: UsersTable = Depends(deps.get_current_active_user)
+    *,
+    order_id: UUID,
+    item_in: OrderBase,
+    background_tasks: BackgroundTasks,
+    current_user: UsersTable = Depends(deps.get_current_active_user),
 ) -> OrderUpdated:
     order = order_crud.get(order_id)
     if not order:
@@ -304,13 +448,17 @@ def patch(
         order_info=order.order_info,
         id=order.id,
     )
-    invalidateCompletedOrdersCache(updated_order.id)
+    background_tasks.add_task(deliver_outbox)
     return updated_order
 
 
 @router.put("/{order_id}", response_model=OrderUpdated, status_code=HTTPStatus.CREATED)
 def update(
-    *, order_id: UUID, item_in: OrderUpdate, current_user: UsersTable = Depends(deps.get_current_active_superuser)
+    *,
+    order_id: UUID,
+    item_in: OrderUpdate,
+    background_tasks: BackgroundTasks,
+    current_user: UsersTable = Depends(deps.get_current_active_superuser),
 ) -> OrderUpdated:
     order = order_crud.get(order_id)
     if not order:
@@ -334,10 +482,15 @@ def update(
         order_info=order.order_info,
         id=order.id,
     )
-
+    background_tasks.add_task(deliver_outbox)
     return updated_order
 
 
 @router.delete("/{order_id}", response_model=None, status_code=HTTPStatus.NO_CONTENT)
-def delete(order_id: UUID, current_user: UsersTable = Depends(deps.get_current_active_superuser)) -> None:
-    return order_crud.delete(id=order_id)
+def delete(
+    order_id: UUID,
+    background_tasks: BackgroundTasks,
+    current_user: UsersTable = Depends(deps.get_current_active_superuser),
+) -> None:
+    order_crud.delete(id=order_id)
+    background_tasks.add_task(deliver_outbox)
@@ -43,6 +43,7 @@ def get_multi(response: Response, common: dict = Depends(common_parameters)):
         limit=common["limit"],
         filter_parameters=common["filter"],
         sort_parameters=common["sort"],
+        count_mode=common["count"],
     )
     response.headers["Content-Range"] = header_range
     return products
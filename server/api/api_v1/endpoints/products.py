@@ -61,6 +61,7 @@ def get_multi(
         limit=common["limit"],
         filter_parameters=common["filter"],
         sort_parameters=common["sort"],
+        count_mode=common["count"],
         shop_group_id=shop_group_id,
     )
     format_product_details(products_by_shop_group)
@@ -0,0 +1,37 @@
+# Copyright 2024 René Dohmen <acidjunk@gmail.com>
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from typing import List, Optional
+from uuid import UUID
+
+from fastapi.param_functions import Query
+
+from server.api.api_v1.router_fix import APIRouter
+from server.crud.crud_search import search_crud
+from server.schemas.search import SearchResult
+
+router = APIRouter()
+
+
+@router.get("/", response_model=List[SearchResult])
+def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    shop_group_id: Optional[UUID] = Query(
+        None, description="If a shop group id is not provided, only global kinds and products are searched."
+    ),
+    limit: int = Query(20, ge=1, le=100),
+) -> List[SearchResult]:
+    """Kinds and products matching all words of `q`, best match first
+
+    Words match as prefixes in the name and in the Dutch and English descriptions; matches in the name rank highest.
+    """
+    return [SearchResult(**dict(row)) for row in search_crud.search(q=q, shop_group_id=shop_group_id, limit=limit)]
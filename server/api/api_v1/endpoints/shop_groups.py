@@ -35,7 +35,11 @@ router = APIRouter()
 @router.get("/", response_model=List[ShopGroupSchema])
 def get_multi(response: Response, common: dict = Depends(common_parameters)) -> List[ShopGroupSchema]:
     shop_groups, header_range = shop_group_crud.get_multi(
-        skip=common["skip"], limit=common["limit"], filter_parameters=common["filter"], sort_parameters=common["sort"]
+        skip=common["skip"],
+        limit=common["limit"],
+        filter_parameters=common["filter"],
+        sort_parameters=common["sort"],
+        count_mode=common["count"],
     )
     response.headers["Content-Range"] = header_range
     return shop_groups
@@ -10,36 +10,83 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+from datetime import datetime, timedelta
 from http import HTTPStatus
-from typing import Any, List, Optional
+from typing import Any, Iterator, List, Optional
 from uuid import UUID
 
 import structlog
 from fastapi import HTTPException
-from fastapi.param_functions import Body, Depends
-from starlette.responses import Response
+from fastapi.param_functions import Body, Depends, Header, Query
+from more_itertools import chunked
+from starlette.responses import Response, StreamingResponse
 
 from server.api import deps
 from server.api.api_v1.router_fix import APIRouter
 from server.api.deps import common_parameters
 from server.api.error_handling import raise_status
+from server.api.utils import is_user_allowed_in_shop, raise_on_user_is_allowed
 from server.apis.v1.helpers import load
+from server.crud.crud_sales_rollup import default_period, local_day, sales_rollup_crud
 from server.crud.crud_shop import shop_crud
-from server.db.models import Category, Price, Shop, ShopToPrice, UsersTable
+from server.crud.crud_shop_group import shop_group_crud
+from server.crud.crud_shop_price_list import FULL_SYNC_CURSOR, PRICE_LIST_FIELDS, shop_price_list_crud
+from server.db.models import Shop, UsersTable
 from server.schemas.shop import (
     ShopCacheStatus,
     ShopCreate,
     ShopIp,
     ShopLastCompletedOrder,
     ShopLastPendingOrder,
+    ShopPriceListChanges,
     ShopSchema,
+    ShopStats,
+    ShopStatsPeriod,
+    ShopStatsProduct,
     ShopUpdate,
     ShopWithPrices,
 )
+from server.settings import app_settings
+from server.utils.artifacts import PRICE_LIST_VARIANTS, render_price_list
+from server.utils.cache import shop_price_list_cache
+from server.utils.compression import compress, negotiate_encoding
+from server.utils.date_utils import naive_utc
+from server.utils.json import json_dumps_response
+from server.utils.price_list_encoding import deduplicate_price_lists, negotiate_media_type
 
 router = APIRouter()
 logger = structlog.get_logger(__name__)
 
+# Rows per chunk of a streamed price list
+PRICE_LIST_STREAM_CHUNK_SIZE = 100
+# Shop ids per batch price list request
+MAX_PRICE_LIST_SHOPS = 20
+
+
+def parse_price_list_fields(fields: str) -> List[str]:
+    """Validate a comma separated `fields` projection; the `id` of the rows is always included."""
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(PRICE_LIST_FIELDS)
+    if unknown:
+        raise_status(HTTPStatus.BAD_REQUEST, f"Unknown price list fields: {', '.join(sorted(unknown))}")
+    return [field for field in PRICE_LIST_FIELDS if field == "id" or field in requested]
+
+
+def stream_price_list(shop: Shop, is_horeca: Optional[bool], fields: List[str]) -> StreamingResponse:
+    """Stream a `ShopWithPrices` document, encoding the price rows while they are read from the database."""
+    rows = shop_price_list_crud.stream_by_shop_id(shop_id=shop.id, is_horeca=is_horeca, fields=fields)
+    head = json_dumps_response({"name": shop.name, "description": shop.description, "id": shop.id})
+
+    def content() -> Iterator[str]:
+        separator = ""
+        yield f'{head[:-1]},"prices":['
+        for chunk in chunked(rows, PRICE_LIST_STREAM_CHUNK_SIZE):
+            yield separator + ",".join(json_dumps_response(row) for row in chunk)
+            separator = ","
+        yield "]}"
+
+    return StreamingResponse(content(), media_type="application/json")
+
 
 @router.get("/", response_model=List[ShopSchema])
 def get_multi(
@@ -52,6 +99,7 @@ def get_multi(
         limit=common["limit"],
         filter_parameters=common["filter"],
         sort_parameters=common["sort"],
+        count_mode=common["count"],
     )
     response.headers["Content-Range"] = header_range
     return shops
@@ -93,98 +141,167 @@ def get_last_pending_order(id: UUID) -> ShopLastPendingOrder:
     return shop
 
 
+@router.get("/prices")
+def get_price_lists(
+    ids: Optional[str] = Query(None, description="Comma separated shop ids"),
+    shop_group_id: Optional[UUID] = None,
+    is_horeca: Optional[bool] = None,
+) -> Response:
+    """List the price lists of several shops
+
+    Select the shops with `ids` or with a `shop_group_id`, at most `MAX_PRICE_LIST_SHOPS`. All rows are loaded in
+    one query; the category, kind and product fields are returned once in the `categories`, `kinds` and `products`
+    lookups instead of on every row.
+    """
+    if (ids is None) == (shop_group_id is None):
+        raise_status(HTTPStatus.BAD_REQUEST, "Provide either ids or shop_group_id")
+    if shop_group_id:
+        shop_group = shop_group_crud.get(shop_group_id)
+        if not shop_group:
+            raise_status(HTTPStatus.NOT_FOUND, f"Shop group with id {shop_group_id} not found")
+        shop_ids = list(dict.fromkeys(shop_group.shop_ids or []))
+    else:
+        try:
+            shop_ids = list(dict.fromkeys(UUID(shop_id.strip()) for shop_id in ids.split(",") if shop_id.strip()))
+        except ValueError:
+            raise_status(HTTPStatus.BAD_REQUEST, f"Invalid shop ids: {ids}")
+    if len(shop_ids) > MAX_PRICE_LIST_SHOPS:
+        raise_status(HTTPStatus.BAD_REQUEST, f"Max {MAX_PRICE_LIST_SHOPS} shops")
+
+    shops = {shop.id: shop for shop in Shop.query.filter(Shop.id.in_(shop_ids))}
+    missing = [str(shop_id) for shop_id in shop_ids if shop_id not in shops]
+    if missing:
+        raise_status(HTTPStatus.NOT_FOUND, f"Shops with ids {', '.join(missing)} not found")
+
+    price_lists = shop_price_list_crud.get_by_shop_ids(shop_ids=shop_ids, is_horeca=is_horeca)
+    document = deduplicate_price_lists(
+        [
+            {
+                "id": shop_id,
+                "name": shops[shop_id].name,
+                "description": shops[shop_id].description,
+                "prices": [{field: getattr(row, field) for field in PRICE_LIST_FIELDS} for row in price_lists[shop_id]],
+            }
+            for shop_id in shop_ids
+        ]
+    )
+    return Response(content=json_dumps_response(document), media_type="application/json")
+
+
 @router.get("/{id}", response_model=ShopWithPrices)
-def get_by_id(id: UUID, is_horeca: Optional[bool] = None):
-    """List Shop"""
+def get_by_id(
+    id: UUID,
+    is_horeca: Optional[bool] = None,
+    fields: Optional[str] = Query(
+        None, description="Comma separated price fields to return, e.g. `kind_name,one,category_name`"
+    ),
+    stream: bool = False,
+    accept: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+):
+    """List Shop
+
+    The rows come from the denormalized `shop_price_list` table. The rendered price list is cached per worker as
+    pre-serialized bytes. The cache entry is keyed on the shop's `modified_at`, which `invalidateShopCache()` bumps on
+    every change to the price list.
+
+    Besides JSON the price list is available as MessagePack and in a compact columnar layout, see
+    server/utils/price_list_encoding.py; pick one with the `Accept` header. Brotli and gzip compressed copies are
+    cached next to the snapshot.
+
+    With `stream=true` or a `fields` projection the price list bypasses the cache and is streamed row by row as JSON.
+    """
     item = load(Shop, id)
-    price_relations = None
-
-    if is_horeca:
-        price_relations = (
-            ShopToPrice.query.filter_by(shop_id=item.id)
-            .filter_by(kind_id=None)
-            .join(ShopToPrice.price)
-            .join(ShopToPrice.category)
-            .order_by(Category.name, ShopToPrice.order_number, Price.piece)
-            .all()
-        )
-    elif is_horeca is not None:
-        price_relations = (
-            ShopToPrice.query.filter_by(shop_id=item.id)
-            .filter_by(product_id=None)
-            .join(ShopToPrice.price)
-            .join(ShopToPrice.category)
-            .order_by(Category.name, Price.piece, Price.joint, Price.one, Price.five, Price.half, Price.two_five)
-            .all()
-        )
-    else:
-        price_relations = (
-            ShopToPrice.query.filter_by(shop_id=item.id)
-            .join(ShopToPrice.price)
-            .join(ShopToPrice.category)
-            .order_by(
-                Category.pricelist_column,
-                Category.pricelist_row,
-                ShopToPrice.order_number,
-                Price.piece,
-                Price.joint,
-                Price.one,
-                Price.five,
-                Price.half,
-                Price.two_five,
-            )
-            .all()
-        )
-
-    item.prices = [
-        {
-            "id": pr.id,
-            "internal_product_id": pr.price.internal_product_id,
-            "active": pr.active,
-            "new": pr.new,
-            "category_id": pr.category_id,
-            "category_name": pr.category.name,
-            "category_name_en": pr.category.name_en,
-            "category_icon": pr.category.icon,
-            "category_color": pr.category.color,
-            "category_order_number": pr.category.order_number,
-            "category_image_1": pr.category.image_1,
-            "category_image_2": pr.category.image_2,
-            "category_pricelist_column": pr.category.pricelist_column,
-            "category_pricelist_row": pr.category.pricelist_row,
-            "main_category_id": pr.category.main_category.id if pr.category.main_category else "Unknown",
-            "main_category_name": pr.category.main_category.name if pr.category.main_category else "Unknown",
-            "main_category_name_en": pr.category.main_category.name_en if pr.category.main_category else "Unknown",
-            "main_category_icon": pr.category.main_category.icon if pr.category.main_category else "Unknown",
-            "main_category_order_number": pr.category.main_category.order_number if pr.category.main_category else 0,
-            "kind_id": pr.kind_id,
-            "kind_image": pr.kind.image_1 if pr.kind_id else None,
-            "kind_name": pr.kind.name if pr.kind_id else None,
-            "strains": [dict({"name": strain.strain.name}) for strain in pr.kind.kind_to_strains] if pr.kind_id else [],
-            "kind_short_description_nl": pr.kind.short_description_nl if pr.kind_id else None,
-            "kind_short_description_en": pr.kind.short_description_en if pr.kind_id else None,
-            "kind_c": pr.kind.c if pr.kind_id else None,
-            "kind_h": pr.kind.h if pr.kind_id else None,
-            "kind_i": pr.kind.i if pr.kind_id else None,
-            "kind_s": pr.kind.s if pr.kind_id else None,
-            "product_id": pr.product_id,
-            "product_image": pr.product.image_1 if pr.product_id else None,
-            "product_name": pr.product.name if pr.product_id else None,
-            "product_short_description_nl": pr.product.short_description_nl if pr.product_id else None,
-            "product_short_description_en": pr.product.short_description_en if pr.product_id else None,
-            "half": pr.price.half if pr.use_half else None,
-            "one": pr.price.one if pr.use_one else None,
-            "two_five": pr.price.two_five if pr.use_two_five else None,
-            "five": pr.price.five if pr.use_five else None,
-            "joint": pr.price.joint if pr.use_joint else None,
-            "piece": pr.price.piece if pr.use_piece else None,
-            "created_at": pr.created_at,
-            "modified_at": pr.modified_at,
-            "order_number": pr.order_number,
-        }
-        for pr in price_relations
-    ]
-    return item
+    if stream or fields is not None:
+        return stream_price_list(item, is_horeca, parse_price_list_fields(fields or ",".join(PRICE_LIST_FIELDS)))
+
+    media_type = negotiate_media_type(accept)
+    encoding = negotiate_encoding(accept_encoding) if app_settings.COMPRESSION_ENABLED else None
+    variant = (PRICE_LIST_VARIANTS[is_horeca], media_type)
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+
+    content = None
+    if app_settings.SHOP_CACHE_ENABLED:
+        content = shop_price_list_cache.get(item.id, variant, item.modified_at, encoding)
+        if content is not None:
+            return Response(content=content, media_type=media_type, headers=headers)
+        content = shop_price_list_cache.get(item.id, variant, item.modified_at)
+
+    if content is None:
+        content = render_price_list(item, is_horeca, media_type)
+        if app_settings.SHOP_CACHE_ENABLED:
+            shop_price_list_cache.set(item.id, variant, item.modified_at, content)
+    if encoding:
+        content = compress(content, encoding, cached=app_settings.SHOP_CACHE_ENABLED)
+        if app_settings.SHOP_CACHE_ENABLED:
+            shop_price_list_cache.set(item.id, variant, item.modified_at, content, encoding)
+    return Response(content=content, media_type=media_type, headers=headers)
+
+
+@router.get("/{id}/prices/changes", response_model=ShopPriceListChanges)
+def get_price_list_changes(
+    id: UUID,
+    since: str = Query(FULL_SYNC_CURSOR, description="Cursor returned by the previous sync; 0 for a full sync"),
+) -> ShopPriceListChanges:
+    """Delta sync of a shop price list
+
+    Returns the price list rows that were added or changed after `since`, the ids of the rows that were removed and
+    the cursor to use for the next call. Apply the deletions first, then upsert the rows on their `id`.
+    """
+    item = load(Shop, id)
+    try:
+        rows, deleted, cursor = shop_price_list_crud.get_changes(shop_id=item.id, since=since)
+    except ValueError as e:
+        raise_status(HTTPStatus.BAD_REQUEST, str(e))
+    return ShopPriceListChanges(
+        cursor=cursor,
+        prices=[{field: getattr(row, field) for field in PRICE_LIST_FIELDS} for row in rows],
+        deleted=deleted,
+    )
+
+
+@router.get("/{id}/stats", response_model=ShopStats)
+def get_stats(
+    id: UUID,
+    granularity: str = Query("day", regex="^(hour|day)$"),
+    start: Optional[datetime] = Query(None, description="UTC; defaults to a day (hour) or 30 days (day) before `end`"),
+    end: Optional[datetime] = Query(None, description="UTC; defaults to now"),
+    current_user: UsersTable = Depends(deps.get_current_active_employee),
+) -> ShopStats:
+    """Orders, revenue and grams sold of the completed orders of a shop, per hour or day and per kind and product
+
+    Served from the sales rollups, which are updated on every order write. Hours are in UTC, days in the timezone of
+    the shops. Orders of the test table are not counted.
+    """
+    shop = shop_crud.get(id)
+    if not shop:
+        raise_status(HTTPStatus.NOT_FOUND, f"Shop with id {id} not found")
+    raise_on_user_is_allowed(is_user_allowed_in_shop(user=current_user, shop_id=shop.id))
+
+    default_start, end = default_period(granularity, end and naive_utc(end))
+    start = naive_utc(start) if start else default_start
+    if start >= end:
+        raise_status(HTTPStatus.BAD_REQUEST, "start should be before end")
+
+    periods = sales_rollup_crud.get_periods(shop_id=shop.id, granularity=granularity, start=start, end=end)
+    # `end` is exclusive: a period up to midnight doesn't count the sales of the next day
+    products = sales_rollup_crud.get_products(
+        shop_id=shop.id, start=local_day(start), end=local_day(end - timedelta(microseconds=1))
+    )
+    return ShopStats(
+        granularity=granularity,
+        start=start,
+        end=end,
+        periods=[
+            ShopStatsPeriod(start=row.start, orders=row.orders, revenue=row.revenue, grams=row.grams) for row in periods
+        ],
+        products=[
+            ShopStatsProduct(id=row.item_id, name=row.name, quantity=row.quantity, revenue=row.revenue, grams=row.grams)
+            for row in products
+        ],
+    )
 
 
 @router.put("/{shop_id}", response_model=ShopSchema, status_code=HTTPStatus.CREATED)
@@ -200,11 +317,13 @@ def update(
         db_obj=shop,
         obj_in=item_in,
     )
+    shop_price_list_cache.invalidate(shop.id)
     return shop
 
 
 @router.delete("/{shop_id}", response_model=None, status_code=HTTPStatus.NO_CONTENT)
 def delete(shop_id: UUID, current_user: UsersTable = Depends(deps.get_current_active_superuser)) -> None:
+    shop_price_list_cache.invalidate(shop_id)
     return shop_crud.delete(id=shop_id)
 
 
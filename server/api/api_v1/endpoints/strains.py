@@ -22,6 +22,8 @@ from starlette.responses import Response
 from server.api.api_v1.router_fix import APIRouter
 from server.api.deps import common_parameters
 from server.api.error_handling import raise_status
+from server.api.helpers import invalidateShopCache
+from server.crud.crud_shop_to_price import shop_to_price_crud
 from server.crud.crud_strain import strain_crud
 from server.forms.new_product_form import validate_strain_name
 from server.schemas.strain import StrainCreate, StrainSchema, StrainUpdate
@@ -34,7 +36,11 @@ router = APIRouter()
 @router.get("/", response_model=List[StrainSchema])
 def get_multi(response: Response, common: dict = Depends(common_parameters)) -> List[StrainSchema]:
     strains, header_range = strain_crud.get_multi(
-        skip=common["skip"], limit=common["limit"], filter_parameters=common["filter"], sort_parameters=common["sort"]
+        skip=common["skip"],
+        limit=common["limit"],
+        filter_parameters=common["filter"],
+        sort_parameters=common["sort"],
+        count_mode=common["count"],
     )
     response.headers["Content-Range"] = header_range
     return strains
@@ -85,6 +91,11 @@ def update(*, strain_id: UUID, item_in: StrainUpdate) -> Any:
         db_obj=strain,
         obj_in=item_in,
     )
+
+    # The strain names are part of the price lists
+    for shop_id in shop_to_price_crud.get_shop_ids_by_strain(strain_id=strain_id):
+        invalidateShopCache(shop_id)
+
     return strain
 
 
@@ -33,7 +33,11 @@ router = APIRouter()
 @router.get("/", response_model=List[TableSchema])
 def get_multi(response: Response, common: dict = Depends(common_parameters)) -> List[TableSchema]:
     tables, header_range = table_crud.get_multi(
-        skip=common["skip"], limit=common["limit"], filter_parameters=common["filter"], sort_parameters=common["sort"]
+        skip=common["skip"],
+        limit=common["limit"],
+        filter_parameters=common["filter"],
+        sort_parameters=common["sort"],
+        count_mode=common["count"],
     )
     response.headers["Content-Range"] = header_range
     # if any(role.name == "admin" for role in current_user.roles):
@@ -10,16 +10,18 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from typing import Dict, List, Union
+from typing import Dict, List, Optional, Union
 
 from fastapi import Depends, HTTPException, status
 from fastapi.param_functions import Query
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt
 from pydantic import ValidationError
+from starlette.responses import Response
 
 from server.crud.crud_role import role_crud
 from server.crud.crud_user import user_crud
+from server.crud.pagination import KeysetPage, keyset_page
 from server.db.models import UsersTable
 from server.settings import app_settings
 
@@ -27,6 +29,7 @@ reusable_oauth = OAuth2PasswordBearer(tokenUrl=f"/v1/login/access-token")
 
 
 async def common_parameters(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     filter: List[str] = Query(
@@ -39,8 +42,22 @@ async def common_parameters(
         description="The sort will accept parameters like `col:ASC` or `col:DESC` and will split on the `:`. "
         "If it does not find a `:` it will sort ascending on that column.",
     ),
-) -> Dict[str, Union[List[str], int]]:
-    return {"skip": skip, "limit": limit, "filter": filter, "sort": sort}
+    count: str = Query(
+        "exact",
+        regex="^(exact|estimated|none)$",
+        description="The total in the `Content-Range` header: `exact`, `estimated` (shown as `~<total>`, from the "
+        "query planner) or `none` (shown as `*`), which skips counting on large tables.",
+    ),
+    cursor: Optional[str] = Query(
+        None,
+        description="Keyset pagination instead of `skip`: pass an empty value for the first page and the "
+        "`X-Next-Cursor` header of the response for the next one, with the same `filter` and `sort`. The header is "
+        "left out on the last page.",
+    ),
+) -> Dict[str, Union[List[str], int, str, None]]:
+    # Picked up by `CRUDBase.get_multi()`
+    keyset_page.set(KeysetPage(cursor, response.headers) if cursor is not None else None)
+    return {"skip": skip, "limit": limit, "filter": filter, "sort": sort, "count": count, "cursor": cursor}
 
 
 def get_current_user(token: str = Depends(reusable_oauth)) -> UsersTable:
@@ -11,30 +11,34 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import base64
-import json
 import os
 from datetime import datetime
 from http import HTTPStatus
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from uuid import UUID
 
 import boto3 as boto3
 from fastapi import HTTPException
 from more_itertools import chunked
-from sqlalchemy import String, cast
+from sqlalchemy.inspection import inspect as sa_inspect
 from sqlalchemy.orm import Query
 from sqlalchemy.sql import expression
 from starlette.responses import Response
 from structlog import get_logger
 
 from server.api.error_handling import raise_status
-from server.crud.crud_order import order_crud
 from server.crud.crud_shop import shop_crud
+from server.crud.crud_shop_price_list import FULL_SYNC_CURSOR, PRICE_LIST_FIELDS, shop_price_list_crud
+from server.db import db
 from server.db.database import BaseModel
-from server.db.models import ShopsUsersTable
+from server.db.filters import compile_filter
+from server.db.models import Shop, ShopsUsersTable
 from server.schemas import ShopUpdate
 from server.schemas.shop_user import ShopUserSchema
 from server.settings import app_settings
+from server.utils.artifacts import publish_price_list
+from server.utils.cache import shop_availability_cache, shop_price_list_cache
+from server.utils.json import json_dumps_response
 
 logger = get_logger(__name__)
 
@@ -97,31 +101,22 @@ def _query_with_filters(
             if filter and len(filter) == 2:
                 field = filter[0]
                 value = filter[1]
-                value_as_bool = value.lower() in (
-                    "yes",
-                    "y",
-                    "ye",
-                    "true",
-                    "1",
-                    "ja",
-                    "insync",
-                )
                 if value is not None:
                     if field.endswith("_gt"):
-                        query = query.filter(model.__dict__[field[:-3]] > value)
+                        query = query.filter(compile_filter(model.__dict__[field[:-3]], f">{value}"))
                     elif field.endswith("_gte"):
-                        query = query.filter(model.__dict__[field[:-4]] >= value)
+                        query = query.filter(compile_filter(model.__dict__[field[:-4]], f">={value}"))
                     elif field.endswith("_lte"):
-                        query = query.filter(model.__dict__[field[:-4]] <= value)
+                        query = query.filter(compile_filter(model.__dict__[field[:-4]], f"<={value}"))
                     elif field.endswith("_lt"):
-                        query = query.filter(model.__dict__[field[:-3]] < value)
+                        query = query.filter(compile_filter(model.__dict__[field[:-3]], f"<{value}"))
                     elif field.endswith("_ne"):
                         query = query.filter(model.__dict__[field[:-3]] != value)
                     elif field == "tsv":
                         logger.debug("Running full-text search query.", value=value)
                         query = query.search(value)
-                    elif field in model.__dict__:
-                        query = query.filter(cast(model.__dict__[field], String).ilike("%" + value + "%"))
+                    elif field in sa_inspect(model).columns.keys():
+                        query = query.filter(compile_filter(model.__dict__[field], value))
 
     if sort is not None and len(sort) >= 2:
         for sort in chunked(sort, 2):
@@ -180,18 +175,48 @@ def name_file(column_name, record_name, image_name=""):
     return name
 
 
-def sendMessageToWebSocketServer(payload):
+def sendMessageToWebSocketServer(payload) -> bool:
+    """Send a message to the websocket clients; returns whether it was delivered."""
     try:
-        sendMessageLambda.invoke(
-            FunctionName="sendMessage", InvocationType="RequestResponse", Payload=json.dumps(payload)
+        response = sendMessageLambda.invoke(
+            FunctionName="sendMessage", InvocationType="RequestResponse", Payload=json_dumps_response(payload)
         )
-        logger.info("Sending websocket message")
     except Exception as e:
         logger.warning("Websocket exception", exception=str(e))
+        return False
+    if response.get("FunctionError"):
+        logger.warning("Websocket exception", exception=response["FunctionError"])
+        return False
+    logger.info("Sending websocket message")
+    return True
+
+
+def price_list_patch(shop: Shop) -> Dict[str, Any]:
+    """Row level changes of the price list of a shop since the last websocket push.
+
+    Clients whose local price list is at cursor `since` can apply the `patch` and move to `cursor`: first remove the
+    `deleted` rows, then upsert the `prices` on their id. Other clients (or when the patch is too large to send and
+    left out) sync with `GET /shops/{id}/prices/changes?since=<their cursor>`.
+    """
+    since = shop.price_list_version or FULL_SYNC_CURSOR
+    rows, deleted, cursor = shop_price_list_crud.get_changes(shop_id=shop.id, since=since)
+    message = {"since": since, "cursor": cursor}
+    if since != FULL_SYNC_CURSOR:
+        patch = {
+            "prices": [{field: getattr(row, field) for field in PRICE_LIST_FIELDS} for row in rows],
+            "deleted": deleted,
+        }
+        if len(json_dumps_response(patch)) <= app_settings.WEBSOCKET_PATCH_MAX_BYTES:
+            message["patch"] = patch
+    return message
 
 
 def invalidateShopCache(shop_id):
     item = shop_crud.get(shop_id)
+    # The shop_price_list rows of pending changes are rebuilt on flush
+    db.session.flush()
+    payload = {"connectionType": "shop", "shopId": str(shop_id), **price_list_patch(item)}
+    item.price_list_version = payload["cursor"]
     item_in = ShopUpdate(
         name=item.name,
         description=item.description,
@@ -200,33 +225,18 @@ def invalidateShopCache(shop_id):
         last_completed_order=item.last_completed_order,
         allowed_ips=item.allowed_ips,
     )
-    payload = {"connectionType": "shop", "shopId": str(shop_id)}
-    sendMessageToWebSocketServer(payload)
     shop_crud.update(db_obj=item, obj_in=item_in)
-
-
-def invalidateCompletedOrdersCache(order_id):
-    item = order_crud.get(order_id)
-    shop = shop_crud.get(item.shop_id)
-    shop_in = ShopUpdate(name=shop.name, description=shop.description, last_completed_order=str(order_id))
-    payload = {"connectionType": "completed_orders", "shopId": str(shop.id)}
+    # After the commit: clients that (re)fetch right away see the new price list
     sendMessageToWebSocketServer(payload)
-    try:
-        shop_crud.update(db_obj=shop, obj_in=shop_in)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error: {e}")
-
-
-def invalidatePendingOrdersCache(order_id):
-    item = order_crud.get(order_id)
-    shop = shop_crud.get(item.shop_id)
-    shop_in = ShopUpdate(name=shop.name, description=shop.description, last_pending_order=str(order_id))
-    payload = {"connectionType": "pending_orders", "shopId": str(shop.id)}
-    sendMessageToWebSocketServer(payload)
-    try:
-        return shop_crud.update(db_obj=shop, obj_in=shop_in)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error: {e}")
+    # The new `modified_at` is the content version for every worker; drop our own copy right away
+    shop_price_list_cache.invalidate(item.id)
+    shop_availability_cache.invalidate(item.id)
+    if app_settings.PRICE_LIST_ARTIFACTS_ENABLED:
+        try:
+            publish_price_list(item)
+        except Exception as e:
+            # The static files lag behind until the next invalidation, the API still serves the new price list
+            logger.warning("Publishing price list artifacts failed", shop_id=str(shop_id), exception=str(e))
 
 
 def create_presigned_url(object_name, expiration=7200):
@@ -10,20 +10,26 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from typing import Any, Generic, List, Optional, Tuple, Type, TypeVar, Union
+from http import HTTPStatus
+from typing import Any, Callable, Generic, Hashable, List, Optional, Tuple, Type, TypeVar, Union
 
 import structlog
 from fastapi.encoders import jsonable_encoder
 from more_itertools import one
 from pydantic import BaseModel
-from sqlalchemy import String, cast, or_
+from sqlalchemy import String, func, or_
 from sqlalchemy.inspection import inspect as sa_inspect
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Query, Session, make_transient_to_detached
 from sqlalchemy.sql import expression
+from sqlalchemy.util import lightweight_named_tuple
 
+from server.api.error_handling import raise_status
 from server.api.models import transform_json
+from server.crud.pagination import KeysetPage, SortKey, keyset_page, keyset_predicate
 from server.db import db
 from server.db.database import BaseModel
+from server.db.filters import compile_filter, search_predicate, text_predicate
+from server.utils.cache import ReferenceCache
 
 logger = structlog.getLogger()
 
@@ -32,23 +38,83 @@ CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
 
 
+# How `get_multi()` computes the total of the Content-Range header
+COUNT_MODES = ("exact", "estimated", "none")
+
+
 class NotFound(Exception):
     pass
 
 
+def estimate_count(query: Query) -> int:
+    """The number of rows of `query` according to the query planner, without running it."""
+    connection = db.session.connection()
+    compiled = query.order_by(None).statement.compile(dialect=connection.dialect)
+    plan = connection.execute(f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params).scalar()
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
 class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
-    def __init__(self, model: Type[ModelType]):
+    def __init__(self, model: Type[ModelType], cache: Optional[ReferenceCache] = None):
         """
         CRUD object with default methods to Create, Read, Update, Delete (CRUD).
 
         **Parameters**
         * `model`: A SQLAlchemy model class
         * `schema`: A Pydantic model (schema) class
+        * `cache`: An optional cache for reference data: `get()`, `get_all()` and the lookups of subclasses through
+          `get_cached()` read through it, `create()`, `update()` and `delete()` invalidate it
         """
         self.model = model
+        self.cache = cache
 
     def get(self, id: str) -> Optional[ModelType]:
-        return db.session.query(self.model).get(id)
+        return self.get_cached(("id", str(id)), lambda: db.session.query(self.model).get(id))
+
+    def get_all(self, **filters: Any) -> List[ModelType]:
+        """All rows of the model with the column values of `filters`."""
+        return self.get_all_cached(
+            ("all", tuple(sorted((key, str(value)) for key, value in filters.items()))),
+            lambda: db.session.query(self.model).filter_by(**filters).all(),
+        )
+
+    def get_cached(self, key: Hashable, load: Callable[[], Optional[ModelType]]) -> Optional[ModelType]:
+        """The row `load()` returns, from the cache (when the CRUD object has one) under `key`."""
+        if self.cache is None:
+            return load()
+        return self._from_snapshot(self.cache.get_or_load(key, lambda: self._snapshot(load())))
+
+    def get_all_cached(self, key: Hashable, load: Callable[[], List[ModelType]]) -> List[ModelType]:
+        """The rows `load()` returns, from the cache (when the CRUD object has one) under `key`."""
+        if self.cache is None:
+            return load()
+        snapshots = self.cache.get_or_load(key, lambda: [self._snapshot(obj) for obj in load()])
+        return [self._from_snapshot(snapshot) for snapshot in snapshots]
+
+    def _snapshot(self, obj: Optional[ModelType]) -> Optional[dict]:
+        """The column values of `obj`: cached instead of the object, which belongs to the session of one request."""
+        if obj is None:
+            return None
+        return {attr.key: getattr(obj, attr.key) for attr in sa_inspect(self.model).column_attrs}
+
+    def _from_snapshot(self, snapshot: Optional[dict]) -> Optional[ModelType]:
+        """The object of `snapshot` in the current session, without a query.
+
+        The session's own object is returned when it has one, as is: it can have changes or be fresher than the cache.
+        Comparisons like `role in user.roles` keep working.
+        """
+        if snapshot is None:
+            return None
+        obj = self.model(**snapshot)
+        make_transient_to_detached(obj)
+        existing = db.session.identity_map.get(sa_inspect(obj).key)
+        if existing is not None:
+            return existing
+        return db.session.merge(obj, load=False)
+
+    def invalidate_cache(self) -> None:
+        if self.cache is not None:
+            self.cache.invalidate()
 
     def get_multi(
         self,
@@ -58,7 +124,15 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         filter_parameters: Optional[List[str]],
         sort_parameters: Optional[List[str]],
         query_parameter: Optional[Any] = None,
+        count_mode: str = "exact",
     ) -> Tuple[List[ModelType], str]:
+        """A page of the rows of `query_parameter` (default: all rows of the model) and its Content-Range header.
+
+        The total in the header depends on `count_mode` (see `COUNT_MODES`): `exact` counts in the same statement,
+        `estimated` takes the estimate of the query planner and shows it as `~<total>`, `none` leaves it out (`*`).
+
+        When the request has a `cursor` (see `server.crud.pagination`) the page is found by keyset instead of `skip`.
+        """
         query = query_parameter
         if query is None:
             query = db.session.query(self.model)
@@ -66,60 +140,115 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         logger.debug(
             f"Filter and Sort parameters model={self.model}, sort_parameters={sort_parameters}, filter_parameters={filter_parameters}",
         )
-        conditions = []
-        # move to functions ?
         if filter_parameters:
+            columns = sa_inspect(self.model).columns
             for filter_parameter in filter_parameters:
                 key, *value = filter_parameter.split(":", 1)
 
                 # Use this branch if we detect a key value search (key:value) if it is just a single string (value)
-                # treat the key as the value
+                # search for it in the search vector of the model, or else in all text columns
                 if len(value) > 0:
-                    if key in sa_inspect(self.model).columns.keys():
-                        conditions.append(cast(self.model.__dict__[key], String).ilike("%" + one(value) + "%"))
+                    if key in columns.keys():
+                        query = query.filter(compile_filter(self.model.__dict__[key], one(value)))
                     else:
                         logger.info(f"Key: not found in database model key={key}, model={self.model}")
-                    query = query.filter(or_(*conditions))
+                elif "tsv" in columns.keys():
+                    query = query.filter(search_predicate(self.model.tsv, key))
                 else:
-                    if isinstance(value, list):
-                        logger.info("Query parameters set to GET_MANY, ID column only", value=value)
-                        conditions = []
-                        for item in value:
-                            conditions.append(self.model.__dict__["id"] == item)
-                        query = query.filter(or_(*conditions))
-                    else:
-                        for column in sa_inspect(self.model).columns.keys():
-                            conditions.append(cast(self.model.__dict__[column], String).ilike("%" + key + "%"))
-                            query = query.filter(or_(*conditions))
+                    conditions = [
+                        text_predicate(self.model.__dict__[name], key)
+                        for name, column in columns.items()
+                        if isinstance(column.type, String)
+                    ]
+                    query = query.filter(or_(*conditions))
 
+        sort_keys: List[SortKey] = []
         if sort_parameters and len(sort_parameters):
             for sort_parameter in sort_parameters:
                 try:
                     sort_col, sort_order = sort_parameter.split(":")
                     if sort_col in sa_inspect(self.model).columns.keys():
-                        if sort_order.upper() == "DESC":
-                            query = query.order_by(expression.desc(self.model.__dict__[sort_col]))
-                        else:
-                            query = query.order_by(expression.asc(self.model.__dict__[sort_col]))
+                        sort_keys.append((self.model.__dict__[sort_col], sort_order.upper() == "DESC"))
                     else:
                         logger.debug(f"Sort col does not exist sort_col={sort_col}")
                 except ValueError:
                     if sort_parameter in sa_inspect(self.model).columns.keys():
-                        query = query.order_by(expression.asc(self.model.__dict__[sort_parameter]))
+                        sort_keys.append((self.model.__dict__[sort_parameter], False))
                     else:
                         logger.debug(f"Sort param does not exist sort_parameter={sort_parameter}")
 
+        page = keyset_page.get()
+        if page is not None:
+            return self._get_keyset_page(query, sort_keys, limit, count_mode, page)
+        if sort_keys:
+            query = query.order_by(*self._ordering(sort_keys))
+
         # Generate Content Range Header Values
-        count = query.count()
+        if count_mode == "exact":
+            # The total in the same statement as the page
+            rows = self._page(query.add_columns(func.count().over()), skip, limit)
+            items = self._items(query, rows, 1)
+            # A page past the end has no rows to read the total from
+            total = str(rows[0][-1] if rows else query.order_by(None).count() if skip else 0)
+        else:
+            items = self._page(query, skip, limit)
+            total = self._total(query, count_mode)
 
         if limit:
             # Limit is not 0: use limit
-            response_range = "{}s {}-{}/{}".format(self.model.__name__.lower(), skip, skip + limit, count)
-            return query.offset(skip).limit(limit).all(), response_range
+            response_range = "{}s {}-{}/{}".format(self.model.__name__.lower(), skip, skip + limit, total)
         else:
             # Limit is 0: unlimited
-            response_range = "{}s {}/{}".format(self.model.__name__.lower(), skip, count)
-            return query.offset(skip).all(), response_range
+            response_range = "{}s {}/{}".format(self.model.__name__.lower(), skip, total)
+        return items, response_range
+
+    def _get_keyset_page(
+        self, query: Query, sort_keys: List[SortKey], limit: int, count_mode: str, page: KeysetPage
+    ) -> Tuple[List[Any], str]:
+        """The page of `query` after the cursor of `page`, in the order of the sort keys and the primary key.
+
+        The cursor of the next page goes in the headers of `page`. The Content-Range header has the total only: the
+        position of the page isn't known. An `exact` total is a separate count here.
+        """
+        keys = list(sort_keys)
+        names = {column.key for column, _ in keys}
+        keys += [(column, False) for column in sa_inspect(self.model).primary_key if column.key not in names]
+        try:
+            values = page.values(keys)
+        except ValueError as e:
+            raise_status(HTTPStatus.BAD_REQUEST, str(e))
+
+        total = str(query.order_by(None).count()) if count_mode == "exact" else self._total(query, count_mode)
+        query = query.order_by(None).order_by(*self._ordering(keys))
+        if values is not None:
+            query = query.filter(keyset_predicate(keys, values))
+        # One row more tells if there is a next page
+        rows = self._page(query.add_columns(*(column for column, _ in keys)), 0, limit + 1 if limit else 0)
+        has_next = bool(limit) and len(rows) > limit
+        rows = rows[:limit] if has_next else rows
+        page.set_next(keys, list(rows[-1][-len(keys) :]) if has_next else None)
+        return self._items(query, rows, len(keys)), "{}s */{}".format(self.model.__name__.lower(), total)
+
+    @staticmethod
+    def _ordering(keys: List[SortKey]) -> List[Any]:
+        return [expression.desc(column) if descending else expression.asc(column) for column, descending in keys]
+
+    @staticmethod
+    def _items(query: Query, rows: List[Any], extra_columns: int) -> List[Any]:
+        """The results of `query` from `rows` of it with `extra_columns` columns added."""
+        if query.is_single_entity:
+            return [row[0] for row in rows]
+        row_type = lightweight_named_tuple("result", [column["name"] for column in query.column_descriptions])
+        return [row_type(row[:-extra_columns]) for row in rows]
+
+    @staticmethod
+    def _total(query: Query, count_mode: str) -> str:
+        return f"~{estimate_count(query)}" if count_mode == "estimated" else "*"
+
+    @staticmethod
+    def _page(query: Query, skip: int, limit: int) -> List[Any]:
+        query = query.offset(skip)
+        return query.limit(limit).all() if limit else query.all()
 
     def get_multi_by_shop_group_id(
         self,
@@ -130,6 +259,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         sort_parameters: Optional[List[str]],
         shop_group_id: str,
         query_parameter: Optional[Any] = None,
+        count_mode: str = "exact",
     ) -> Tuple[List[ModelType], str]:
         query = query_parameter
         if query is None:
@@ -145,6 +275,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             filter_parameters=filter_parameters,
             sort_parameters=sort_parameters,
             query_parameter=query,
+            count_mode=count_mode,
         )
 
     def create(self, *, obj_in: CreateSchemaType) -> ModelType:
@@ -152,6 +283,7 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         db_obj = self.model(**obj_in_data)
         db.session.add(db_obj)
         db.session.commit()
+        self.invalidate_cache()
         db.session.refresh(db_obj)
         return db_obj
 
@@ -173,6 +305,8 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         # Set to false if you make two or more updates consecutively
         if commit:
             db.session.commit()
+        # Without a commit a concurrent lookup can still cache the old row until the TTL of the cache
+        self.invalidate_cache()
 
         return db_obj
 
@@ -182,4 +316,5 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             raise NotFound
         db.session.delete(obj)
         db.session.commit()
+        self.invalidate_cache()
         return None
@@ -15,11 +15,12 @@ from typing import Optional
 from server.crud.base import CRUDBase
 from server.db.models import Flavor
 from server.schemas.flavor import FlavorCreate, FlavorUpdate
+from server.utils.cache import reference_cache
 
 
 class CRUDFlavor(CRUDBase[Flavor, FlavorCreate, FlavorUpdate]):
     def get_flavor_by_name(self, *, name) -> Optional[Flavor]:
-        return Flavor.query.filter_by(name=name).first()
+        return self.get_cached(("name", name), lambda: Flavor.query.filter_by(name=name).first())
 
 
-flavor_crud = CRUDFlavor(Flavor)
+flavor_crud = CRUDFlavor(Flavor, cache=reference_cache("flavors"))
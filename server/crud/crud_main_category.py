@@ -13,10 +13,11 @@
 from server.crud.base import CRUDBase
 from server.db.models import MainCategory
 from server.schemas.main_category import MainCategoryCreate, MainCategoryUpdate
+from server.utils.cache import reference_cache
 
 
 class CRUDMainCategory(CRUDBase[MainCategory, MainCategoryCreate, MainCategoryUpdate]):
     pass
 
 
-main_category_crud = CRUDMainCategory(MainCategory)
+main_category_crud = CRUDMainCategory(MainCategory, cache=reference_cache("main_categories"))
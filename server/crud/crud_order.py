@@ -10,18 +10,124 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+from datetime import datetime
+from itertools import chain
+from typing import Any, List, Optional, Sequence, Tuple
 from uuid import UUID
 
+from sqlalchemy import Date, case, cast, event, func, literal, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Query
+
+from server.api.models import transform_json
 from server.crud.base import CRUDBase
-from server.db.models import Order
+from server.crud.pagination import decode_cursor, encode_cursor
+from server.db import db
+from server.db.database import WrappedSession
+from server.db.models import Order, OutboxMessage, ShopOrderCounter, Table, UsersTable
 from server.schemas.order import OrderCreate, OrderUpdate
-from server.utils.json import json_dumps
+from server.settings import app_settings
+from server.utils.order_events import notify_order_changes
+
+# Orders for this table are test orders: they bypass the IP check and are completed right away
+TEST_TABLE_ID = "0999fbcd-a72b-4cc2-abbe-41ccd466cdaf"
+
+# Todo: add correct order line for 0.5 and 2.5
+GRAMS_PER_DESCRIPTION = {"0,5 gram": 0.5, "1 gram": 1, "2,5 gram": 2.5, "5 gram": 5, "joint": 0.4}
+
+# Outbox topics, the `connectionType` of the websocket messages
+PENDING_ORDERS = "pending_orders"
+COMPLETED_ORDERS = "completed_orders"
+
+
+# The order of the order history of a shop, see `CRUDOrder.get_page_by_shop_id()`
+HISTORY_KEYS = ((Order.created_at, True), (Order.id, True))
 
 
 class CRUDOrder(CRUDBase[Order, OrderCreate, OrderUpdate]):
-    def get_newest_order_id(self, *, shop_id: UUID) -> int:
-        order_id = Order.query.filter_by(shop_id=str(shop_id)).count() + 1
-        return order_id
+    def next_customer_order_id(self, *, shop_id: UUID) -> int:
+        """Take the next customer order number of a shop.
+
+        The counter row stays locked until the transaction ends, so concurrent orders of a shop get consecutive numbers
+        and a rolled back order gives its number back. With `ORDER_NUMBER_DAILY_RESET` the numbers start at 1 again on
+        the first order of a new day.
+        """
+        today = func.cast(func.timezone(app_settings.SHOP_TIMEZONE, func.now()), Date)
+        counters = ShopOrderCounter.__table__
+        stmt = insert(counters).values(shop_id=shop_id, last_number=1, day=today)
+        next_number = counters.c.last_number + 1
+        if app_settings.ORDER_NUMBER_DAILY_RESET:
+            next_number = case([(counters.c.day < stmt.excluded.day, 1)], else_=next_number)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[counters.c.shop_id], set_={"last_number": next_number, "day": stmt.excluded.day}
+        ).returning(counters.c.last_number)
+        return db.session.execute(stmt).scalar()
+
+    def listing_query(self) -> Query:
+        """Orders with the names shown in the order lists, as light weight rows from one query.
+
+        The rows have the columns of `Order` plus `completed_by_name` (for completed and cancelled orders) and
+        `table_name`; `get_multi()` can filter and sort them like orders.
+        """
+        return (
+            db.session.query(
+                *Order.__table__.columns,
+                case([(Order.status.in_(("complete", "cancelled")), UsersTable.first_name)]).label("completed_by_name"),
+                Table.name.label("table_name"),
+            )
+            .outerjoin(UsersTable, Order.completed_by == UsersTable.id)
+            .outerjoin(Table, Order.table_id == Table.id)
+        )
+
+    def get_status_rows(self, *, ids: Sequence[UUID]) -> List[Any]:
+        """The status of the orders with `ids`, with their table name, as light weight rows from one query."""
+        return (
+            db.session.query(
+                Order.id,
+                Order.shop_id,
+                Order.table_id,
+                Order.total,
+                Order.customer_order_id,
+                Order.status,
+                Order.created_at,
+                Order.completed_at,
+                Table.name.label("table_name"),
+            )
+            .outerjoin(Table, Order.table_id == Table.id)
+            .filter(Order.id.in_(ids))
+            .all()
+        )
+
+    def create_many(self, *, objs_in: List[OrderCreate]) -> List[Order]:
+        """Create orders in one transaction."""
+        db_objs = [self.model(**transform_json(obj_in.dict())) for obj_in in objs_in]
+        db.session.add_all(db_objs)
+        db.session.commit()
+        for db_obj in db_objs:
+            db.session.refresh(db_obj)
+        return db_objs
+
+    def get_page_by_shop_id(
+        self, *, shop_id: UUID, statuses: Sequence[str], limit: int, cursor: Optional[str] = None
+    ) -> Tuple[List[Any], Optional[str]]:
+        """A page of the (listing) orders of a shop with one of `statuses`, newest first.
+
+        Keyset pagination on `(created_at, id)`, served by the `(shop_id, status, created_at, id)` index, so a deep
+        page costs the same as the first one. Pass the returned cursor to get the next page; it is None on the last
+        page. Raises ValueError for an invalid cursor, see `server.crud.pagination`.
+        """
+        query = self.listing_query().filter(Order.shop_id == shop_id, Order.status.in_(statuses))
+        if cursor:
+            values = decode_cursor(cursor, HISTORY_KEYS)
+            query = query.filter(
+                tuple_(Order.created_at, Order.id)
+                < tuple_(*(cast(literal(value), column.type) for (column, _), value in zip(HISTORY_KEYS, values)))
+            )
+        orders = query.order_by(Order.created_at.desc(), Order.id.desc()).limit(limit + 1).all()
+        if len(orders) > limit:
+            last = orders[limit - 1]
+            return orders[:limit], encode_cursor(HISTORY_KEYS, [last.created_at, last.id])
+        return orders, None
 
     def get_all_orders_filtered_by(self, **kwargs):
         order = Order.query.filter_by(**kwargs).all()
@@ -33,3 +139,27 @@ class CRUDOrder(CRUDBase[Order, OrderCreate, OrderUpdate]):
 
 
 order_crud = CRUDOrder(Order)
+
+
+@event.listens_for(WrappedSession, "after_flush")
+def collect_order_messages(session: WrappedSession, flush_context: Any) -> None:
+    """Queue the notifications of the orders written in this flush; see `server.utils.outbox`."""
+    messages = session.info.setdefault("order_outbox_messages", [])
+    for obj in chain(session.new, session.dirty):
+        if not isinstance(obj, Order) or not obj.shop_id or (obj in session.dirty and not session.is_modified(obj)):
+            continue
+        # A new order is pending, except for test orders that are completed right away; changed orders update the
+        # completed orders list
+        if obj in session.new and obj.status != "complete":
+            topic = PENDING_ORDERS
+        else:
+            topic = COMPLETED_ORDERS
+        messages.append({"topic": topic, "shop_id": obj.shop_id, "order_id": obj.id, "created_at": datetime.utcnow()})
+
+
+@event.listens_for(WrappedSession, "after_flush_postexec")
+def write_order_messages(session: WrappedSession, flush_context: Any) -> None:
+    messages = session.info.pop("order_outbox_messages", None)
+    if messages:
+        session.execute(OutboxMessage.__table__.insert(), messages)
+        notify_order_changes(session, ((message["shop_id"], message["order_id"]) for message in messages))
@@ -15,11 +15,12 @@ from typing import Optional
 from server.crud.base import CRUDBase
 from server.db.models import RolesTable
 from server.schemas.role import RoleCreate, RoleUpdate
+from server.utils.cache import reference_cache
 
 
 class CRUDRole(CRUDBase[RolesTable, RoleCreate, RoleUpdate]):
     def get_by_name(self, *, name: str) -> Optional[RolesTable]:
-        return RolesTable.query.filter(RolesTable.name == name).first()
+        return self.get_cached(("name", name), lambda: RolesTable.query.filter(RolesTable.name == name).first())
 
 
-role_crud = CRUDRole(RolesTable)
+role_crud = CRUDRole(RolesTable, cache=reference_cache("roles"))
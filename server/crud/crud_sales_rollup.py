@@ -0,0 +1,237 @@
+# Copyright 2024 René Dohmen <acidjunk@gmail.com>
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Sales statistics of the shops, from rollup tables that are kept up to date on every order write.
+
+The rollups hold the sum of the completed orders (test orders excluded): per hour in `shop_sales_rollups` and per
+day and kind/product in `shop_product_sales_rollups`. A flush hook adds the difference between the new and the old
+state of every written order, so completing an order adds it, cancelling or deleting a completed order takes it off
+and editing a completed order corrects it.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from itertools import chain
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+import pytz
+from sqlalchemy import Date, cast, event, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.inspection import inspect as sa_inspect
+
+from server.crud.base import CRUDBase
+from server.crud.crud_order import GRAMS_PER_DESCRIPTION, TEST_TABLE_ID
+from server.db import db
+from server.db.database import WrappedSession
+from server.db.models import Order, ShopProductSalesRollup, ShopSalesRollup
+from server.settings import app_settings
+
+# The order attributes the sales of an order are computed from
+SALES_ATTRIBUTES = ("shop_id", "table_id", "status", "order_info", "total", "created_at", "completed_at")
+
+HourKey = Tuple[UUID, datetime]
+ProductKey = Tuple[UUID, date, UUID]
+
+
+def local_day(moment: datetime) -> date:
+    """The day in the shop timezone of a (naive, UTC) moment."""
+    return pytz.utc.localize(moment).astimezone(pytz.timezone(app_settings.SHOP_TIMEZONE)).date()
+
+
+class SalesDelta:
+    """Changes to the rollups, summed per rollup row."""
+
+    def __init__(self) -> None:
+        # orders, revenue, grams
+        self.hours: Dict[HourKey, List[float]] = defaultdict(lambda: [0, 0.0, 0.0])
+        # name, quantity, revenue, grams
+        self.products: Dict[ProductKey, List[Any]] = defaultdict(lambda: [None, 0, 0.0, 0.0])
+
+    def add(self, values: Dict[str, Any], sign: int) -> None:
+        """Add (`sign` 1) or take off (`sign` -1) the sales of an order, given the values of `SALES_ATTRIBUTES`."""
+        if values["status"] != "complete" or not values["shop_id"] or str(values["table_id"]) == TEST_TABLE_ID:
+            return
+        moment = values["completed_at"] or values["created_at"] or datetime.utcnow()
+        hour = moment.replace(minute=0, second=0, microsecond=0)
+        day = local_day(moment)
+
+        grams = 0.0
+        items = values["order_info"] if isinstance(values["order_info"], list) else []
+        for item in items:
+            item_id = item.get("kind_id") or item.get("product_id")
+            quantity = item.get("quantity") or 0
+            item_grams = GRAMS_PER_DESCRIPTION.get(item.get("description"), 0) * quantity
+            grams += item_grams
+            if not item_id:
+                continue
+            product = self.products[(values["shop_id"], day, UUID(str(item_id)))]
+            product[0] = item.get("kind_name") or item.get("product_name")
+            product[1] += sign * quantity
+            product[2] += sign * (item.get("price") or 0) * quantity
+            product[3] += sign * item_grams
+
+        totals = self.hours[(values["shop_id"], hour)]
+        totals[0] += sign
+        totals[1] += sign * (values["total"] or 0)
+        totals[2] += sign * grams
+
+    def __bool__(self) -> bool:
+        return bool(self.hours or self.products)
+
+
+class CRUDSalesRollup(CRUDBase[ShopSalesRollup, ShopSalesRollup, ShopSalesRollup]):
+    def apply(self, delta: SalesDelta) -> None:
+        """Add the changes to the rollup rows, creating them when needed."""
+        hour_rows = [
+            {"shop_id": shop_id, "hour": hour, "orders": orders, "revenue": revenue, "grams": grams}
+            for (shop_id, hour), (orders, revenue, grams) in delta.hours.items()
+            if orders or revenue or grams
+        ]
+        if hour_rows:
+            table = ShopSalesRollup.__table__
+            stmt = insert(table).values(hour_rows)
+            db.session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[table.c.shop_id, table.c.hour],
+                    set_={
+                        "orders": table.c.orders + stmt.excluded.orders,
+                        "revenue": table.c.revenue + stmt.excluded.revenue,
+                        "grams": table.c.grams + stmt.excluded.grams,
+                    },
+                )
+            )
+
+        product_rows = [
+            {
+                "shop_id": shop_id,
+                "day": day,
+                "item_id": item_id,
+                "name": name,
+                "quantity": quantity,
+                "revenue": revenue,
+                "grams": grams,
+            }
+            for (shop_id, day, item_id), (name, quantity, revenue, grams) in delta.products.items()
+            if quantity or revenue or grams
+        ]
+        if product_rows:
+            table = ShopProductSalesRollup.__table__
+            stmt = insert(table).values(product_rows)
+            db.session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[table.c.shop_id, table.c.day, table.c.item_id],
+                    set_={
+                        "name": stmt.excluded.name,
+                        "quantity": table.c.quantity + stmt.excluded.quantity,
+                        "revenue": table.c.revenue + stmt.excluded.revenue,
+                        "grams": table.c.grams + stmt.excluded.grams,
+                    },
+                )
+            )
+
+    def get_periods(self, *, shop_id: UUID, granularity: str, start: datetime, end: datetime) -> List[Any]:
+        """Orders, revenue and grams per hour (UTC) or per day (shop timezone) from `start` up to `end` (UTC)."""
+        query = db.session.query(
+            ShopSalesRollup.hour.label("start"), ShopSalesRollup.orders, ShopSalesRollup.revenue, ShopSalesRollup.grams
+        )
+        if granularity == "day":
+            day = cast(func.timezone(app_settings.SHOP_TIMEZONE, func.timezone("UTC", ShopSalesRollup.hour)), Date)
+            query = db.session.query(
+                day.label("start"),
+                func.sum(ShopSalesRollup.orders).label("orders"),
+                func.sum(ShopSalesRollup.revenue).label("revenue"),
+                func.sum(ShopSalesRollup.grams).label("grams"),
+            ).group_by(day)
+        return (
+            query.filter(ShopSalesRollup.shop_id == shop_id, ShopSalesRollup.hour >= start, ShopSalesRollup.hour < end)
+            .order_by("start")
+            .all()
+        )
+
+    def get_products(self, *, shop_id: UUID, start: date, end: date) -> List[Any]:
+        """Quantity, revenue and grams per kind and product over the days from `start` up to and including `end`."""
+        return (
+            db.session.query(
+                ShopProductSalesRollup.item_id,
+                func.max(ShopProductSalesRollup.name).label("name"),
+                func.sum(ShopProductSalesRollup.quantity).label("quantity"),
+                func.sum(ShopProductSalesRollup.revenue).label("revenue"),
+                func.sum(ShopProductSalesRollup.grams).label("grams"),
+            )
+            .filter(
+                ShopProductSalesRollup.shop_id == shop_id,
+                ShopProductSalesRollup.day >= start,
+                ShopProductSalesRollup.day <= end,
+            )
+            .group_by(ShopProductSalesRollup.item_id)
+            .order_by(func.sum(ShopProductSalesRollup.revenue).desc())
+            .all()
+        )
+
+
+sales_rollup_crud = CRUDSalesRollup(ShopSalesRollup)
+
+
+def default_period(granularity: str, end: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+    """The last day for hours and the last 30 days for days."""
+    end = end or datetime.utcnow()
+    return end - (timedelta(days=1) if granularity == "hour" else timedelta(days=30)), end
+
+
+@event.listens_for(WrappedSession, "before_flush")
+def load_sales_state(session: WrappedSession, flush_context: Any, instances: Any) -> None:
+    """Read the stored state of the orders this flush changes or deletes, in one query.
+
+    The attribute history can't be used for this: attributes that were expired by a commit don't keep their old
+    value when they are set. The rows are locked until the commit: a concurrent write of the same order waits and
+    then reads the committed state, instead of taking off the same old state a second time.
+    """
+    ids = [
+        obj.id
+        for obj in chain(session.dirty, session.deleted)
+        if isinstance(obj, Order)
+        and sa_inspect(obj).persistent
+        and (obj in session.deleted or session.is_modified(obj))
+    ]
+    if ids:
+        table = Order.__table__
+        rows = session.execute(
+            select([table.c.id, *(table.c[attribute] for attribute in SALES_ATTRIBUTES)])
+            .where(table.c.id.in_(ids))
+            .with_for_update()
+        )
+        session.info.setdefault("sales_rollup_state", {}).update({row.id: dict(row) for row in rows})
+
+
+@event.listens_for(WrappedSession, "after_flush")
+def collect_sales_changes(session: WrappedSession, flush_context: Any) -> None:
+    """Compute the change to the sales rollups of the orders in this flush; applied in `after_flush_postexec`."""
+    delta = session.info.setdefault("sales_rollup_delta", SalesDelta())
+    stored = session.info.pop("sales_rollup_state", {})
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if not isinstance(obj, Order):
+            continue
+        old = stored.get(obj.id)
+        if obj in session.new:
+            delta.add({attribute: getattr(obj, attribute) for attribute in SALES_ATTRIBUTES}, 1)
+        elif old is not None and obj in session.deleted:
+            delta.add(old, -1)
+        elif old is not None:
+            delta.add(old, -1)
+            delta.add({attribute: getattr(obj, attribute) for attribute in SALES_ATTRIBUTES}, 1)
+
+
+@event.listens_for(WrappedSession, "after_flush_postexec")
+def apply_sales_changes(session: WrappedSession, flush_context: Any) -> None:
+    delta = session.info.pop("sales_rollup_delta", None)
+    if delta:
+        sales_rollup_crud.apply(delta)
@@ -0,0 +1,59 @@
+# Copyright 2024 René Dohmen <acidjunk@gmail.com>
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Ranked full-text search over the kinds and products of the catalog.
+
+Kinds and products have a `tsv` search vector with their name and their Dutch and English descriptions, kept up to
+date by a trigger and indexed with GIN (see `server.db.filters.search_tsquery()` for the query side).
+"""
+from typing import Any, List, Optional
+from uuid import UUID
+
+from sqlalchemy import desc, func, literal, or_, select, union_all
+
+from server.db import db
+from server.db.filters import search_tsquery
+from server.db.models import Kind, ProductsTable
+
+# The searched tables and the type of their results
+SEARCH_MODELS = (("kind", Kind), ("product", ProductsTable))
+
+
+class CRUDSearch:
+    def search(self, *, q: str, shop_group_id: Optional[UUID], limit: int = 20) -> List[Any]:
+        """The best matching kinds and products, shared ones and those of the shop group; best match first."""
+        tsquery = search_tsquery(q)
+        if tsquery is None:
+            return []
+        selects = []
+        for result_type, model in SEARCH_MODELS:
+            table = model.__table__
+            scope = table.c.shop_group_id.is_(None)
+            if shop_group_id is not None:
+                scope = or_(table.c.shop_group_id == shop_group_id, scope)
+            selects.append(
+                select(
+                    [
+                        literal(result_type).label("type"),
+                        table.c.id,
+                        table.c.name,
+                        table.c.short_description_nl,
+                        table.c.short_description_en,
+                        table.c.shop_group_id,
+                        func.ts_rank(table.c.tsv, tsquery).label("rank"),
+                    ]
+                ).where(table.c.tsv.op("@@")(tsquery) & scope)
+            )
+        return db.session.execute(union_all(*selects).order_by(desc("rank"), "name").limit(limit)).fetchall()
+
+
+search_crud = CRUDSearch()
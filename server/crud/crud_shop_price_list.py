@@ -0,0 +1,435 @@
+# Copyright 2024 René Dohmen <acidjunk@gmail.com>
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from collections import defaultdict
+from itertools import chain
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+import structlog
+from sqlalchemy import and_, event, or_, select, text
+from sqlalchemy.inspection import inspect as sa_inspect
+
+from server.crud.crud_shop_to_price import shop_to_price_crud
+from server.db import db
+from server.db.database import WrappedSession
+from server.db.models import (
+    Category,
+    Kind,
+    KindToStrain,
+    MainCategory,
+    Price,
+    ProductsTable,
+    ShopPriceList,
+    ShopPriceListDeletion,
+    ShopToPrice,
+    Strain,
+)
+
+logger = structlog.get_logger(__name__)
+
+# The fields of one row of a shop price list, in the order of the API response
+PRICE_LIST_FIELDS = (
+    "id",
+    "internal_product_id",
+    "active",
+    "new",
+    "category_id",
+    "category_name",
+    "category_name_en",
+    "category_icon",
+    "category_color",
+    "category_order_number",
+    "category_image_1",
+    "category_image_2",
+    "category_pricelist_column",
+    "category_pricelist_row",
+    "main_category_id",
+    "main_category_name",
+    "main_category_name_en",
+    "main_category_icon",
+    "main_category_order_number",
+    "kind_id",
+    "kind_image",
+    "kind_name",
+    "strains",
+    "kind_short_description_nl",
+    "kind_short_description_en",
+    "kind_c",
+    "kind_h",
+    "kind_i",
+    "kind_s",
+    "product_id",
+    "product_image",
+    "product_name",
+    "product_short_description_nl",
+    "product_short_description_en",
+    "half",
+    "one",
+    "two_five",
+    "five",
+    "joint",
+    "piece",
+    "created_at",
+    "modified_at",
+    "order_number",
+)
+
+# Fields of a row that are copied from the category (including its main category), kind and product of the row
+CATEGORY_FIELDS = tuple(field for field in PRICE_LIST_FIELDS if field.startswith(("category_", "main_category_")))
+KIND_FIELDS = tuple(field for field in PRICE_LIST_FIELDS if field.startswith("kind_") and field != "kind_id") + (
+    "strains",
+)
+PRODUCT_FIELDS = tuple(field for field in PRICE_LIST_FIELDS if field.startswith("product_") and field != "product_id")
+
+# The cursor of a full sync of a price list
+FULL_SYNC_CURSOR = "0"
+
+# The lowest id of the transactions of other sessions that are still in flight (or the next id to hand out): all
+# rows written by lower transaction ids are committed or rolled back, so they are final. The own transaction doesn't
+# hold the horizon back, its changes are visible to itself.
+CHANGES_HORIZON = text(
+    "SELECT coalesce(min(xip), txid_snapshot_xmax(txid_current_snapshot())) "
+    "FROM txid_snapshot_xip(txid_current_snapshot()) AS xip"
+)
+
+# Models that end up in the price list rows
+SOURCE_MODELS = (ShopToPrice, Price, Category, MainCategory, Kind, KindToStrain, Strain, ProductsTable)
+
+
+def render_price_list_row(pr: ShopToPrice) -> Dict[str, Any]:
+    """Flatten a (eager loaded) shop to price relation into one row of the shop price list."""
+    return {
+        "id": pr.id,
+        "internal_product_id": pr.price.internal_product_id,
+        "active": pr.active,
+        "new": pr.new,
+        "category_id": pr.category_id,
+        "category_name": pr.category.name,
+        "category_name_en": pr.category.name_en,
+        "category_icon": pr.category.icon,
+        "category_color": pr.category.color,
+        "category_order_number": pr.category.order_number,
+        "category_image_1": pr.category.image_1,
+        "category_image_2": pr.category.image_2,
+        "category_pricelist_column": pr.category.pricelist_column,
+        "category_pricelist_row": pr.category.pricelist_row,
+        "main_category_id": pr.category.main_category.id if pr.category.main_category else "Unknown",
+        "main_category_name": pr.category.main_category.name if pr.category.main_category else "Unknown",
+        "main_category_name_en": pr.category.main_category.name_en if pr.category.main_category else "Unknown",
+        "main_category_icon": pr.category.main_category.icon if pr.category.main_category else "Unknown",
+        "main_category_order_number": pr.category.main_category.order_number if pr.category.main_category else 0,
+        "kind_id": pr.kind_id,
+        "kind_image": pr.kind.image_1 if pr.kind_id else None,
+        "kind_name": pr.kind.name if pr.kind_id else None,
+        "strains": [dict({"name": strain.strain.name}) for strain in pr.kind.kind_to_strains] if pr.kind_id else [],
+        "kind_short_description_nl": pr.kind.short_description_nl if pr.kind_id else None,
+        "kind_short_description_en": pr.kind.short_description_en if pr.kind_id else None,
+        "kind_c": pr.kind.c if pr.kind_id else None,
+        "kind_h": pr.kind.h if pr.kind_id else None,
+        "kind_i": pr.kind.i if pr.kind_id else None,
+        "kind_s": pr.kind.s if pr.kind_id else None,
+        "product_id": pr.product_id,
+        "product_image": pr.product.image_1 if pr.product_id else None,
+        "product_name": pr.product.name if pr.product_id else None,
+        "product_short_description_nl": pr.product.short_description_nl if pr.product_id else None,
+        "product_short_description_en": pr.product.short_description_en if pr.product_id else None,
+        "half": pr.price.half if pr.use_half else None,
+        "one": pr.price.one if pr.use_one else None,
+        "two_five": pr.price.two_five if pr.use_two_five else None,
+        "five": pr.price.five if pr.use_five else None,
+        "joint": pr.price.joint if pr.use_joint else None,
+        "piece": pr.price.piece if pr.use_piece else None,
+        "created_at": pr.created_at,
+        "modified_at": pr.modified_at,
+        "order_number": pr.order_number,
+    }
+
+
+def encode_changes_cursor(version: int, horizon: int) -> str:
+    return f"{version}.{horizon}"
+
+
+def decode_changes_cursor(cursor: str) -> Tuple[int, int]:
+    """The version and horizon of a cursor of `get_changes()`.
+
+    A cursor without a horizon (a plain version, as handed out before the horizon was added) has horizon 0: the next
+    delta sends all rows and deletions again, which is safe.
+    """
+    try:
+        version, _, horizon = cursor.partition(".")
+        version, horizon = int(version or 0), int(horizon or 0)
+    except ValueError as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if version < 0 or horizon < 0:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return version, horizon
+
+
+class CRUDShopPriceList:
+    """Read and maintain the denormalized `shop_price_list` table.
+
+    The table is read only from the API's point of view: rows are (re)built from the source tables by `refresh()`,
+    which runs automatically after every flush that touches one of the `SOURCE_MODELS`. Rows that leave a shop's
+    price list are recorded in `shop_price_list_deletions`, so clients can sync with `get_changes()`.
+    """
+
+    def __init__(self, model=ShopPriceList):
+        self.model = model
+
+    def get_by_shop_id(self, *, shop_id: UUID, is_horeca: Optional[bool] = None) -> List[ShopPriceList]:
+        """Price list of a shop in the same order and variants as `shop_to_price_crud.get_price_list_by_shop_id()`."""
+        conditions, order_by = self._variant_clauses(is_horeca)
+        return ShopPriceList.query.filter(ShopPriceList.shop_id == shop_id, *conditions).order_by(*order_by).all()
+
+    def get_by_shop_ids(
+        self, *, shop_ids: Sequence[UUID], is_horeca: Optional[bool] = None
+    ) -> Dict[UUID, List[ShopPriceList]]:
+        """Price lists of several shops in one query, per shop id."""
+        conditions, order_by = self._variant_clauses(is_horeca)
+        rows = (
+            ShopPriceList.query.filter(ShopPriceList.shop_id.in_(list(shop_ids)), *conditions)
+            .order_by(ShopPriceList.shop_id, *order_by)
+            .all()
+        )
+        price_lists: Dict[UUID, List[ShopPriceList]] = {shop_id: [] for shop_id in shop_ids}
+        for row in rows:
+            price_lists[row.shop_id].append(row)
+        return price_lists
+
+    def stream_by_shop_id(
+        self,
+        *,
+        shop_id: UUID,
+        is_horeca: Optional[bool] = None,
+        fields: Sequence[str] = PRICE_LIST_FIELDS,
+        batch_size: int = 500,
+    ) -> Iterator[Dict[str, Any]]:
+        """Price list of a shop as dicts with only `fields`, read in batches from a server side cursor.
+
+        The rows are read on a connection of their own: a streaming response is sent after the request's session is
+        closed. The bind is resolved right away, while the session still exists.
+        """
+        conditions, order_by = self._variant_clauses(is_horeca)
+        statement = (
+            select([ShopPriceList.__table__.c[field] for field in fields])
+            .where(and_(ShopPriceList.shop_id == shop_id, *conditions))
+            .order_by(*order_by)
+        )
+        bind = db.session.get_bind()
+
+        def rows() -> Iterator[Dict[str, Any]]:
+            with bind.connect() as connection:
+                result = connection.execution_options(stream_results=True).execute(statement)
+                for batch in iter(lambda: result.fetchmany(batch_size), []):
+                    for row in batch:
+                        yield dict(zip(fields, row))
+
+        return rows()
+
+    @staticmethod
+    def _variant_clauses(is_horeca: Optional[bool]) -> Tuple[List[Any], List[Any]]:
+        """Filter and ordering of the `is_horeca` variants of a price list."""
+        if is_horeca:
+            return [ShopPriceList.kind_id.is_(None)], [
+                ShopPriceList.category_name,
+                ShopPriceList.order_number,
+                ShopPriceList.price_piece,
+            ]
+        if is_horeca is not None:
+            return [ShopPriceList.product_id.is_(None)], [
+                ShopPriceList.category_name,
+                ShopPriceList.price_piece,
+                ShopPriceList.price_joint,
+                ShopPriceList.price_one,
+                ShopPriceList.price_five,
+                ShopPriceList.price_half,
+                ShopPriceList.price_two_five,
+            ]
+        return [], [
+            ShopPriceList.category_pricelist_column,
+            ShopPriceList.category_pricelist_row,
+            ShopPriceList.order_number,
+            ShopPriceList.price_piece,
+            ShopPriceList.price_joint,
+            ShopPriceList.price_one,
+            ShopPriceList.price_five,
+            ShopPriceList.price_half,
+            ShopPriceList.price_two_five,
+        ]
+
+    def get_changes(
+        self, *, shop_id: UUID, since: str = FULL_SYNC_CURSOR
+    ) -> Tuple[List[ShopPriceList], List[UUID], str]:
+        """Rows of a shop that were added or changed after cursor `since` and the ids of the removed rows.
+
+        Returns the rows, the removed ids and the cursor to pass as `since` next time. Versions are handed out at
+        flush time, so transactions can commit in another order than their versions: a delta only holds the changes
+        of transactions that are no longer in flight (older than the horizon, see `CHANGES_HORIZON`), and the cursor
+        remembers the horizon so the next delta picks up the changes of transactions that were in flight, whatever
+        their versions. Raises ValueError for an invalid cursor.
+        """
+        since_version, since_horizon = decode_changes_cursor(since)
+        horizon = db.session.execute(CHANGES_HORIZON).scalar()
+        if not since_version and not since_horizon:
+            # A full sync has nothing to delete; rows of transactions past the horizon are sent again next time
+            rows = ShopPriceList.query.filter(ShopPriceList.shop_id == shop_id).order_by(ShopPriceList.version).all()
+            version = max([0] + [row.version for row in rows])
+            return rows, [], encode_changes_cursor(version, horizon)
+
+        def changes(model: Any) -> List[Any]:
+            return [
+                model.shop_id == shop_id,
+                or_(model.version > since_version, model.txid >= since_horizon),
+                model.txid < horizon,
+            ]
+
+        rows = ShopPriceList.query.filter(*changes(ShopPriceList)).order_by(ShopPriceList.version).all()
+        version = max([since_version] + [row.version for row in rows])
+        current_ids = {row.id for row in rows}
+        deleted = []
+        tombstones = (
+            db.session.query(ShopPriceListDeletion.id, ShopPriceListDeletion.version)
+            .filter(*changes(ShopPriceListDeletion))
+            .order_by(ShopPriceListDeletion.version)
+        )
+        for tombstone in tombstones:
+            version = max(version, tombstone.version)
+            # A row that came back after its deletion is current again
+            if tombstone.id not in current_ids and tombstone.id not in deleted:
+                deleted.append(tombstone.id)
+        return rows, deleted, encode_changes_cursor(version, horizon)
+
+    def refresh(
+        self,
+        *,
+        shop_to_price_ids: Iterable[UUID] = (),
+        price_ids: Iterable[UUID] = (),
+        category_ids: Iterable[UUID] = (),
+        main_category_ids: Iterable[UUID] = (),
+        kind_ids: Iterable[UUID] = (),
+        product_ids: Iterable[UUID] = (),
+        strain_ids: Iterable[UUID] = (),
+    ) -> None:
+        """Rebuild the rows that depend on the given source records."""
+        conditions = []
+        for column, ids in (
+            (ShopToPrice.price_id, price_ids),
+            (ShopToPrice.category_id, category_ids),
+            (ShopToPrice.kind_id, kind_ids),
+            (ShopToPrice.product_id, product_ids),
+        ):
+            if ids:
+                conditions.append(column.in_(list(ids)))
+        if main_category_ids:
+            conditions.append(
+                ShopToPrice.category_id.in_(
+                    select([Category.id]).where(Category.main_category_id.in_(list(main_category_ids)))
+                )
+            )
+        if strain_ids:
+            # Strains are rendered on the kinds that use them
+            conditions.append(
+                ShopToPrice.kind_id.in_(
+                    select([KindToStrain.kind_id]).where(KindToStrain.strain_id.in_(list(strain_ids)))
+                )
+            )
+
+        ids = set(shop_to_price_ids)
+        if conditions:
+            ids.update(row.id for row in db.session.query(ShopToPrice.id).filter(or_(*conditions)))
+        if not ids:
+            return
+
+        old_shop_ids = {
+            row.id: row.shop_id
+            for row in db.session.query(ShopPriceList.id, ShopPriceList.shop_id).filter(ShopPriceList.id.in_(list(ids)))
+        }
+        db.session.execute(ShopPriceList.__table__.delete().where(ShopPriceList.id.in_(list(ids))))
+        rows = [self._row_values(pr) for pr in shop_to_price_crud.get_price_list_by_ids(ids=list(ids)) if pr.shop_id]
+        if rows:
+            db.session.execute(ShopPriceList.__table__.insert(), rows)
+        new_shop_ids = {row["id"]: row["shop_id"] for row in rows}
+        self.add_deletions((id, shop_id) for id, shop_id in old_shop_ids.items() if new_shop_ids.get(id) != shop_id)
+        logger.debug("Refreshed shop price list rows", refreshed=len(rows), removed=len(ids) - len(rows))
+
+    def refresh_shop(self, *, shop_id: UUID) -> None:
+        """Rebuild all rows of one shop, e.g. to repair the table after a bulk import."""
+        ids = {row.id for row in db.session.query(ShopToPrice.id).filter(ShopToPrice.shop_id == shop_id)}
+        ids.update(row.id for row in db.session.query(ShopPriceList.id).filter(ShopPriceList.shop_id == shop_id))
+        self.refresh(shop_to_price_ids=ids)
+
+    def add_deletions(self, deletions: Iterable[Tuple[UUID, UUID]]) -> None:
+        """Record tombstones for `(shop_to_price_id, shop_id)` rows that left a shop price list."""
+        tombstones = [{"id": id, "shop_id": shop_id} for id, shop_id in deletions]
+        if tombstones:
+            db.session.execute(ShopPriceListDeletion.__table__.insert(), tombstones)
+
+    @staticmethod
+    def _row_values(pr: ShopToPrice) -> Dict[str, Any]:
+        return {
+            **render_price_list_row(pr),
+            "shop_id": pr.shop_id,
+            "price_half": pr.price.half,
+            "price_one": pr.price.one,
+            "price_two_five": pr.price.two_five,
+            "price_five": pr.price.five,
+            "price_joint": pr.price.joint,
+            "price_piece": pr.price.piece,
+        }
+
+
+shop_price_list_crud = CRUDShopPriceList(ShopPriceList)
+
+
+@event.listens_for(WrappedSession, "before_flush")
+def collect_price_list_deletions(session: WrappedSession, flush_context: Any, instances: Any) -> None:
+    """Remember the shop of deleted shop to price relations while it can still be loaded."""
+    session.info["shop_price_list_deletions"] = {
+        (obj.id, obj.shop_id) for obj in session.deleted if isinstance(obj, ShopToPrice) and obj.shop_id
+    }
+
+
+@event.listens_for(WrappedSession, "after_flush")
+def collect_price_list_changes(session: WrappedSession, flush_context: Any) -> None:
+    """Remember which source records changed in this flush; the rows are rebuilt in `after_flush_postexec`."""
+    changes = session.info.setdefault("shop_price_list_changes", defaultdict(set))
+    changes[ShopPriceListDeletion].update(session.info.pop("shop_price_list_deletions", ()))
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if not isinstance(obj, SOURCE_MODELS) or (obj in session.dirty and not session.is_modified(obj)):
+            continue
+        state = sa_inspect(obj)
+        if isinstance(obj, KindToStrain):
+            # Strains are rendered on the kind: refresh the old and the new kind
+            changes[Kind].update(kind_id for kind_id in state.attrs.kind_id.history.sum() if kind_id)
+        elif isinstance(obj, ShopToPrice) and obj in session.deleted:
+            # The row is removed by the foreign key cascade, the tombstone was collected before the flush
+            continue
+        else:
+            changes[type(obj)].add(state.identity[0] if state.identity else obj.id)
+
+
+@event.listens_for(WrappedSession, "after_flush_postexec")
+def refresh_price_list_changes(session: WrappedSession, flush_context: Any) -> None:
+    changes = session.info.pop("shop_price_list_changes", None)
+    if not changes:
+        return
+    shop_price_list_crud.refresh(
+        shop_to_price_ids=changes[ShopToPrice],
+        price_ids=changes[Price],
+        category_ids=changes[Category],
+        main_category_ids=changes[MainCategory],
+        kind_ids=changes[Kind],
+        product_ids=changes[ProductsTable],
+        strain_ids=changes[Strain],
+    )
+    shop_price_list_crud.add_deletions(changes[ShopPriceListDeletion])
@@ -10,18 +10,24 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from typing import List, Optional
+from typing import Dict, FrozenSet, List, Optional
 from uuid import UUID
 
-from sqlalchemy.orm import contains_eager, defer
+from sqlalchemy.orm import contains_eager, defer, joinedload, selectinload
 
 from server.api.models import transform_json
 from server.crud.base import CRUDBase
 from server.db import db
-from server.db.models import ShopToPrice
+from server.db.models import Category, Kind, KindToStrain, Price, ShopToPrice
 from server.schemas.shop_to_price import ShopToPriceCreate, ShopToPriceUpdate
 from server.utils.json import json_dumps
 
+# Units in which an item can be ordered: it needs both the `use_<unit>` flag and a price for the unit
+PRICE_UNITS = ("half", "one", "two_five", "five", "joint", "piece")
+
+# Availability index of a shop: per kind and product (string) id the units that can be ordered
+AvailabilityIndex = Dict[str, Dict[str, FrozenSet[str]]]
+
 
 class CRUDShopToPrice(CRUDBase[ShopToPrice, ShopToPriceCreate, ShopToPriceUpdate]):
     def create(self, *, obj_in: ShopToPriceCreate) -> ShopToPrice:
@@ -71,10 +77,100 @@ class CRUDShopToPrice(CRUDBase[ShopToPrice, ShopToPriceCreate, ShopToPriceUpdate
         )
         return products
 
+    def get_availability_by_shop_id(self, *, shop_id: UUID) -> AvailabilityIndex:
+        """Availability index of a shop, for order validation.
+
+        Returns `{"kinds": {kind_id: units}, "products": {product_id: units}}` with only the active items. An item that
+        is listed in several categories is available in a unit when one of its entries is.
+        """
+        rows = (
+            db.session.query(
+                ShopToPrice.kind_id,
+                ShopToPrice.product_id,
+                *[getattr(ShopToPrice, f"use_{unit}") for unit in PRICE_UNITS],
+                *[getattr(Price, unit) for unit in PRICE_UNITS],
+            )
+            .join(ShopToPrice.price)
+            .filter(ShopToPrice.shop_id == shop_id, ShopToPrice.active.is_(True))
+            .all()
+        )
+        kinds: Dict[str, set] = {}
+        products: Dict[str, set] = {}
+        for kind_id, product_id, *flags_and_prices in rows:
+            flags, prices = flags_and_prices[: len(PRICE_UNITS)], flags_and_prices[len(PRICE_UNITS) :]
+            units = {unit for unit, flag, price in zip(PRICE_UNITS, flags, prices) if flag and price}
+            if kind_id is not None:
+                kinds.setdefault(str(kind_id), set()).update(units)
+            if product_id is not None:
+                products.setdefault(str(product_id), set()).update(units)
+        return {
+            "kinds": {kind_id: frozenset(units) for kind_id, units in kinds.items()},
+            "products": {product_id: frozenset(units) for product_id, units in products.items()},
+        }
+
+    def _price_list_query(self):
+        """Query shop to price relations with all relations needed to render them in a price list.
+
+        The whole graph is fetched in two statements, regardless of the size of the menu:
+        price, category and main category, kind and product are many-to-one and are joined in the main query; the
+        strains of the kinds are a collection and are fetched with one extra `IN` query.
+        """
+        return (
+            ShopToPrice.query.join(ShopToPrice.price)
+            .join(ShopToPrice.category)
+            .options(
+                contains_eager(ShopToPrice.price),
+                contains_eager(ShopToPrice.category).joinedload(Category.main_category),
+                joinedload(ShopToPrice.product),
+                joinedload(ShopToPrice.kind).selectinload(Kind.kind_to_strains).joinedload(KindToStrain.strain),
+            )
+        )
+
+    def get_price_list_by_shop_id(self, *, shop_id: UUID, is_horeca: Optional[bool] = None) -> List[ShopToPrice]:
+        """Load the price list of a shop, eager loaded and in price list order.
+
+        `is_horeca` selects the variant: `True` for horeca products only, `False` for cannabis only and `None` for
+        the complete price list.
+        """
+        query = self._price_list_query().filter(ShopToPrice.shop_id == shop_id)
+        if is_horeca:
+            query = query.filter(ShopToPrice.kind_id.is_(None)).order_by(
+                Category.name, ShopToPrice.order_number, Price.piece
+            )
+        elif is_horeca is not None:
+            query = query.filter(ShopToPrice.product_id.is_(None)).order_by(
+                Category.name, Price.piece, Price.joint, Price.one, Price.five, Price.half, Price.two_five
+            )
+        else:
+            query = query.order_by(
+                Category.pricelist_column,
+                Category.pricelist_row,
+                ShopToPrice.order_number,
+                Price.piece,
+                Price.joint,
+                Price.one,
+                Price.five,
+                Price.half,
+                Price.two_five,
+            )
+        return query.all()
+
+    def get_price_list_by_ids(self, *, ids: List[UUID]) -> List[ShopToPrice]:
+        """Load the given shop to price relations, eager loaded like `get_price_list_by_shop_id()`."""
+        if not ids:
+            return []
+        return self._price_list_query().filter(ShopToPrice.id.in_(ids)).all()
+
     def get_shops_to_prices_by_kind(self, *, kind_id: UUID) -> List[Optional[ShopToPrice]]:
         query = ShopToPrice.query.filter_by(kind_id=kind_id).all()
         return query
 
+    def get_shop_ids_by_strain(self, *, strain_id: UUID) -> List[UUID]:
+        """The shops with a kind of the strain in their price list."""
+        kind_ids = db.session.query(KindToStrain.kind_id).filter(KindToStrain.strain_id == strain_id)
+        rows = db.session.query(ShopToPrice.shop_id).filter(ShopToPrice.kind_id.in_(kind_ids)).distinct()
+        return [row.shop_id for row in rows if row.shop_id]
+
     def get_shops_to_prices_by_category(self, *, category_id: UUID) -> List[Optional[ShopToPrice]]:
         query = ShopToPrice.query.filter_by(category_id=category_id).count()
         return query
@@ -15,11 +15,12 @@ from typing import Optional
 from server.crud.base import CRUDBase
 from server.db.models import Strain
 from server.schemas.strain import StrainCreate, StrainUpdate
+from server.utils.cache import reference_cache
 
 
 class CRUDStrain(CRUDBase[Strain, StrainCreate, StrainUpdate]):
     def get_by_name(self, *, name: str) -> Optional[Strain]:
-        return Strain.query.filter(Strain.name == name).first()
+        return self.get_cached(("name", name), lambda: Strain.query.filter(Strain.name == name).first())
 
 
-strain_crud = CRUDStrain(Strain)
+strain_crud = CRUDStrain(Strain, cache=reference_cache("strains"))
@@ -15,11 +15,12 @@ from typing import Optional
 from server.crud.base import CRUDBase
 from server.db.models import Tag
 from server.schemas.tag import TagCreate, TagUpdate
+from server.utils.cache import reference_cache
 
 
 class CRUDTag(CRUDBase[Tag, TagCreate, TagUpdate]):
     def get_by_name(self, *, name: str) -> Optional[Tag]:
-        return Tag.query.filter(Tag.name == name).first()
+        return self.get_cached(("name", name), lambda: Tag.query.filter(Tag.name == name).first())
 
 
-tag_crud = CRUDTag(Tag)
+tag_crud = CRUDTag(Tag, cache=reference_cache("tags"))
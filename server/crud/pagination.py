@@ -0,0 +1,117 @@
+# Copyright 2024 René Dohmen <acidjunk@gmail.com>
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Keyset pagination with opaque cursors.
+
+A cursor holds the sort keys of a listing and their values in the last row of a page, signed with the session secret
+so clients can't forge them. The next page holds the rows after those values in the order of the keys, so a deep page
+costs the same as the first one and rows written in between don't shift the pages.
+
+The list endpoints get it through the `cursor` parameter of `common_parameters()`: it sets the `KeysetPage` of the
+request, which `CRUDBase.get_multi()` picks up. The cursor of the next page goes in the `X-Next-Cursor` header.
+"""
+import base64
+import hashlib
+import hmac
+import json
+from contextvars import ContextVar
+from typing import Any, List, MutableMapping, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, cast, literal, or_
+from sqlalchemy.sql.elements import ColumnElement
+
+from server.settings import app_settings
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# A sort key: a column and whether it is sorted descending
+SortKey = Tuple[Any, bool]
+
+
+def _b64encode(value: bytes) -> str:
+    return base64.urlsafe_b64encode(value).decode().rstrip("=")
+
+
+def _b64decode(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+
+def _signature(payload: str) -> str:
+    digest = hmac.new(app_settings.SESSION_SECRET.encode(), payload.encode(), hashlib.sha256).digest()
+    return _b64encode(digest[:16])
+
+
+def key_names(keys: Sequence[SortKey]) -> List[str]:
+    return [f"{column.key}:{'desc' if descending else 'asc'}" for column, descending in keys]
+
+
+def encode_cursor(keys: Sequence[SortKey], values: Sequence[Any]) -> str:
+    """The cursor of the rows after `values` in the order of `keys`."""
+    payload = _b64encode(json.dumps([key_names(keys), list(values)], default=str).encode())
+    return f"{payload}.{_signature(payload)}"
+
+
+def decode_cursor(cursor: str, keys: Optional[Sequence[SortKey]] = None) -> List[Any]:
+    """The values of a cursor; raises ValueError when it is forged, malformed or (with `keys`) for another order."""
+    payload, _, signature = cursor.partition(".")
+    if not hmac.compare_digest(signature, _signature(payload)):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    try:
+        names, values = json.loads(_b64decode(payload))
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+    if keys is not None and names != key_names(keys):
+        raise ValueError("The cursor is for another sort order")
+    return values
+
+
+def keyset_predicate(keys: Sequence[SortKey], values: Sequence[Any]) -> ColumnElement:
+    """The rows after `values` in the order of `keys`, with the NULLs last when ascending and first when descending.
+
+    Written out per key instead of as a row comparison, so the keys can be sorted in different directions.
+    """
+    equal_before: List[ColumnElement] = []
+    alternatives = []
+    for (column, descending), value in zip(keys, values):
+        bound = None if value is None else cast(literal(value), column.type)
+        if bound is None:
+            after = column.isnot(None) if descending else None
+        elif descending:
+            after = column < bound
+        else:
+            after = or_(column > bound, column.is_(None))
+        if after is not None:
+            alternatives.append(and_(*equal_before, after))
+        equal_before.append(column.is_(None) if bound is None else column == bound)
+    return or_(*alternatives)
+
+
+class KeysetPage:
+    """The keyset pagination of a request: the cursor of the page to get (empty for the first page) and the headers
+    of the response, which get the cursor of the next page."""
+
+    def __init__(self, cursor: str, headers: MutableMapping[str, str]) -> None:
+        self.cursor = cursor
+        self.headers = headers
+
+    def values(self, keys: Sequence[SortKey]) -> Optional[List[Any]]:
+        """The values of the cursor for the order of `keys`, None for the first page; raises ValueError."""
+        return decode_cursor(self.cursor, keys) if self.cursor else None
+
+    def set_next(self, keys: Sequence[SortKey], values: Optional[Sequence[Any]]) -> None:
+        """Announce the next page, after `values`; None for the last page."""
+        if values is not None:
+            self.headers[NEXT_CURSOR_HEADER] = encode_cursor(keys, values)
+
+
+# Set per request by `common_parameters()`
+keyset_page: ContextVar[Optional[KeysetPage]] = ContextVar("keyset_page", default=None)
@@ -17,19 +17,20 @@ from typing import Any, Callable, ClassVar, Dict, Generator, Iterator, List, Opt
 from uuid import uuid4
 
 import structlog
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, func
 from sqlalchemy import inspect as sa_inspect
 from sqlalchemy.ext.declarative import DeclarativeMeta, as_declarative
 from sqlalchemy.orm import Query, Session, scoped_session, sessionmaker
 from sqlalchemy.orm.state import InstanceState
 from sqlalchemy.sql.schema import MetaData
-from sqlalchemy_searchable import SearchQueryMixin
+from sqlalchemy_searchable import SearchQueryMixin, inspect_search_vectors
 from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
 from starlette.requests import Request
 from starlette.responses import Response
 from starlette.types import ASGIApp
 from structlog.stdlib import BoundLogger
 
+from server.db.filters import search_predicate, search_tsquery
 from server.utils.json import json_dumps, json_loads
 
 logger = structlog.get_logger(__name__)
@@ -38,7 +39,21 @@ logger = structlog.get_logger(__name__)
 class SearchQuery(Query, SearchQueryMixin):
     """Custom Query class to have search() property."""
 
-    pass
+    def search(self, search_query: str, vector: Any = None, regconfig: Any = None, sort: bool = False) -> "SearchQuery":
+        """Full-text search on the search vector of the queried model, see `server.db.filters.search_tsquery()`.
+
+        Replaces the search of SQLAlchemy-Searchable, which needs its SQL functions installed. `regconfig` is ignored:
+        the search vectors hold several languages.
+        """
+        if not search_query.strip():
+            return self
+        if vector is None:
+            vector = inspect_search_vectors(self._entities[0].entity_zero.class_)[0]
+        query = self.filter(search_predicate(vector, search_query))
+        tsquery = search_tsquery(search_query)
+        if sort and tsquery is not None:
+            query = query.order_by(func.ts_rank(vector, tsquery).desc())
+        return query
 
 
 class NoSessionError(RuntimeError):
@@ -0,0 +1,168 @@
+# Copyright 2024 René Dohmen <acidjunk@gmail.com>
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compile the `filter` values of the list endpoints to predicates that fit the type of the column.
+
+The value of a filter is matched according to the column type, so the predicates can use the indexes:
+
+- text: contains (`ILIKE '%value%'`, served by the `pg_trgm` GIN indexes), `value*` for a prefix, `=value` for an
+  exact match (served by the btree indexes);
+- UUID: equality;
+- boolean: `true`/`yes`/`1`/... or `false`/`no`/`0`/...;
+- numbers, dates and timestamps: equality, a comparison (`>=10`, `<2026-01-01`) or a range (`10..20`, both ends
+  included, either end may be left out). A date matches a whole day for timestamp columns;
+- search vectors (`tsv`): a full-text search for all words of the value, as prefixes (served by their GIN indexes).
+
+Other types (JSON, arrays) fall back to a contains match on the text of the column. A value that can't be read as the
+type of the column matches nothing.
+"""
+import re
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from functools import reduce
+from typing import Any, Callable, Optional, Tuple
+from uuid import UUID
+
+import structlog
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer, Numeric, String, and_, cast, false, func, literal_column
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.sql.elements import ColumnElement
+
+logger = structlog.get_logger(__name__)
+
+TRUE_VALUES = ("yes", "y", "ye", "true", "1", "ja", "insync")
+FALSE_VALUES = ("no", "n", "false", "0", "nee")
+COMPARISON = re.compile(r"^(>=|<=|>|<)(.*)$")
+RANGE_SEPARATOR = ".."
+# The text search configurations of the search vectors: names are unstemmed, descriptions stemmed in Dutch and English
+SEARCH_CONFIGS = ("simple", "dutch", "english")
+SEARCH_WORD = re.compile(r"[^\W_]+")
+
+
+def like_pattern(value: str, prefix: bool = False) -> str:
+    """A LIKE pattern that matches `value` literally, anywhere or (`prefix`) at the start."""
+    escaped = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"{escaped}%" if prefix else f"%{escaped}%"
+
+
+def text_predicate(column: Any, value: str) -> ColumnElement:
+    if value.startswith("="):
+        return column == value[1:]
+    if value.endswith("*"):
+        return column.ilike(like_pattern(value[:-1], prefix=True))
+    return column.ilike(like_pattern(value))
+
+
+def boolean_predicate(column: Any, value: str) -> ColumnElement:
+    if value.lower() in TRUE_VALUES:
+        return column.is_(True)
+    if value.lower() in FALSE_VALUES:
+        return column.is_(False)
+    return false()
+
+
+def parse_datetime(value: str) -> Tuple[datetime, Optional[datetime]]:
+    """A moment, or for a date the start of the day and of the next day."""
+    if len(value) == 10:
+        day = date.fromisoformat(value)
+        start = datetime(day.year, day.month, day.day)
+        return start, start + timedelta(days=1)
+    return datetime.fromisoformat(value), None
+
+
+def ordered_predicate(column: Any, value: str, parse: Callable[[str], Any]) -> ColumnElement:
+    """Equality, a comparison or a range for a column with ordered values, like numbers and dates."""
+    comparison = COMPARISON.match(value)
+    if comparison:
+        operator, operand = comparison.groups()
+        bound = parse(operand.strip())
+        return {">": column > bound, ">=": column >= bound, "<": column < bound, "<=": column <= bound}[operator]
+    if RANGE_SEPARATOR in value:
+        low, high = (part.strip() for part in value.split(RANGE_SEPARATOR, 1))
+        conditions = ([column >= parse(low)] if low else []) + ([column <= parse(high)] if high else [])
+        return and_(*conditions)
+    return column == parse(value)
+
+
+def datetime_predicate(column: Any, value: str) -> ColumnElement:
+    """Like `ordered_predicate()`, where a date stands for the whole day."""
+
+    def lower_bound(operand: str, after: bool) -> ColumnElement:
+        start, next_day = parse_datetime(operand)
+        if next_day:
+            return column >= (next_day if after else start)
+        return column > start if after else column >= start
+
+    def upper_bound(operand: str, including: bool) -> ColumnElement:
+        start, next_day = parse_datetime(operand)
+        if next_day:
+            return column < (next_day if including else start)
+        return column <= start if including else column < start
+
+    comparison = COMPARISON.match(value)
+    if comparison:
+        operator, operand = comparison.group(1), comparison.group(2).strip()
+        if operator.startswith(">"):
+            return lower_bound(operand, after=operator == ">")
+        return upper_bound(operand, including=operator == "<=")
+    if RANGE_SEPARATOR in value:
+        low, high = (part.strip() for part in value.split(RANGE_SEPARATOR, 1))
+        conditions = ([lower_bound(low, after=False)] if low else []) + (
+            [upper_bound(high, including=True)] if high else []
+        )
+        return and_(*conditions)
+    return and_(lower_bound(value, after=False), upper_bound(value, including=True))
+
+
+def search_tsquery(value: str) -> Optional[ColumnElement]:
+    """A tsquery for the documents with all words of `value` as prefixes, or None when `value` has no words.
+
+    The query is made in each of the `SEARCH_CONFIGS`, so the words match the stemmed descriptions as well as the names.
+    """
+    words = SEARCH_WORD.findall(value.lower())
+    if not words:
+        return None
+    terms = " & ".join(f"{word}:*" for word in words)
+    queries = [func.to_tsquery(literal_column(f"'{config}'::regconfig"), terms) for config in SEARCH_CONFIGS]
+    return reduce(lambda left, right: left.op("||")(right), queries)
+
+
+def search_predicate(column: Any, value: str) -> ColumnElement:
+    tsquery = search_tsquery(value)
+    return column.op("@@")(tsquery) if tsquery is not None else false()
+
+
+def compile_filter(column: Any, value: str) -> ColumnElement:
+    """The predicate for a `filter` value on a column (or a model attribute); see the module documentation."""
+    column_type = column.type
+    try:
+        if isinstance(column_type, PG_UUID):
+            return column == UUID(value)
+        if isinstance(column_type, Boolean):
+            return boolean_predicate(column, value)
+        if isinstance(column_type, DateTime):
+            return datetime_predicate(column, value)
+        if isinstance(column_type, Date):
+            return ordered_predicate(column, value, date.fromisoformat)
+        if isinstance(column_type, Integer):
+            return ordered_predicate(column, value, int)
+        if isinstance(column_type, (Float, Numeric)):
+            return ordered_predicate(column, value, Decimal)
+        if isinstance(column_type, String):
+            return text_predicate(column, value)
+        if isinstance(getattr(column_type, "impl", column_type), TSVECTOR):
+            return search_predicate(column, value)
+    except (ValueError, InvalidOperation):
+        logger.debug("Filter value doesn't match the column type", column=str(column), value=value)
+        return false()
+    return cast(column, String).ilike(like_pattern(value))
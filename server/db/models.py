@@ -23,21 +23,26 @@ import sqlalchemy
 import structlog
 from sqlalchemy import (
     JSON,
+    BigInteger,
     Boolean,
     Column,
+    Date,
     DateTime,
     Float,
     ForeignKey,
+    Index,
     Integer,
+    Sequence,
     String,
     TypeDecorator,
     UniqueConstraint,
+    text,
 )
 from sqlalchemy.dialects.postgresql import ARRAY, UUID
 from sqlalchemy.engine import Dialect
 from sqlalchemy.exc import DontWrapMixin
 from sqlalchemy.orm import backref, relationship
-from sqlalchemy_utils import UUIDType
+from sqlalchemy_utils import TSVectorType, UUIDType
 
 from server.db.database import BaseModel, Database
 from server.settings import app_settings
@@ -54,6 +59,16 @@ STATUS_LENGTH = 255
 db = Database(app_settings.DATABASE_URI)
 
 
+def name_trigram_index(table_name: str) -> Index:
+    """GIN trigram index on `name`, for the contains filters of the list endpoints (see `server.db.filters`)."""
+    return Index(f"ix_{table_name}_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"})
+
+
+def search_vector_index(table_name: str) -> Index:
+    """GIN index on the `tsv` search vector, for the full-text search (see `server.db.filters.search_tsquery()`)."""
+    return Index(f"ix_{table_name}_tsv", "tsv", postgresql_using="gin")
+
+
 class UtcTimestampException(Exception, DontWrapMixin):
     pass
 
@@ -151,6 +166,7 @@ class UsersTable(BaseModel):
 
 class Tag(BaseModel):
     __tablename__ = "tags"
+    __table_args__ = (name_trigram_index("tags"),)
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
     name = Column(String(60), unique=True, index=True)
 
@@ -162,6 +178,7 @@ class Tag(BaseModel):
 
 class Flavor(BaseModel):
     __tablename__ = "flavors"
+    __table_args__ = (name_trigram_index("flavors"),)
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
     name = Column(String(60), unique=True, index=True)
     icon = Column(String(60), unique=True, index=True)
@@ -178,10 +195,12 @@ class Shop(BaseModel):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
     name = Column(String(255), nullable=False, unique=True, index=True)
     description = Column(String(255), unique=True)
-    modified_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow())
+    modified_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     last_pending_order = Column(String(255), unique=True)  # order id of last pending order for this shop (UUID)
     last_completed_order = Column(String(255), unique=True)  # order id of last completed order for this shop (UUID)
     allowed_ips = Column(JSON)
+    # Price list cursor (see CRUDShopPriceList.get_changes()) of the last change pushed to the websocket clients
+    price_list_version = Column(String(64), nullable=False, default="0", server_default="0")
     shops_to_price = relationship("ShopToPrice", cascade="save-update, merge, delete")
     shop_to_category = relationship("Category", cascade="save-update, merge, delete")
 
@@ -217,6 +236,7 @@ class MainCategory(BaseModel):
 
 class Category(BaseModel):
     __tablename__ = "categories"
+    __table_args__ = (name_trigram_index("categories"),)
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
     main_category_id = Column(
         "main_category_id", UUID(as_uuid=True), ForeignKey("main_categories.id"), nullable=True, index=True
@@ -245,6 +265,7 @@ class Category(BaseModel):
 
 class Kind(BaseModel):
     __tablename__ = "kinds"
+    __table_args__ = (name_trigram_index("kinds"), search_vector_index("kinds"))
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
     name = Column(String(255), unique=True, index=True)
     short_description_nl = Column(String())
@@ -273,6 +294,8 @@ class Kind(BaseModel):
     image_4 = Column(String(255), unique=True, index=True)
     image_5 = Column(String(255), unique=True, index=True)
     image_6 = Column(String(255), unique=True, index=True)
+    # Maintained by a trigger from the name and the descriptions
+    tsv = Column(TSVectorType())
 
     shop_to_price = relationship("ShopToPrice", cascade="save-update, merge, delete")
 
@@ -313,6 +336,12 @@ class ShopGroup(BaseModel):
 
 class Order(BaseModel):
     __tablename__ = "orders"
+    __table_args__ = (
+        # Keyset pagination of the order history of a shop, see `order_crud.get_page_by_shop_id()`
+        Index("ix_orders_shop_id_status_created_at_id", "shop_id", "status", "created_at", "id"),
+        # Monthly partitions, see `server.utils.order_partitions`
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
     customer_order_id = Column(Integer)
     notes = Column(String, nullable=True)
@@ -321,7 +350,8 @@ class Order(BaseModel):
     order_info = Column(JSON)
     total = Column(Float())
     status = Column(String(), default="pending")
-    created_at = Column(DateTime, default=datetime.utcnow)
+    # Part of the primary key of the table because it is the partition key; orders are still identified by `id`
+    created_at = Column(DateTime, primary_key=True, default=datetime.utcnow)
     completed_by = Column("completed_by", UUID(as_uuid=True), ForeignKey("user.id"), nullable=True)
     completed_at = Column(DateTime, nullable=True)
 
@@ -329,10 +359,57 @@ class Order(BaseModel):
     user = relationship("UsersTable", backref=backref("orders", uselist=False))
     table = relationship("Table", backref=backref("shop_tables", uselist=False))
 
+    __mapper_args__ = {"primary_key": [id]}
+
     def __repr__(self):
         return "<Order for shop: %s with total: %s>" % (self.shop.name, self.total)
 
 
+class ShopOrderCounter(BaseModel):
+    """Last customer order number handed out per shop, see `order_crud.next_customer_order_id()`."""
+
+    __tablename__ = "shop_order_counters"
+    shop_id = Column(UUID(as_uuid=True), ForeignKey("shops.id", ondelete="CASCADE"), primary_key=True)
+    last_number = Column(Integer, nullable=False, default=0)
+    # Local day of `last_number`, for the optional daily reset
+    day = Column(Date, nullable=False)
+
+
+class ShopSalesRollup(BaseModel):
+    """Sales of the completed orders of a shop per hour, see `server.crud.crud_sales_rollup`."""
+
+    __tablename__ = "shop_sales_rollups"
+    shop_id = Column(UUID(as_uuid=True), ForeignKey("shops.id", ondelete="CASCADE"), primary_key=True)
+    hour = Column(DateTime, primary_key=True)  # Start of the hour, UTC
+    orders = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+    grams = Column(Float, nullable=False, default=0)
+
+
+class ShopProductSalesRollup(BaseModel):
+    """Sales of the completed orders of a shop per day and kind or product, see `server.crud.crud_sales_rollup`."""
+
+    __tablename__ = "shop_product_sales_rollups"
+    shop_id = Column(UUID(as_uuid=True), ForeignKey("shops.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)  # In the timezone of the shops
+    item_id = Column(UUID(as_uuid=True), primary_key=True)  # Kind or product id
+    name = Column(String(255), nullable=True)
+    quantity = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0)
+    grams = Column(Float, nullable=False, default=0)
+
+
+class OutboxMessage(BaseModel):
+    """Side effect of an order write, stored in the same transaction and delivered by `server.utils.outbox`."""
+
+    __tablename__ = "outbox_messages"
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    topic = Column(String(32), nullable=False)  # "pending_orders" or "completed_orders"
+    shop_id = Column(UUID(as_uuid=True), ForeignKey("shops.id", ondelete="CASCADE"), nullable=False)
+    order_id = Column(UUID(as_uuid=True), nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
 # Tag many to many relations
 class KindToTag(BaseModel):
     __tablename__ = "kinds_to_tags"
@@ -371,6 +448,7 @@ class KindToStrain(BaseModel):
 
 class ProductsTable(BaseModel):
     __tablename__ = "products"
+    __table_args__ = (name_trigram_index("products"), search_vector_index("products"))
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
     name = Column(String(255), index=True)
     short_description_nl = Column(String())
@@ -391,6 +469,8 @@ class ProductsTable(BaseModel):
     image_4 = Column(String(255), unique=True, index=True)
     image_5 = Column(String(255), unique=True, index=True)
     image_6 = Column(String(255), unique=True, index=True)
+    # Maintained by a trigger from the name and the descriptions
+    tsv = Column(TSVectorType())
 
     shop_to_price = relationship("ShopToPrice", cascade="save-update, merge, delete")
 
@@ -423,8 +503,103 @@ class ShopToPrice(BaseModel):
     modified_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 
+# Versions of the shop price list rows and their deletions; the cursor of the delta sync endpoint
+shop_price_list_version_seq = Sequence("shop_price_list_version_seq")
+# The writing transaction of a shop price list row or deletion: changes are only synced once it is no longer in flight
+current_txid = text("txid_current()")
+
+
+class ShopPriceList(BaseModel):
+    """Denormalized, read only, copy of the rows of the shop price lists.
+
+    One row per `ShopToPrice` that has a price and a category. It is kept up to date on every flush that touches
+    one of the source tables (see: server/crud/crud_shop_price_list.py); never write to it directly. Every rebuild
+    of a row gives it a new `version` and the id of the writing transaction (`txid`).
+    """
+
+    __tablename__ = "shop_price_list"
+    __table_args__ = (
+        Index("ix_shop_price_list_shop_id_version", "shop_id", "version"),
+        Index("ix_shop_price_list_shop_id_txid", "shop_id", "txid"),
+    )
+    id = Column(UUID(as_uuid=True), ForeignKey("shops_to_price.id", ondelete="CASCADE"), primary_key=True)
+    shop_id = Column(UUID(as_uuid=True), ForeignKey("shops.id", ondelete="CASCADE"), nullable=False, index=True)
+    internal_product_id = Column(String())
+    active = Column(Boolean())
+    new = Column(Boolean())
+    category_id = Column(UUID(as_uuid=True))
+    category_name = Column(String(255))
+    category_name_en = Column(String(255))
+    category_icon = Column(String(60))
+    category_color = Column(String(20))
+    category_order_number = Column(Integer)
+    category_image_1 = Column(String(255))
+    category_image_2 = Column(String(255))
+    category_pricelist_column = Column(String)
+    category_pricelist_row = Column(Integer)
+    main_category_id = Column(String)  # UUID or "Unknown"
+    main_category_name = Column(String(255))
+    main_category_name_en = Column(String(255))
+    main_category_icon = Column(String(60))
+    main_category_order_number = Column(Integer)
+    kind_id = Column(UUID(as_uuid=True))
+    kind_image = Column(String(255))
+    kind_name = Column(String(255))
+    strains = Column(JSON)
+    kind_short_description_nl = Column(String())
+    kind_short_description_en = Column(String())
+    kind_c = Column(Boolean())
+    kind_h = Column(Boolean())
+    kind_i = Column(Boolean())
+    kind_s = Column(Boolean())
+    product_id = Column(UUID(as_uuid=True))
+    product_image = Column(String(255))
+    product_name = Column(String(255))
+    product_short_description_nl = Column(String())
+    product_short_description_en = Column(String())
+    half = Column(Float())
+    one = Column(Float())
+    two_five = Column(Float())
+    five = Column(Float())
+    joint = Column(Float())
+    piece = Column(Float())
+    created_at = Column(DateTime)
+    modified_at = Column(DateTime)
+    order_number = Column(Integer)
+    # The unfiltered prices: the price lists are sorted on them
+    price_half = Column(Float())
+    price_one = Column(Float())
+    price_two_five = Column(Float())
+    price_five = Column(Float())
+    price_joint = Column(Float())
+    price_piece = Column(Float())
+    version = Column(
+        BigInteger,
+        shop_price_list_version_seq,
+        server_default=shop_price_list_version_seq.next_value(),
+        nullable=False,
+    )
+    txid = Column(BigInteger, nullable=False, server_default=current_txid)
+
+
+class ShopPriceListDeletion(BaseModel):
+    """Tombstone of a row that left a shop price list: the `ShopToPrice` was deleted or moved to another shop."""
+
+    __tablename__ = "shop_price_list_deletions"
+    __table_args__ = (
+        Index("ix_shop_price_list_deletions_shop_id_version", "shop_id", "version"),
+        Index("ix_shop_price_list_deletions_shop_id_txid", "shop_id", "txid"),
+    )
+    version = Column(BigInteger, shop_price_list_version_seq, primary_key=True)
+    txid = Column(BigInteger, nullable=False, server_default=current_txid)
+    id = Column(UUID(as_uuid=True), nullable=False)
+    shop_id = Column(UUID(as_uuid=True), ForeignKey("shops.id", ondelete="CASCADE"), nullable=False)
+    deleted_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
 class Strain(BaseModel):
     __tablename__ = "strains"
+    __table_args__ = (name_trigram_index("strains"),)
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
     name = Column(String(255), nullable=False, unique=True, index=True)
     #
@@ -441,11 +616,12 @@ class License(BaseModel):
     end_date = Column(DateTime)
     improviser_user = Column(UUID(as_uuid=True), nullable=False)
     seats = Column(Integer, nullable=False)
-    order_id = Column(UUID(as_uuid=True), ForeignKey("orders.id"), index=True)
+    # No foreign key: `orders` is partitioned and only unique on (id, created_at)
+    order_id = Column(UUID(as_uuid=True), index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     modified_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-    order = relationship("Order", lazy=True)
+    order = relationship("Order", primaryjoin="foreign(License.order_id) == Order.id", lazy=True)
 
 
 # user_datastore = SQLAlchemySessionUserDatastore(db.session, User, Role)
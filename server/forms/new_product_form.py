@@ -17,7 +17,10 @@ import structlog
 from pydantic import conlist, validator
 from pydantic.class_validators import root_validator
 
-from server.db.models import Category, Kind, MainCategory, ProductsTable, ShopGroup, Strain, Tag
+from server.crud.crud_main_category import main_category_crud
+from server.crud.crud_strain import strain_crud
+from server.crud.crud_tag import tag_crud
+from server.db.models import Category, Kind, ProductsTable, ShopGroup
 from server.pydantic_forms.core import DisplayOnlyFieldType, FormPage, ReadOnlyField, register_form
 from server.pydantic_forms.types import AcceptItemType, FormGenerator, State, SummaryData
 from server.pydantic_forms.validators import Choice, ListOfTwo, LongText, MarkdownText, MigrationSummary, Timestamp
@@ -51,7 +54,7 @@ def validate_category_name(category_name: str, values: State) -> str:
 
 def validate_strain_name(strain_name: str, values: State) -> str:
     """Check if strain already exists."""
-    strains = Strain.query.all()
+    strains = strain_crud.get_all()
     strain_items = [item.name.lower() for item in strains]
     if strain_name.lower() in strain_items:
         raise ValueError("Deze kruising bestaat al.")
@@ -69,7 +72,7 @@ def validate_shop_group_name(shop_group_name: str, values: State) -> str:
 
 def validate_multiple_strains(strain_names: List[str], values: State) -> List[str]:
     """Check if strains already exist."""
-    strains = Strain.query.all()
+    strains = strain_crud.get_all()
     strain_items = [item.name.lower() for item in strains]
 
     invalid_strains = []
@@ -105,7 +108,7 @@ def validate_combined_strains(cls, values):
 
 def validate_tag_name(tag_name: str, values: State) -> str:
     """Check if tag already exists."""
-    tags = Tag.query.all()
+    tags = tag_crud.get_all()
     tag_items = [item.name.lower() for item in tags]
     if tag_name.lower() in tag_items:
         raise ValueError("Deze tag bestaat al.")
@@ -171,7 +174,7 @@ def create_kind_to_strains_form(current_state: dict) -> FormGenerator:
             "columns": [[str(user_input[nm]) for nm in summary_fields]],
         }
 
-    strains = Strain.query.all()
+    strains = strain_crud.get_all()
 
     StrainChoice = Choice(
         "StrainChoice",
@@ -267,7 +270,7 @@ def create_product_form(current_state: dict) -> FormGenerator:
 
 
 def create_category_form(current_state: dict) -> FormGenerator:
-    main_categories = MainCategory.query.filter(MainCategory.shop_id == current_state["extra_state"]["shop_id"]).all()
+    main_categories = main_category_crud.get_all(shop_id=current_state["extra_state"]["shop_id"])
 
     MainCategoryChoice = Choice(
         "MainCategoryChoice",
@@ -31,6 +31,9 @@ from server.exception_handlers.generic_exception_handlers import problem_detail_
 from server.pydantic_forms.exception_handlers.fastapi import form_error_handler
 from server.pydantic_forms.exceptions import FormException
 from server.settings import app_settings
+from server.utils.compression import CompressionMiddleware
+from server.utils.order_events import OrderEventListener
+from server.utils.outbox import OutboxDispatcher
 from server.version import GIT_COMMIT_HASH
 
 structlog.configure(
@@ -68,6 +71,12 @@ app.include_router(api_router, prefix="/v1")
 
 app.add_middleware(SessionMiddleware, secret_key=app_settings.SESSION_SECRET)
 app.add_middleware(DBSessionMiddleware, database=db)
+if app_settings.COMPRESSION_ENABLED:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=app_settings.COMPRESSION_MINIMUM_SIZE,
+        cacheable_paths=["/v1/kinds", "/v1/categories", "/v1/main-categories", "/v1/openapi.json"],
+    )
 origins = app_settings.CORS_ORIGINS.split(",")
 app.add_middleware(
     CORSMiddleware,
@@ -81,6 +90,19 @@ app.add_exception_handler(FormException, form_error_handler)
 app.add_exception_handler(ProblemDetailException, problem_detail_handler)
 
 
+if app_settings.OUTBOX_DISPATCHER_ENABLED:
+    # Not started on Lambda (lifespan is off there): the order endpoints deliver the outbox themselves
+    outbox_dispatcher = OutboxDispatcher(app_settings.OUTBOX_DISPATCH_INTERVAL)
+    app.add_event_handler("startup", outbox_dispatcher.start)
+    app.add_event_handler("shutdown", outbox_dispatcher.stop)
+
+
+if app_settings.ORDER_EVENTS_BACKEND == "postgres":
+    order_event_listener = OrderEventListener()
+    app.add_event_handler("startup", order_event_listener.start)
+    app.add_event_handler("shutdown", order_event_listener.stop)
+
+
 @app.router.get("/", response_model=str, response_class=JSONResponse, include_in_schema=False)
 def index() -> str:
     return "FastAPI boilerplate backend root"
@@ -67,6 +67,29 @@ class OrderCreated(OrderBase):
     table_name: Optional[str]
 
 
+# An order of a batch, all orders of a batch are for the same shop
+class OrderBatchItem(OrderBase):
+    order_info: List[OrderItem]
+    client_reference: Optional[str]  # Echoed in the result, e.g. the id of the order in the queue of the kiosk
+
+
+class OrderBatchCreate(BoilerplateBaseModel):
+    shop_id: UUID
+    orders: List[OrderBatchItem]
+
+
+class OrderBatchResult(BoilerplateBaseModel):
+    index: int
+    client_reference: Optional[str]
+    order: Optional[OrderCreated]
+    error: Optional[str]  # Same detail as the error of `POST /orders` for this order
+
+
+class OrderBatchCreated(BoilerplateBaseModel):
+    shop_id: UUID
+    results: List[OrderBatchResult]
+
+
 # Properties to receive via API on update
 class OrderUpdate(OrderBase):
     shop_id: UUID
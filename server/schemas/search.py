@@ -0,0 +1,26 @@
+# Copyright 2024 René Dohmen <acidjunk@gmail.com>
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from typing import Optional
+from uuid import UUID
+
+from server.schemas.base import BoilerplateBaseModel
+
+
+class SearchResult(BoilerplateBaseModel):
+    type: str  # kind or product
+    id: UUID
+    name: str
+    short_description_nl: Optional[str]
+    short_description_en: Optional[str]
+    shop_group_id: Optional[UUID]
+    rank: float
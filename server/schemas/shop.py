@@ -10,8 +10,8 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from datetime import datetime
-from typing import List, Optional
+from datetime import date, datetime
+from typing import List, Optional, Union
 from uuid import UUID
 
 from server.schemas.base import BoilerplateBaseModel
@@ -58,6 +58,12 @@ class ShopWithPrices(ShopInDBBase):
     prices: List[dict]
 
 
+class ShopPriceListChanges(BoilerplateBaseModel):
+    cursor: str
+    prices: List[dict]
+    deleted: List[UUID]
+
+
 class ShopCacheStatus(ShopEmptyBase):
     modified_at: Optional[datetime]
 
@@ -72,3 +78,26 @@ class ShopLastPendingOrder(ShopEmptyBase):
 
 class ShopIp(BoilerplateBaseModel):
     ip: str
+
+
+class ShopStatsPeriod(BoilerplateBaseModel):
+    start: Union[datetime, date]  # Hour in UTC or day in the timezone of the shops
+    orders: int
+    revenue: float
+    grams: float
+
+
+class ShopStatsProduct(BoilerplateBaseModel):
+    id: UUID
+    name: Optional[str]
+    quantity: int
+    revenue: float
+    grams: float
+
+
+class ShopStats(BoilerplateBaseModel):
+    granularity: str
+    start: datetime
+    end: datetime
+    periods: List[ShopStatsPeriod]
+    products: List[ShopStatsProduct]
@@ -74,6 +74,7 @@ class AppSettings(BaseSettings):
         "Pragma",
         "Content-Range",
         "ETag",
+        "X-Next-Cursor",
     ]
     SWAGGER_PORT: int = 8080
     ENVIRONMENT: str = "local"
@@ -97,6 +98,40 @@ class AppSettings(BaseSettings):
     MAX_WORKERS: int = 5
     CACHE_HOST: str = "127.0.0.1"
     CACHE_PORT: int = 6379
+    # In process snapshot cache for the shop price lists (see server/utils/cache.py)
+    SHOP_CACHE_ENABLED: bool = True
+    SHOP_CACHE_MAX_ENTRIES: int = 256
+    SHOP_CACHE_TTL: int = 60  # seconds; safety net for writes that don't call invalidateShopCache()
+    # In process cache of tags, flavors, strains, main categories and roles (see CRUDBase and server/utils/cache.py)
+    REFERENCE_CACHE_ENABLED: bool = True
+    REFERENCE_CACHE_MAX_ENTRIES: int = 1024
+    REFERENCE_CACHE_TTL: int = 60  # seconds; the writes of other workers show up after this
+    # Brotli/gzip response compression (see server/utils/compression.py)
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MINIMUM_SIZE: int = 500
+    COMPRESSION_CACHE_MAX_ENTRIES: int = 128
+    # Static price list files published by invalidateShopCache() (see server/utils/artifacts.py)
+    PRICE_LIST_ARTIFACTS_ENABLED: bool = False
+    PRICE_LIST_ARTIFACTS_BACKEND: str = "local"  # "local" or "s3" (uses the downloads bucket)
+    PRICE_LIST_ARTIFACTS_DIR: str = "artifacts"
+    PRICE_LIST_ARTIFACTS_PREFIX: str = "price-lists"
+    # Largest price list patch sent in a websocket message; bigger changes only send the new cursor
+    WEBSOCKET_PATCH_MAX_BYTES: int = 64000
+    # Timezone of the days of the shops, for the order numbers and sales statistics
+    SHOP_TIMEZONE: str = "Europe/Amsterdam"
+    # Start the customer order numbers of every shop at 1 each day
+    ORDER_NUMBER_DAILY_RESET: bool = False
+    # Background delivery of the order outbox in the API workers (see server/utils/outbox.py)
+    OUTBOX_DISPATCHER_ENABLED: bool = True
+    OUTBOX_DISPATCH_INTERVAL: float = 1.0  # seconds
+    # Pending order event streams (see server/utils/order_events.py)
+    ORDER_EVENTS_BACKEND: str = "local"  # "local" for a single worker, "postgres" (LISTEN/NOTIFY) for several
+    ORDER_EVENTS_TIMEOUT: int = 300  # seconds; clients reconnect after that
+    ORDER_EVENTS_KEEPALIVE: int = 15  # seconds
+    # Monthly partitions of the orders table (see server/utils/order_partitions.py)
+    ORDER_PARTITIONS_AHEAD: int = 3  # months created in advance
+    ORDER_PARTITIONS_ARCHIVE_AFTER: int = 0  # months after which a partition is detached; 0 keeps them all
+    ORDER_PARTITIONS_ARCHIVE_SCHEMA: str = "archive"  # schema of the detached partitions; empty drops them
     POST_MORTEM_DEBUGGER: str = ""
     SERVICE_NAME: str = "Prijslijst backend"
     LOGGING_HOST: str = "localhost"
@@ -0,0 +1,144 @@
+# Copyright 2024 René Dohmen <acidjunk@gmail.com>
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Static, pre-rendered, price list artifacts.
+
+On every `invalidateShopCache()` the price list of the shop is rendered once per variant and written as an immutable,
+content-hashed, JSON file. A small `manifest.json` per shop points to the current files, so kiosks and the CDN can
+fetch the price lists without touching the API::
+
+    price-lists/<shop_id>/manifest.json
+    price-lists/<shop_id>/all.<hash>.json
+    price-lists/<shop_id>/horeca.<hash>.json
+    price-lists/<shop_id>/cannabis.<hash>.json
+"""
+import hashlib
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+
+import boto3
+import structlog
+from fastapi.encoders import jsonable_encoder
+
+from server.crud.crud_shop_price_list import PRICE_LIST_FIELDS, shop_price_list_crud
+from server.db.models import Shop
+from server.schemas.shop import ShopWithPrices
+from server.settings import app_settings
+from server.utils.json import json_dumps
+from server.utils.price_list_encoding import JSON_MEDIA_TYPE, encode_price_list
+
+logger = structlog.get_logger(__name__)
+
+# Variant name per value of the `is_horeca` query parameter of the price list
+PRICE_LIST_VARIANTS = {None: "all", True: "horeca", False: "cannabis"}
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+MANIFEST_CACHE_CONTROL = "public, max-age=10"
+
+
+def render_price_list(shop: Shop, is_horeca: Optional[bool] = None, media_type: str = JSON_MEDIA_TYPE) -> bytes:
+    """Render the document of `GET /shops/{id}` for one variant of the price list."""
+    rows = shop_price_list_crud.get_by_shop_id(shop_id=shop.id, is_horeca=is_horeca)
+    shop.prices = [{field: getattr(row, field) for field in PRICE_LIST_FIELDS} for row in rows]
+    return encode_price_list(jsonable_encoder(ShopWithPrices.from_orm(shop)), media_type)
+
+
+class ArtifactStorage(ABC):
+    """Where the artifacts are published; keys are `/` separated paths."""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def write(self, key: str, content: bytes, cache_control: str) -> None:
+        ...
+
+
+class LocalArtifactStorage(ArtifactStorage):
+    """Publish to a local directory, e.g. the document root of a web server."""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self.directory, key))
+
+    def write(self, key: str, content: bytes, cache_control: str) -> None:
+        path = os.path.join(self.directory, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Readers never see a half written file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            # mkstemp creates the file for our user only, the files are published to be read by others
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+class S3ArtifactStorage(ArtifactStorage):
+    """Publish to an S3 bucket."""
+
+    def __init__(self, bucket: str, client: Optional[object] = None) -> None:
+        self.bucket = bucket
+        self.client = client or boto3.client(
+            "s3",
+            aws_access_key_id=app_settings.S3_BUCKET_DOWNLOADS_ACCESS_KEY_ID,
+            aws_secret_access_key=app_settings.S3_BUCKET_DOWNLOADS_SECRET_ACCESS_KEY,
+            region_name="eu-central-1",
+        )
+
+    def exists(self, key: str) -> bool:
+        response = self.client.list_objects_v2(Bucket=self.bucket, Prefix=key, MaxKeys=1)
+        return any(item["Key"] == key for item in response.get("Contents", []))
+
+    def write(self, key: str, content: bytes, cache_control: str) -> None:
+        self.client.put_object(
+            Bucket=self.bucket, Key=key, Body=content, ContentType="application/json", CacheControl=cache_control
+        )
+
+
+def get_artifact_storage() -> ArtifactStorage:
+    if app_settings.PRICE_LIST_ARTIFACTS_BACKEND == "s3":
+        return S3ArtifactStorage(app_settings.S3_BUCKET_DOWNLOADS_NAME)
+    return LocalArtifactStorage(app_settings.PRICE_LIST_ARTIFACTS_DIR)
+
+
+def publish_price_list(shop: Shop, storage: Optional[ArtifactStorage] = None) -> Dict[str, str]:
+    """Render and publish all variants of the price list of a shop; returns the key per variant.
+
+    Files that already exist are not written again: same content, same name.
+    """
+    storage = storage or get_artifact_storage()
+    prefix = f"{app_settings.PRICE_LIST_ARTIFACTS_PREFIX}/{shop.id}"
+    keys = {}
+    for is_horeca, variant in PRICE_LIST_VARIANTS.items():
+        content = render_price_list(shop, is_horeca)
+        key = f"{prefix}/{variant}.{hashlib.sha256(content).hexdigest()[:16]}.json"
+        if not storage.exists(key):
+            storage.write(key, content, IMMUTABLE_CACHE_CONTROL)
+        keys[variant] = key
+
+    manifest = {
+        "shop_id": shop.id,
+        "modified_at": shop.modified_at,
+        "variants": {variant: key.rsplit("/", 1)[1] for variant, key in keys.items()},
+    }
+    storage.write(f"{prefix}/manifest.json", json_dumps(manifest).encode(), MANIFEST_CACHE_CONTROL)
+    logger.info("Published price list artifacts", shop_id=str(shop.id), keys=keys)
+    return keys
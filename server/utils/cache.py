@@ -0,0 +1,157 @@
+# Copyright 2024 René Dohmen <acidjunk@gmail.com>
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import structlog
+
+from server.settings import app_settings
+
+logger = structlog.get_logger(__name__)
+
+
+class SnapshotCache:
+    """Per-worker cache of pre-serialized snapshots.
+
+    Entries are stored per `(key, variant)` together with the content version they were rendered from. A lookup only
+    hits when the caller asks for exactly that version, so a version bump in the database (e.g. `Shop.modified_at`)
+    is enough to make every worker re-render, even the ones that never saw the invalidation. `invalidate()` drops the
+    entries of a key in this worker right away.
+
+    Next to the snapshot itself an entry can hold encoded (compressed) copies of it, stored per `encoding`, so each
+    variant is compressed once per version. The cache is bounded in size (least recently used entries are evicted
+    first) and entries expire after `ttl` seconds as a safety net for writes that don't bump the version.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: int = 60) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[Hashable, Hashable], Tuple[Any, float, Dict[Optional[str], bytes]]]" = (
+            OrderedDict()
+        )
+        self._lock = Lock()
+
+    def get(self, key: Hashable, variant: Hashable, version: Any, encoding: Optional[str] = None) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get((key, variant))
+            if entry is None:
+                return None
+            entry_version, created_at, contents = entry
+            if entry_version != version or (self.ttl and monotonic() - created_at > self.ttl):
+                del self._entries[(key, variant)]
+                return None
+            self._entries.move_to_end((key, variant))
+            return contents.get(encoding)
+
+    def set(
+        self, key: Hashable, variant: Hashable, version: Any, content: bytes, encoding: Optional[str] = None
+    ) -> None:
+        with self._lock:
+            entry = self._entries.get((key, variant))
+            if entry is not None and entry[0] == version:
+                # Another encoding of the same snapshot
+                entry[2][encoding] = content
+            else:
+                self._entries[(key, variant)] = (version, monotonic(), {encoding: content})
+            self._entries.move_to_end((key, variant))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            for entry_key in [entry_key for entry_key in self._entries if entry_key[0] == key]:
+                del self._entries[entry_key]
+        logger.debug("Invalidated snapshot cache", key=str(key))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+shop_price_list_cache = SnapshotCache(max_entries=app_settings.SHOP_CACHE_MAX_ENTRIES, ttl=app_settings.SHOP_CACHE_TTL)
+# Holds the (small, immutable) availability index per shop instead of serialized content; same versioning on
+# `Shop.modified_at`
+shop_availability_cache = SnapshotCache(
+    max_entries=app_settings.SHOP_CACHE_MAX_ENTRIES, ttl=app_settings.SHOP_CACHE_TTL
+)
+
+
+class ReferenceCache:
+    """Per-worker read-through cache of rarely changing rows, like tags, flavors and roles.
+
+    `get_or_load()` returns the cached value of a key or stores what `load()` returns, None included, so a lookup of
+    a missing row is cached as well. Writes clear the whole cache with `invalidate()`: the reference tables are small
+    and a write can change the result of any lookup (by id, by name or of all rows). Other workers don't see the
+    invalidation, so entries expire after `ttl` seconds; the cache holds at most `max_entries` entries and evicts the
+    least recently used ones first. `hits` and `misses` count the lookups, see `stats()`.
+    """
+
+    def __init__(self, name: str, max_entries: int = 1024, ttl: int = 60, enabled: bool = True) -> None:
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._lock = Lock()
+        reference_caches[name] = self
+
+    def get_or_load(self, key: Hashable, load: Callable[[], Any]) -> Any:
+        if not self.enabled:
+            return load()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not (self.ttl and monotonic() - entry[1] > self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        # Loaded outside the lock: a concurrent miss of the same key loads it twice, which is harmless
+        value = load()
+        with self._lock:
+            self._entries[key] = (value, monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        logger.debug("Invalidated reference cache", name=self.name)
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# All reference caches by name, see `ReferenceCache`
+reference_caches: Dict[str, ReferenceCache] = {}
+
+
+def reference_cache(name: str) -> ReferenceCache:
+    """A reference cache with the limits of the settings, for the `cache` of a CRUD object."""
+    return ReferenceCache(
+        name,
+        max_entries=app_settings.REFERENCE_CACHE_MAX_ENTRIES,
+        ttl=app_settings.REFERENCE_CACHE_TTL,
+        enabled=app_settings.REFERENCE_CACHE_ENABLED,
+    )
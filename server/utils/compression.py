@@ -0,0 +1,205 @@
+# Copyright 2024 René Dohmen <acidjunk@gmail.com>
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Brotli and gzip response compression.
+
+`CompressionMiddleware` compresses responses for clients that send a matching `Accept-Encoding`. Responses that
+already have a `Content-Encoding` are left alone: the shop price list endpoint serves compressed copies straight
+from its snapshot cache. For the `cacheable_paths` the compressed body is cached on a digest of the uncompressed
+body, so unchanged content is compressed once instead of on every request.
+"""
+import gzip
+import hashlib
+import zlib
+from typing import Iterable, Optional
+
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from server.settings import app_settings
+from server.utils.cache import SnapshotCache
+
+# In order of preference when a client accepts both
+ENCODINGS = ("br", "gzip")
+
+# Fast settings for compression on the fly, better ones for content that is compressed once and served many times
+BROTLI_QUALITY = 4
+BROTLI_QUALITY_CACHED = 9
+GZIP_LEVEL = 6
+GZIP_LEVEL_CACHED = 9
+
+COMPRESSIBLE_MEDIA_TYPES = ("application/json", "application/msgpack", "application/javascript", "application/xml")
+
+compressed_response_cache = SnapshotCache(max_entries=app_settings.COMPRESSION_CACHE_MAX_ENTRIES, ttl=0)
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """The supported content coding a client prefers according to its `Accept-Encoding` header, if any."""
+    candidates = []
+    for part in (accept_encoding or "").split(","):
+        coding, *parameters = [item.strip() for item in part.split(";")]
+        quality = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding.lower() in ENCODINGS and quality > 0:
+            candidates.append((-quality, ENCODINGS.index(coding.lower()), coding.lower()))
+    return min(candidates)[2] if candidates else None
+
+
+def compress(content: bytes, encoding: str, cached: bool = False) -> bytes:
+    """Compress `content`; `cached` trades CPU for size, for content that is compressed once and served many times."""
+    if encoding == "br":
+        return brotli.compress(content, quality=BROTLI_QUALITY_CACHED if cached else BROTLI_QUALITY)
+    return gzip.compress(content, compresslevel=GZIP_LEVEL_CACHED if cached else GZIP_LEVEL)
+
+
+def is_compressible(media_type: str) -> bool:
+    media_type = media_type.split(";")[0].strip().lower()
+    if media_type == "text/event-stream":
+        # The compressor would hold the events back
+        return False
+    return (
+        media_type.startswith("text/")
+        or media_type in COMPRESSIBLE_MEDIA_TYPES
+        or media_type.endswith(("+json", "+msgpack", "+xml"))
+    )
+
+
+class StreamCompressor:
+    """Incremental compressor for streamed responses."""
+
+    def __init__(self, encoding: str) -> None:
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 500,
+        cacheable_paths: Iterable[str] = (),
+        cache: Optional[SnapshotCache] = None,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cacheable_paths = tuple(cacheable_paths)
+        self.cache = cache if cache is not None else compressed_response_cache
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"))
+            if encoding:
+                cache_key = None
+                if scope["path"].startswith(self.cacheable_paths):
+                    cache_key = (scope["path"], scope.get("query_string", b""))
+                responder = CompressionResponder(self.app, encoding, self.minimum_size, self.cache, cache_key)
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+class CompressionResponder:
+    def __init__(
+        self, app: ASGIApp, encoding: str, minimum_size: int, cache: SnapshotCache, cache_key: Optional[tuple]
+    ) -> None:
+        self.app = app
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.cache = cache
+        self.cache_key = cache_key
+        self.send: Send = unattached_send
+        self.initial_message: Message = {}
+        self.started = False
+        self.passthrough = False
+        self.compressor: Optional[StreamCompressor] = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message: Message) -> None:
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            # Hold back the headers until we know whether the body will be compressed
+            self.initial_message = message
+            return
+        if message_type != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if not self.started:
+            self.started = True
+            headers = MutableHeaders(raw=self.initial_message["headers"])
+            self.passthrough = (
+                "content-encoding" in headers
+                or not is_compressible(headers.get("content-type", ""))
+                or (len(body) < self.minimum_size and not more_body)
+            )
+            if self.passthrough:
+                await self.send(self.initial_message)
+                await self.send(message)
+                return
+
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if more_body:
+                del headers["Content-Length"]
+                self.compressor = StreamCompressor(self.encoding)
+                message["body"] = self.compressor.compress(body)
+            else:
+                message["body"] = self.compress_body(body)
+                headers["Content-Length"] = str(len(message["body"]))
+            await self.send(self.initial_message)
+            await self.send(message)
+        elif self.passthrough:
+            await self.send(message)
+        else:
+            message["body"] = self.compressor.compress(body)
+            if not more_body:
+                message["body"] += self.compressor.finish()
+            await self.send(message)
+
+    def compress_body(self, body: bytes) -> bytes:
+        if self.cache_key is None:
+            return compress(body, self.encoding)
+        digest = hashlib.blake2b(body, digest_size=16).digest()
+        compressed = self.cache.get(self.cache_key, None, digest, self.encoding)
+        if compressed is None:
+            compressed = compress(body, self.encoding, cached=True)
+            self.cache.set(self.cache_key, None, digest, compressed, self.encoding)
+        return compressed
+
+
+async def unattached_send(message: Message) -> None:
+    raise RuntimeError("send awaitable not set")  # pragma: no cover
@@ -56,3 +56,16 @@ def nowtz() -> datetime:
 
     """
     return datetime.now(tz=pytz.utc)
+
+
+def naive_utc(dt: datetime) -> datetime:
+    """Convert a datetime to a naive datetime in UTC, the way they are stored in the database.
+
+    Args:
+        dt: naive (assumed UTC) or timezone aware datetime object
+
+    Returns:
+        Naive datetime object in UTC
+
+    """
+    return dt.astimezone(pytz.utc).replace(tzinfo=None) if dt.tzinfo else dt
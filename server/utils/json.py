@@ -100,6 +100,11 @@ def json_dumps(obj: PY_JSON_TYPES) -> str:
     return json.dumps(obj, default=to_serializable)
 
 
+def json_dumps_response(obj: PY_JSON_TYPES) -> str:
+    """Serialize like FastAPI's `jsonable_encoder()` does: datetimes with full precision, for hand built responses."""
+    return json.dumps(obj, default=to_serializable, datetime_mode=json.DM_ISO8601, uuid_mode=json.UM_CANONICAL)
+
+
 def to_serializable(o: Any) -> Any:
     """Convert an object into an object that the JSON encode can serialize.
 
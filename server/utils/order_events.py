@@ -0,0 +1,146 @@
+# Copyright 2024 René Dohmen <acidjunk@gmail.com>
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Notifications of committed order changes, for the order event streams of `GET /orders/shop/{id}/pending/events`.
+
+`order_events` fans the `(shop_id, order_id)` of changed orders out to the streams of this worker. How changes get
+there depends on `ORDER_EVENTS_BACKEND`:
+
+- `local`: the changes of a session are published when it commits. Only streams in the same process see them, so
+  this is for a single worker (and the tests).
+- `postgres`: the changes are sent with `NOTIFY`, which Postgres delivers on commit to every listening connection.
+  Each worker runs an `OrderEventListener` that forwards them to its own streams.
+"""
+import asyncio
+import select
+from collections import defaultdict
+from threading import Event, Lock, Thread
+from typing import Any, Dict, Iterable, Set, Tuple
+from uuid import UUID
+
+import structlog
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from sqlalchemy import event, text
+
+from server.db import db
+from server.db.database import WrappedSession
+from server.settings import app_settings
+
+logger = structlog.get_logger(__name__)
+
+NOTIFY_CHANNEL = "order_events"
+
+
+class Subscription:
+    """The order changes of one shop for one stream; created and read on the event loop of the stream."""
+
+    def __init__(self, shop_id: UUID) -> None:
+        self.shop_id = shop_id
+        self.loop = asyncio.get_event_loop()
+        self.queue: "asyncio.Queue[UUID]" = asyncio.Queue()
+
+
+class OrderEvents:
+    """In process fan out of order changes to the subscriptions of their shop; `publish()` is thread safe."""
+
+    def __init__(self) -> None:
+        self._subscriptions: Dict[UUID, Set[Subscription]] = defaultdict(set)
+        self._lock = Lock()
+
+    def subscribe(self, shop_id: UUID) -> Subscription:
+        subscription = Subscription(shop_id)
+        with self._lock:
+            self._subscriptions[shop_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.shop_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.shop_id, None)
+
+    def publish(self, shop_id: UUID, order_id: UUID) -> None:
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(shop_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.queue.put_nowait, order_id)
+            except RuntimeError:
+                # The loop of a stream that is going away
+                self.unsubscribe(subscription)
+
+
+order_events = OrderEvents()
+
+
+def notify_order_changes(session: WrappedSession, changes: Iterable[Tuple[UUID, UUID]]) -> None:
+    """Announce the `(shop_id, order_id)` of changed orders once the transaction of `session` commits."""
+    changes = list(changes)
+    if app_settings.ORDER_EVENTS_BACKEND == "postgres":
+        session.execute(
+            text("SELECT pg_notify(:channel, :payload)"),
+            [{"channel": NOTIFY_CHANNEL, "payload": f"{shop_id}:{order_id}"} for shop_id, order_id in changes],
+        )
+    else:
+        session.info.setdefault("order_events", []).extend(changes)
+
+
+@event.listens_for(WrappedSession, "after_commit")
+def publish_order_events(session: WrappedSession) -> None:
+    for shop_id, order_id in session.info.pop("order_events", ()):
+        order_events.publish(shop_id, order_id)
+
+
+@event.listens_for(WrappedSession, "after_rollback")
+def discard_order_events(session: WrappedSession) -> None:
+    session.info.pop("order_events", None)
+
+
+class OrderEventListener(Thread):
+    """Forward the order change notifications of all workers to the streams of this worker."""
+
+    def __init__(self, poll_interval: float = 1.0, retry_interval: float = 5.0) -> None:
+        super().__init__(name="order-event-listener", daemon=True)
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self._stopped = Event()
+
+    def run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                self.listen()
+            except Exception:
+                logger.exception("Order event listener failed, reconnecting")
+                self._stopped.wait(self.retry_interval)
+
+    def listen(self) -> None:
+        # A connection of its own: it stays in autocommit mode with a LISTEN for as long as the worker runs
+        connection: Any = db.engine.raw_connection()
+        connection.detach()
+        try:
+            dbapi_connection = connection.connection
+            dbapi_connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            dbapi_connection.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+            while not self._stopped.is_set():
+                if select.select([dbapi_connection], [], [], self.poll_interval) == ([], [], []):
+                    continue
+                dbapi_connection.poll()
+                while dbapi_connection.notifies:
+                    notify = dbapi_connection.notifies.pop(0)
+                    shop_id, _, order_id = notify.payload.partition(":")
+                    order_events.publish(UUID(shop_id), UUID(order_id))
+        finally:
+            connection.close()
+
+    def stop(self) -> None:
+        self._stopped.set()
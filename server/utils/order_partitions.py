@@ -0,0 +1,152 @@
+# Copyright 2024 René Dohmen <acidjunk@gmail.com>
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Maintenance of the monthly partitions of the `orders` table.
+
+`orders` is partitioned by range on `created_at`, one partition per month named `orders_YYYY_MM`. Orders outside the
+existing partitions end up in `orders_default`, so inserts never fail when the maintenance didn't run in time.
+
+Run `python -m server.utils.order_partitions` daily (e.g. from cron). It:
+- creates the partitions of the current month and the next `ORDER_PARTITIONS_AHEAD` months, moving matching orders
+  out of the default partition;
+- when `ORDER_PARTITIONS_ARCHIVE_AFTER` is set, detaches the partitions of the months that ended longer ago and moves
+  them to the `ORDER_PARTITIONS_ARCHIVE_SCHEMA` schema (or drops them when that is empty). Archived orders are no longer
+  visible to the API; the sales statistics keep counting them. Partitions with pending orders are left alone.
+"""
+import argparse
+import re
+from datetime import date, datetime
+from typing import List, Optional
+
+import structlog
+from sqlalchemy import text
+
+from server.db import db
+from server.settings import app_settings
+
+logger = structlog.get_logger(__name__)
+
+DEFAULT_PARTITION = "orders_default"
+PARTITION_NAME = re.compile(r"^orders_(\d{4})_(\d{2})$")
+
+
+def add_months(month: date, months: int) -> date:
+    """The first day of the month `months` months after (or before) the month of `month`."""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"orders_{month:%Y_%m}"
+
+
+def get_partitions() -> List[date]:
+    """The months that have a partition, oldest first."""
+    rows = db.session.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = 'orders'::regclass"
+        )
+    )
+    matches = [PARTITION_NAME.match(name) for name, in rows]
+    return sorted(date(int(match[1]), int(match[2]), 1) for match in matches if match)
+
+
+def create_partition(month: date) -> None:
+    """Create the partition of a month, moving its orders out of the default partition."""
+    name = partition_name(month)
+    start, end = month, add_months(month, 1)
+    db.session.execute(text(f"CREATE TABLE {name} (LIKE orders INCLUDING DEFAULTS)"))
+    db.session.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= :start AND created_at < :end "
+            f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+        ),
+        {"start": start, "end": end},
+    )
+    # Creates the indexes and foreign keys of `orders` on the partition
+    db.session.execute(
+        text(f"ALTER TABLE orders ATTACH PARTITION {name} FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')")
+    )
+
+
+def ensure_partitions(months_ahead: int, today: Optional[date] = None) -> List[date]:
+    """Create the missing partitions of the current month up to `months_ahead` months ahead; returns their months."""
+    current = (today or datetime.utcnow().date()).replace(day=1)
+    existing = set(get_partitions())
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if month not in existing:
+            create_partition(month)
+            created.append(month)
+    db.session.commit()
+    if created:
+        logger.info("Created order partitions", partitions=[partition_name(month) for month in created])
+    return created
+
+
+def archive_partitions(archive_after: int, schema: str, today: Optional[date] = None) -> List[date]:
+    """Detach the partitions of the months before the last `archive_after` months; returns their months.
+
+    Detached partitions are moved to `schema`, or dropped when `schema` is empty.
+    """
+    if schema and not re.match(r"^[a-z_][a-z0-9_]*$", schema):
+        raise ValueError(f"Invalid schema name: {schema}")
+    cutoff = add_months((today or datetime.utcnow().date()).replace(day=1), -archive_after)
+    archived = []
+    for month in get_partitions():
+        if month >= cutoff:
+            break
+        name = partition_name(month)
+        if db.session.execute(text(f"SELECT EXISTS (SELECT 1 FROM {name} WHERE status = 'pending')")).scalar():
+            logger.warning("Not archiving an order partition with pending orders", partition=name)
+            continue
+        db.session.execute(text(f"ALTER TABLE orders DETACH PARTITION {name}"))
+        if schema:
+            db.session.execute(text(f"CREATE SCHEMA IF NOT EXISTS {schema}"))
+            db.session.execute(text(f"ALTER TABLE {name} SET SCHEMA {schema}"))
+        else:
+            db.session.execute(text(f"DROP TABLE {name}"))
+        archived.append(month)
+    db.session.commit()
+    if archived:
+        logger.info(
+            "Archived order partitions", partitions=[partition_name(month) for month in archived], schema=schema
+        )
+    return archived
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Create and archive the monthly partitions of the orders table.")
+    parser.add_argument("--months-ahead", type=int, default=app_settings.ORDER_PARTITIONS_AHEAD)
+    parser.add_argument(
+        "--archive-after",
+        type=int,
+        default=app_settings.ORDER_PARTITIONS_ARCHIVE_AFTER,
+        help="months to keep attached; 0 keeps all partitions",
+    )
+    parser.add_argument(
+        "--archive-schema",
+        default=app_settings.ORDER_PARTITIONS_ARCHIVE_SCHEMA,
+        help="schema of the detached partitions; empty drops them",
+    )
+    args = parser.parse_args()
+
+    with db.database_scope():
+        ensure_partitions(args.months_ahead)
+        if args.archive_after > 0:
+            archive_partitions(args.archive_after, args.archive_schema)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# Copyright 2024 René Dohmen <acidjunk@gmail.com>
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Delivery of the order outbox.
+
+Every order write adds a message to `outbox_messages` in the same transaction (see `server.crud.crud_order`). The
+dispatcher delivers them afterwards: per shop and topic only the latest message counts, it updates
+`Shop.last_pending_order` / `Shop.last_completed_order` and sends one websocket message. Messages are only removed
+once their websocket message was sent, so delivery is at least once: a failed send is retried by the next run.
+
+Messages are delivered by:
+- a background task after the order endpoints respond, so notifications go out right away;
+- the `OutboxDispatcher` thread of the API workers (`OUTBOX_DISPATCHER_ENABLED`), or `python -m server.utils.outbox`
+  as a separate worker, which picks up whatever is left, e.g. after a failed delivery.
+
+Dispatchers lock the messages they handle with `SKIP LOCKED`, so any number of them can run side by side. The lock
+holds until the delivered messages are removed, so two dispatchers never send the same notification; the sends go
+out before that commit.
+"""
+from collections import defaultdict
+from threading import Event, Thread
+from typing import Dict, List, Tuple
+from uuid import UUID
+
+import structlog
+
+from server.api.helpers import sendMessageToWebSocketServer
+from server.crud.crud_order import COMPLETED_ORDERS, PENDING_ORDERS
+from server.db import db
+from server.db.models import OutboxMessage, Shop
+from server.settings import app_settings
+
+logger = structlog.get_logger(__name__)
+
+# The shop column that points to the latest order of a topic
+SHOP_COLUMNS = {PENDING_ORDERS: "last_pending_order", COMPLETED_ORDERS: "last_completed_order"}
+
+
+def dispatch_outbox(limit: int = 1000) -> int:
+    """Deliver the oldest `limit` messages of the outbox; returns the number of messages delivered and removed."""
+    messages = OutboxMessage.query.order_by(OutboxMessage.id).limit(limit).with_for_update(skip_locked=True).all()
+    if not messages:
+        return 0
+
+    latest: Dict[Tuple[UUID, str], OutboxMessage] = {}
+    message_ids: Dict[Tuple[UUID, str], List[int]] = defaultdict(list)
+    for message in messages:
+        latest[(message.shop_id, message.topic)] = message
+        message_ids[(message.shop_id, message.topic)].append(message.id)
+    for (shop_id, topic), message in latest.items():
+        # Keep `modified_at`: it versions the price list of the shop, which didn't change
+        db.session.execute(
+            Shop.__table__.update()
+            .where(Shop.id == shop_id)
+            .values({SHOP_COLUMNS[topic]: str(message.order_id), "modified_at": Shop.modified_at})
+        )
+
+    # Before the commit, the messages stay locked until they are removed. The orders themselves are already committed:
+    # clients that refetch right away see them.
+    delivered = [
+        message_id
+        for shop_id, topic in latest
+        if sendMessageToWebSocketServer({"connectionType": topic, "shopId": str(shop_id)})
+        for message_id in message_ids[(shop_id, topic)]
+    ]
+    if delivered:
+        OutboxMessage.query.filter(OutboxMessage.id.in_(delivered)).delete(synchronize_session=False)
+    db.session.commit()
+    logger.info(
+        "Dispatched outbox",
+        messages=len(messages),
+        notifications=len(latest),
+        undelivered=len(messages) - len(delivered),
+    )
+    return len(delivered)
+
+
+def deliver_outbox() -> None:
+    """Empty the outbox, in a database scope of its own."""
+    with db.database_scope():
+        try:
+            while dispatch_outbox():
+                pass
+        except Exception:
+            db.session.rollback()
+            logger.exception("Outbox delivery failed")
+
+
+class OutboxDispatcher(Thread):
+    """Deliver the outbox every `interval` seconds until stopped."""
+
+    def __init__(self, interval: float) -> None:
+        super().__init__(name="outbox-dispatcher", daemon=True)
+        self.interval = interval
+        self._stopped = Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            deliver_outbox()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+
+def main() -> None:
+    logger.info("Starting outbox dispatcher", interval=app_settings.OUTBOX_DISPATCH_INTERVAL)
+    dispatcher = OutboxDispatcher(app_settings.OUTBOX_DISPATCH_INTERVAL)
+    dispatcher.start()
+    try:
+        dispatcher.join()
+    except KeyboardInterrupt:
+        dispatcher.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# Copyright 2024 René Dohmen <acidjunk@gmail.com>
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Encodings of a rendered shop price list, selected with the `Accept` header.
+
+- `application/json`: the default, one object per price row.
+- `application/msgpack`: the same document in MessagePack.
+- `application/vnd.pricelist.columnar+json` and `application/vnd.pricelist.columnar+msgpack`: a columnar layout. The
+  category and main category fields are stored once per category in `categories`; `prices` holds one list per field
+  plus a `category` column with the index of the category of each row::
+
+    {"id": ..., "name": ..., "description": ...,
+     "categories": [{"category_id": ..., "category_name": ..., "main_category_name": ..., ...}, ...],
+     "prices": {"category": [0, 0, 1], "id": [...], "kind_name": [...], "one": [...], ...}}
+"""
+from typing import Any, Callable, Dict, List, Optional
+
+import msgpack
+from starlette.responses import JSONResponse
+
+from server.crud.crud_shop_price_list import CATEGORY_FIELDS, KIND_FIELDS, PRICE_LIST_FIELDS, PRODUCT_FIELDS
+
+JSON_MEDIA_TYPE = "application/json"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+COLUMNAR_JSON_MEDIA_TYPE = "application/vnd.pricelist.columnar+json"
+COLUMNAR_MSGPACK_MEDIA_TYPE = "application/vnd.pricelist.columnar+msgpack"
+
+
+def to_columnar(document: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a (JSON compatible) price list document to the columnar layout."""
+    prices = document["prices"]
+    first_row = prices[0] if prices else {}
+    category_fields = [field for field in CATEGORY_FIELDS if field in first_row]
+    fields = [field for field in first_row if field not in category_fields]
+
+    categories: list = []
+    category_indexes: Dict[tuple, int] = {}
+    columns: Dict[str, list] = {"category": [], **{field: [] for field in fields}}
+    for row in prices:
+        category = tuple(row[field] for field in category_fields)
+        if category not in category_indexes:
+            category_indexes[category] = len(categories)
+            categories.append(dict(zip(category_fields, category)))
+        columns["category"].append(category_indexes[category])
+        for field in fields:
+            columns[field].append(row[field])
+
+    return {
+        **{key: value for key, value in document.items() if key != "prices"},
+        "categories": categories,
+        "prices": columns,
+    }
+
+
+def from_columnar(document: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a columnar price list document back to one object per price row."""
+    columns = dict(document["prices"])
+    category_column = columns.pop("category")
+    prices = []
+    for index, category in enumerate(category_column):
+        row = {**document["categories"][category], **{field: values[index] for field, values in columns.items()}}
+        prices.append({field: row[field] for field in PRICE_LIST_FIELDS if field in row})
+    return {
+        **{key: value for key, value in document.items() if key not in ("categories", "prices")},
+        "prices": prices,
+    }
+
+
+def deduplicate_price_lists(shops: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Move the category, kind and product fields of the rows of several price lists to shared lookup sections.
+
+    Takes price list documents and returns::
+
+        {"shops": [{"id": ..., "name": ..., "prices": [{"id": ..., "category_id": ..., "kind_id": ..., ...}]}],
+         "categories": {<category_id>: {"category_name": ..., "main_category_name": ..., ...}},
+         "kinds": {<kind_id>: {"kind_name": ..., "strains": [...], ...}},
+         "products": {<product_id>: {"product_name": ..., ...}}}
+    """
+    lookups: Dict[str, Dict[str, Dict[str, Any]]] = {"categories": {}, "kinds": {}, "products": {}}
+    sections = (
+        ("categories", "category_id", CATEGORY_FIELDS),
+        ("kinds", "kind_id", KIND_FIELDS),
+        ("products", "product_id", PRODUCT_FIELDS),
+    )
+    shared_fields = {field for _, key, fields in sections for field in fields if field != key}
+    result = []
+    for shop in shops:
+        prices = []
+        for row in shop["prices"]:
+            for section, key, fields in sections:
+                if row[key] is not None and str(row[key]) not in lookups[section]:
+                    lookups[section][str(row[key])] = {field: row[field] for field in fields if field != key}
+            prices.append({field: value for field, value in row.items() if field not in shared_fields})
+        result.append({**shop, "prices": prices})
+    return {"shops": result, **lookups}
+
+
+def encode_json(document: Dict[str, Any]) -> bytes:
+    return JSONResponse(document).body
+
+
+def encode_msgpack(document: Dict[str, Any]) -> bytes:
+    return msgpack.packb(document, use_bin_type=True)
+
+
+ENCODERS: Dict[str, Callable[[Dict[str, Any]], bytes]] = {
+    JSON_MEDIA_TYPE: encode_json,
+    MSGPACK_MEDIA_TYPE: encode_msgpack,
+    COLUMNAR_JSON_MEDIA_TYPE: lambda document: encode_json(to_columnar(document)),
+    COLUMNAR_MSGPACK_MEDIA_TYPE: lambda document: encode_msgpack(to_columnar(document)),
+}
+
+
+def encode_price_list(document: Dict[str, Any], media_type: str = JSON_MEDIA_TYPE) -> bytes:
+    return ENCODERS[media_type](document)
+
+
+def negotiate_media_type(accept: Optional[str]) -> str:
+    """The supported media type a client prefers according to its `Accept` header; JSON when it has no preference."""
+    candidates = []
+    for position, part in enumerate((accept or "").split(",")):
+        media_type, *parameters = [item.strip() for item in part.split(";")]
+        quality = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type.lower() in ENCODERS and quality > 0:
+            candidates.append((-quality, position, media_type.lower()))
+    return min(candidates)[2] if candidates else JSON_MEDIA_TYPE
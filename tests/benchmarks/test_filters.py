@@ -0,0 +1,66 @@
+"""Latency of the list filters: the type aware predicates of `server.db.filters` against the text match on every
+column they replaced.
+
+Needs the test database (see `tests/unit_tests/conftest.py`). Run with::
+
+    pytest tests/benchmarks/test_filters.py -m benchmark --benchmark-columns=mean,median,ops
+
+The plan of each query (index or sequential scan) is reported in the `extra_info` of the benchmarks.
+"""
+import uuid
+
+import pytest
+from sqlalchemy import String, cast
+
+from server.db import db
+from server.db.filters import compile_filter
+from server.db.models import Kind
+from tests.unit_tests.conftest import database, db_session, db_uri  # noqa: F401
+
+# Left out of the default run, see `[tool.pytest.ini_options]` in pyproject.toml
+pytestmark = pytest.mark.benchmark
+
+KINDS = 20000
+
+FILTERS = {
+    "uuid": ("id", None),
+    "boolean": ("i", "true"),
+    "text": ("name", "haze 1234"),
+}
+
+
+def previous_filter(column, value):
+    """The predicate the list endpoints used for every column."""
+    return cast(column, String).ilike("%" + value + "%")
+
+
+@pytest.fixture
+def kinds():
+    ids = [uuid.uuid4() for _ in range(KINDS)]
+    db.session.execute(
+        Kind.__table__.insert(),
+        [{"id": id, "name": f"Haze {number}", "i": number % 2 == 0} for number, id in enumerate(ids)],
+    )
+    db.session.execute("ANALYZE kinds")
+    return ids
+
+
+def plan(query):
+    statement = query.statement.compile(dialect=db.session.connection().dialect)
+    result = db.session.connection().execute(f"EXPLAIN (FORMAT JSON) {statement}", statement.params).scalar()
+    node = result[0]["Plan"]
+    while "Plans" in node and node["Node Type"] not in ("Index Scan", "Bitmap Heap Scan", "Seq Scan"):
+        node = node["Plans"][0]
+    return node["Node Type"]
+
+
+@pytest.mark.parametrize("filter_name", list(FILTERS))
+@pytest.mark.parametrize("compiler", [previous_filter, compile_filter], ids=["previous", "typed"])
+def test_filter(benchmark, kinds, filter_name, compiler):
+    key, value = FILTERS[filter_name]
+    value = value or str(kinds[KINDS // 2])
+    query = db.session.query(Kind.id).filter(compiler(getattr(Kind, key), value))
+    benchmark.group = filter_name
+    benchmark.extra_info["plan"] = plan(query)
+    rows = benchmark(query.all)
+    assert rows
@@ -0,0 +1,141 @@
+"""Size and latency of the price list encodings.
+
+Run with::
+
+    pytest tests/benchmarks -m benchmark --benchmark-columns=mean,median,ops
+
+The encoded and gzipped sizes are reported in the `extra_info` of each benchmark (`--benchmark-json`), relative to
+JSON by `test_price_list_encoding_sizes`.
+"""
+import gzip
+import uuid
+from datetime import datetime
+
+import msgpack
+import pytest
+import rapidjson
+
+from server.crud.crud_shop_price_list import PRICE_LIST_FIELDS
+from server.utils.price_list_encoding import (
+    COLUMNAR_JSON_MEDIA_TYPE,
+    COLUMNAR_MSGPACK_MEDIA_TYPE,
+    ENCODERS,
+    JSON_MEDIA_TYPE,
+    MSGPACK_MEDIA_TYPE,
+    from_columnar,
+)
+
+# Left out of the default run, see `[tool.pytest.ini_options]` in pyproject.toml
+pytestmark = pytest.mark.benchmark
+
+DECODERS = {
+    JSON_MEDIA_TYPE: rapidjson.loads,
+    MSGPACK_MEDIA_TYPE: msgpack.unpackb,
+    COLUMNAR_JSON_MEDIA_TYPE: lambda content: from_columnar(rapidjson.loads(content)),
+    COLUMNAR_MSGPACK_MEDIA_TYPE: lambda content: from_columnar(msgpack.unpackb(content)),
+}
+
+
+def price_list_document(rows=400, categories=20):
+    """A price list shaped like the response of `GET /shops/{id}`, as produced by `jsonable_encoder()`."""
+    now = datetime.utcnow().isoformat()
+    category_rows = []
+    for number in range(categories):
+        category_rows.append(
+            {
+                "category_id": str(uuid.uuid4()),
+                "category_name": f"Category {number}",
+                "category_name_en": f"Category {number} (en)",
+                "category_icon": "cannabis",
+                "category_color": "#376E1F",
+                "category_order_number": number,
+                "category_image_1": f"category-{number}-1.png",
+                "category_image_2": f"category-{number}-2.png",
+                "category_pricelist_column": "left" if number % 2 else "right",
+                "category_pricelist_row": number,
+                "main_category_id": str(uuid.uuid4()),
+                "main_category_name": f"Main category {number % 4}",
+                "main_category_name_en": f"Main category {number % 4} (en)",
+                "main_category_icon": "joint",
+                "main_category_order_number": number % 4,
+            }
+        )
+    prices = []
+    for number in range(rows):
+        row = {
+            "id": str(uuid.uuid4()),
+            "internal_product_id": str(number),
+            "active": True,
+            "new": number % 10 == 0,
+            **category_rows[number % categories],
+            "kind_id": str(uuid.uuid4()),
+            "kind_image": f"kind-{number}.png",
+            "kind_name": f"Kind {number}",
+            "strains": [{"name": "Haze"}, {"name": "Skunk"}],
+            "kind_short_description_nl": "Een korte beschrijving van deze soort",
+            "kind_short_description_en": "A short description of this kind",
+            "kind_c": False,
+            "kind_h": False,
+            "kind_i": True,
+            "kind_s": False,
+            "product_id": None,
+            "product_image": None,
+            "product_name": None,
+            "product_short_description_nl": None,
+            "product_short_description_en": None,
+            "half": 6.0,
+            "one": 11.0,
+            "two_five": 25.0,
+            "five": 48.0,
+            "joint": 4.5,
+            "piece": None,
+            "created_at": now,
+            "modified_at": now,
+            "order_number": number,
+        }
+        prices.append({field: row[field] for field in PRICE_LIST_FIELDS})
+    return {"name": "Benchmark shop", "description": "Benchmark shop", "id": str(uuid.uuid4()), "prices": prices}
+
+
+@pytest.fixture(scope="module")
+def document():
+    return price_list_document()
+
+
+@pytest.mark.parametrize("media_type", list(ENCODERS))
+def test_encode_price_list(benchmark, document, media_type):
+    benchmark.group = "encode"
+    content = benchmark(ENCODERS[media_type], document)
+    benchmark.extra_info["bytes"] = len(content)
+    benchmark.extra_info["gzip_bytes"] = len(gzip.compress(content))
+
+
+@pytest.mark.parametrize("media_type", list(ENCODERS))
+def test_decode_price_list(benchmark, document, media_type):
+    benchmark.group = "decode"
+    content = ENCODERS[media_type](document)
+    assert benchmark(DECODERS[media_type], content) == document
+
+
+def encoded_sizes(document):
+    """The size and the gzipped size of the document per encoding."""
+    sizes = {}
+    for media_type, encode in ENCODERS.items():
+        content = encode(document)
+        sizes[media_type] = (len(content), len(gzip.compress(content)))
+    return sizes
+
+
+def test_price_list_encoding_sizes(benchmark, document):
+    benchmark.group = "sizes"
+    sizes = benchmark.pedantic(encoded_sizes, args=(document,), rounds=1)
+
+    json_size, json_gzip_size = sizes[JSON_MEDIA_TYPE]
+    for media_type, (size, gzip_size) in sizes.items():
+        benchmark.extra_info[media_type] = {
+            "bytes": size,
+            "percent": round(100 * size / json_size),
+            "gzip_bytes": gzip_size,
+            "gzip_percent": round(100 * gzip_size / json_gzip_size),
+        }
+    assert sizes[COLUMNAR_MSGPACK_MEDIA_TYPE][0] < sizes[MSGPACK_MEDIA_TYPE][0] < json_size
@@ -12,6 +12,8 @@ EXCLUDED_ENDPOINTS = [
     {"path": "/api/products/", "name": "get_multi", "method": "GET"},
     {"path": "/api/products/{id}/", "name": "get_by_id", "method": "GET"},
     {"path": "/api/shops/{id}/", "name": "get_by_id", "method": "GET"},
+    {"path": "/api/shops/prices/", "name": "get_price_lists", "method": "GET"},
+    {"path": "/api/shops/{id}/prices/changes/", "name": "get_price_list_changes", "method": "GET"},
     {"path": "/api/shops/cache-status/{id}/", "name": "get_cache_status", "method": "GET"},
     {"path": "/api/shops/last-completed-order/{id}/", "name": "get_last_completed_order", "method": "GET"},
     {"path": "/api/shops/last-pending-order/{id}/", "name": "get_last_pending_order", "method": "GET"},
@@ -19,6 +21,7 @@ EXCLUDED_ENDPOINTS = [
     {"path": "/api/shops-to-prices/{id}/", "name": "get_by_id", "method": "GET"},
     {"path": "/api/orders/check/{ids}/", "name": "check", "method": "GET"},
     {"path": "/api/orders/", "name": "create", "method": "POST"},
+    {"path": "/api/orders/batch/", "name": "create_batch", "method": "POST"},
     {"path": "/api/chat/", "name": "get", "method": "GET"},
     {"path": "/api/images/signed-url/{image_name}/", "name": "get_signed_url", "method": "GET"},
     {"path": "/api/images/move/", "name": "move_images", "method": "POST"},
@@ -62,3 +62,19 @@ def test_kind_delete(kind_1, test_client, superuser_token_headers):
     assert HTTPStatus.NO_CONTENT == response.status_code
     kinds = test_client.get("/api/kinds", headers=superuser_token_headers).json()
     assert 0 == len(kinds)
+
+
+def test_kinds_get_multi_cursor(kind_1, kind_2, test_client, superuser_token_headers):
+    response = test_client.get("/api/kinds?cursor=&limit=1&sort=name:DESC", headers=superuser_token_headers)
+    assert HTTPStatus.OK == response.status_code
+    assert [kind["name"] for kind in response.json()] == ["Sativa"]
+    assert response.headers["Content-Range"] == "kinds */2"
+
+    response = test_client.get(
+        f"/api/kinds?cursor={response.headers['X-Next-Cursor']}&limit=1&sort=name:DESC", headers=superuser_token_headers
+    )
+    assert [kind["name"] for kind in response.json()] == ["Indica"]
+    assert "X-Next-Cursor" not in response.headers
+
+    response = test_client.get("/api/kinds?cursor=forged&limit=1", headers=superuser_token_headers)
+    assert HTTPStatus.BAD_REQUEST == response.status_code
@@ -1,12 +1,22 @@
+import json
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
 from unittest import mock
 
 import pytest
+from sqlalchemy.orm import scoped_session, sessionmaker
 
-from server.api.api_v1.endpoints.orders import get_price_rules_total
+from server.api.api_v1.endpoints.orders import MAX_CHECK_ORDERS, get_price_rules_total
+from server.api.helpers import invalidateShopCache
 from server.crud.crud_order import order_crud
+from server.db import db
+from server.db.database import SESSION_ARGUMENTS, BaseModel
+from server.db.models import Kind, Order, Price, Shop, ShopToPrice, Table
 from server.schemas.order import OrderItem
 from server.utils.json import json_dumps
+from tests.unit_tests.crud.test_shop_to_price import count_queries
 
 
 def test_order_list(test_client, shop_with_orders, superuser_token_headers):
@@ -29,6 +39,59 @@ def test_orders_pending_list(test_client, shop_with_different_statuses_orders, s
     assert response_json[0]["status"] == "pending"
 
 
+def parse_server_sent_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n") if ": " in line and not line.startswith(":"))
+        if "event" in fields:
+            events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_orders_complete_list_cursor(test_client, shop_with_different_statuses_orders, shop_1, superuser_token_headers):
+    url = f"/api/orders/shop/{shop_1.id}/complete"
+    response = test_client.get(f"{url}?cursor=&limit=1", headers=superuser_token_headers)
+    assert response.status_code == 200
+    first_page = response.json()
+    assert len(first_page) == 1
+    assert "Content-Range" not in response.headers
+
+    response = test_client.get(
+        f"{url}?cursor={response.headers['X-Next-Cursor']}&limit=1", headers=superuser_token_headers
+    )
+    second_page = response.json()
+    assert len(second_page) == 1
+    assert "X-Next-Cursor" not in response.headers
+    assert {first_page[0]["status"], second_page[0]["status"]} == {"complete", "cancelled"}
+
+    response = test_client.get(f"{url}?cursor=invalid", headers=superuser_token_headers)
+    assert response.status_code == 400
+
+
+def test_orders_pending_events(test_client, shop_with_different_statuses_orders, shop_1, superuser_token_headers):
+    pending = Order.query.filter_by(shop_id=shop_1.id, status="pending").one()
+    pending_id = pending.id
+
+    def complete_order():
+        with db.database_scope():
+            Order.query.get(pending_id).status = "complete"
+            db.session.commit()
+
+    # Completed while the stream is open
+    timer = threading.Timer(0.5, complete_order)
+    timer.start()
+    response = test_client.get(
+        f"/api/orders/shop/{shop_1.id}/pending/events?timeout=2", headers=superuser_token_headers
+    )
+    timer.join()
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_server_sent_events(response.text)
+    assert [event for event, _ in events] == ["snapshot", "removed"]
+    assert [order["id"] for order in events[0][1]] == [str(pending_id)]
+    assert events[1][1] == {"id": str(pending_id)}
+
+
 def test_orders_complete_list(test_client, shop_with_different_statuses_orders, shop_1, superuser_token_headers):
     response = test_client.get(f"/api/orders/shop/{shop_1.id}/complete", headers=superuser_token_headers)
     response_json = response.json()
@@ -38,6 +101,35 @@ def test_orders_complete_list(test_client, shop_with_different_statuses_orders,
     assert response_json[1]["status"] == "cancelled"
 
 
+def test_orders_check(test_client, shop_with_different_statuses_orders, shop_1, shop_2):
+    orders = Order.query.filter_by(shop_id=shop_1.id).order_by(Order.customer_order_id).all()
+    table = Table(name="Table 7", shop_id=shop_1.id)
+    db.session.add(table)
+    db.session.flush()
+    orders[0].table_id = table.id
+    db.session.commit()
+    ids = [str(orders[2].id), str(uuid.uuid4()), str(orders[0].id)]
+
+    with count_queries() as queries:
+        response = test_client.get(f"/api/orders/check/{','.join(ids)}")
+    assert response.status_code == 200
+    assert [(order["id"], order["status"], order["table_name"]) for order in response.json()] == [
+        (ids[0], "cancelled", None),
+        (ids[2], "pending", "Table 7"),
+    ]
+    assert sum("FROM orders" in query or "FROM shop_tables" in query for query in queries) == 1
+
+    other_shop = Order(shop_id=shop_2.id, customer_order_id=1, order_info=[])
+    db.session.add(other_shop)
+    db.session.commit()
+    response = test_client.get(f"/api/orders/check/{ids[0]},{other_shop.id}")
+    assert response.status_code == 400
+
+    assert test_client.get(f"/api/orders/check/{ids[0]},nonsense").status_code == 400
+    too_many = ",".join(str(uuid.uuid4()) for _ in range(MAX_CHECK_ORDERS + 1))
+    assert test_client.get(f"/api/orders/check/{too_many}").status_code == 400
+
+
 def test_create_order(test_client, price_1, price_2, kind_1, kind_2, shop_with_products):
     items = [
         {
@@ -71,6 +163,9 @@ def test_create_order(test_client, price_1, price_2, kind_1, kind_2, shop_with_p
     order = order_crud.get_first_order_filtered_by(customer_order_id=1)
     assert order.shop_id == shop_with_products.id
     assert order.total == 24.0
+    # Delivered from the outbox after the response
+    db.session.refresh(shop_with_products)
+    assert shop_with_products.last_pending_order == response_json["id"]
     assert order.customer_order_id == 1
     assert order.status == "pending"
     assert order.order_info == items
@@ -179,6 +274,139 @@ def test_create_order_validation(test_client, price_1, price_2, kind_1, kind_2,
     # Todo: test checksum functionality (totals should match with quantity in items)
 
 
+def test_create_order_out_of_stock(test_client, price_1, kind_1, shop_with_products):
+    item = {
+        "description": "0,5 gram",
+        "price": price_1.half,
+        "kind_id": str(kind_1.id),
+        "kind_name": kind_1.name,
+        "internal_product_id": "01",
+        "quantity": 1,
+    }
+    body = {"shop_id": str(shop_with_products.id), "total": price_1.half, "order_info": [item]}
+    response = test_client.post(f"/api/orders", json=body)
+    assert response.status_code == 201, response.json()
+
+    # Disabling the unit invalidates the cached availability of the shop
+    shop_to_price = ShopToPrice.query.filter_by(shop_id=shop_with_products.id, kind_id=kind_1.id).one()
+    shop_to_price.use_half = False
+    db.session.commit()
+    invalidateShopCache(shop_with_products.id)
+    response = test_client.post(f"/api/orders", json=body)
+    assert response.status_code == 400
+    assert response.json()["detail"] == f"{kind_1.name}, OUT_OF_STOCK"
+
+    # Other units and unknown kinds
+    response = test_client.post(f"/api/orders", json={**body, "order_info": [{**item, "description": "1 gram"}]})
+    assert response.status_code == 201, response.json()
+    unknown = {**item, "kind_id": "1be8df39-d5e6-4f5c-8b6f-e1ecd8b5f4d9", "kind_name": "Unknown"}
+    response = test_client.post(f"/api/orders", json={**body, "order_info": [unknown]})
+    assert response.status_code == 400
+
+
+def test_create_order_batch(test_client, price_1, price_3, kind_1, product_1, shop_with_products):
+    gram = {
+        "description": "1 gram",
+        "price": price_1.one,
+        "kind_id": str(kind_1.id),
+        "kind_name": kind_1.name,
+        "quantity": 1,
+    }
+    piece = {
+        "description": "1",
+        "price": price_3.piece,
+        "product_id": str(product_1.id),
+        "product_name": product_1.name,
+        "quantity": 1,
+    }
+    body = {
+        "shop_id": str(shop_with_products.id),
+        "orders": [
+            {"total": 10.0, "order_info": [gram], "client_reference": "a"},
+            {"total": 60.0, "order_info": [{**gram, "quantity": 6}], "client_reference": "b"},
+            {"total": 2.5, "order_info": [piece], "client_reference": "c"},
+            {"total": 5.5, "order_info": [{**gram, "description": "2,5 gram"}]},
+        ],
+    }
+    response = test_client.post("/api/orders/batch", json=body)
+    assert response.status_code == 201, response.json()
+    results = response.json()["results"]
+    assert [(result["index"], result["client_reference"]) for result in results] == [
+        (0, "a"),
+        (1, "b"),
+        (2, "c"),
+        (3, None),
+    ]
+    assert [result["error"] for result in results] == [
+        None,
+        "MAX_5_GRAMS_ALLOWED",
+        None,
+        f"{kind_1.name}, OUT_OF_STOCK",
+    ]
+    assert results[0]["order"]["customer_order_id"] == 1
+    assert results[2]["order"]["customer_order_id"] == 2
+    assert results[1]["order"] is None
+
+    orders = order_crud.get_all_orders_filtered_by(shop_id=shop_with_products.id)
+    assert sorted((order.customer_order_id, order.status, order.total) for order in orders) == [
+        (1, "pending", 10.0),
+        (2, "pending", 2.5),
+    ]
+
+
+def test_create_order_batch_invalid(test_client, shop_with_products):
+    response = test_client.post("/api/orders/batch", json={"shop_id": str(uuid.uuid4()), "orders": []})
+    assert response.status_code == 404
+
+    orders = [{"total": 1.0, "order_info": []}] * 101
+    response = test_client.post("/api/orders/batch", json={"shop_id": str(shop_with_products.id), "orders": orders})
+    assert response.status_code == 400
+
+
+@pytest.fixture
+def committed_shop_with_kind():
+    """A shop with one kind, really committed: concurrent requests use their own connections and don't see the data
+    of the test transaction."""
+    session_factory, scoped = db.session_factory, db.scoped_session
+    db.session_factory = sessionmaker(**SESSION_ARGUMENTS, bind=db.engine)
+    db.scoped_session = scoped_session(db.session_factory, db._scopefunc)
+    BaseModel.set_query(db.scoped_session.query_property())
+    try:
+        with db.database_scope():
+            shop = Shop(name=f"Concurrent {uuid.uuid4()}", description=str(uuid.uuid4()))
+            kind = Kind(id=uuid.uuid4(), name=f"Concurrent {uuid.uuid4()}")
+            price = Price(id=uuid.uuid4(), internal_product_id="99", one=10.0)
+            db.session.add_all([shop, kind, price])
+            db.session.flush()
+            db.session.add(ShopToPrice(shop_id=shop.id, kind_id=kind.id, price_id=price.id))
+            db.session.commit()
+            ids = shop.id, kind.id, price.id
+        yield ids
+    finally:
+        with db.database_scope():
+            shop_id, kind_id, price_id = ids
+            Order.query.filter_by(shop_id=shop_id).delete()
+            ShopToPrice.query.filter_by(shop_id=shop_id).delete()
+            Shop.query.filter_by(id=shop_id).delete()
+            Kind.query.filter_by(id=kind_id).delete()
+            Price.query.filter_by(id=price_id).delete()
+            db.session.commit()
+        db.session_factory, db.scoped_session = session_factory, scoped
+        BaseModel.set_query(db.scoped_session.query_property())
+
+
+def test_create_order_concurrent_customer_order_ids(test_client, committed_shop_with_kind):
+    shop_id, kind_id, _ = committed_shop_with_kind
+    item = {"description": "1 gram", "price": 10.0, "kind_id": str(kind_id), "kind_name": "Kind", "quantity": 1}
+    body = {"shop_id": str(shop_id), "total": 10.0, "order_info": [item]}
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        responses = list(executor.map(lambda _: test_client.post("/api/orders", json=body), range(16)))
+
+    assert all(response.status_code == 201 for response in responses), [response.json() for response in responses]
+    assert sorted(response.json()["customer_order_id"] for response in responses) == list(range(1, 17))
+
+
 def test_price_rules():
     order_info = [
         OrderItem(
@@ -0,0 +1,46 @@
+import uuid
+from http import HTTPStatus
+
+from server.db import db
+from server.db.models import ProductsTable
+
+
+def search(test_client, headers, q, **params):
+    response = test_client.get("/api/search", params={"q": q, **params}, headers=headers)
+    assert HTTPStatus.OK == response.status_code, response.json()
+    return [(result["type"], result["name"]) for result in response.json()]
+
+
+def test_search(kind_1, kind_2, product_1, product_2, test_client, superuser_token_headers):
+    # Matches in the name rank above matches in the descriptions
+    assert search(test_client, superuser_token_headers, "indica") == [("kind", "Indica"), ("kind", "Sativa")]
+    assert search(test_client, superuser_token_headers, "cola") == [("product", "Cola"), ("product", "Pepsi")]
+    # Prefixes, stemmed words and all words
+    assert search(test_client, superuser_token_headers, "amnes") == [("kind", "Indica")]
+    assert search(test_client, superuser_token_headers, "breeder") == [("kind", "Indica")]
+    assert search(test_client, superuser_token_headers, "light pep") == [("product", "Pepsi")]
+    assert search(test_client, superuser_token_headers, "cola", limit=1) == [("product", "Cola")]
+    assert search(test_client, superuser_token_headers, "?!") == []
+
+    # The trigger keeps the search vectors up to date
+    kind_2.description_en = "Smells like lemon."
+    db.session.commit()
+    assert search(test_client, superuser_token_headers, "lemons") == [("kind", "Sativa")]
+
+
+def test_search_shop_group(product_1, shop_group_1, shop_group_2, test_client, superuser_token_headers):
+    db.session.add(ProductsTable(id=str(uuid.uuid4()), name="Cola Zero", shop_group_id=shop_group_1.id))
+    db.session.commit()
+
+    assert search(test_client, superuser_token_headers, "cola") == [("product", "Cola")]
+    assert search(test_client, superuser_token_headers, "zero", shop_group_id=str(shop_group_1.id)) == [
+        ("product", "Cola Zero")
+    ]
+    assert search(test_client, superuser_token_headers, "cola", shop_group_id=str(shop_group_2.id)) == [
+        ("product", "Cola")
+    ]
+
+
+def test_search_invalid(test_client, superuser_token_headers):
+    response = test_client.get("/api/search?q=", headers=superuser_token_headers)
+    assert HTTPStatus.UNPROCESSABLE_ENTITY == response.status_code
@@ -1,6 +1,18 @@
+import gzip
+import uuid
+from datetime import datetime
 from http import HTTPStatus
 
+import brotli
+import msgpack
+
+from server.api.api_v1.endpoints.shops import MAX_PRICE_LIST_SHOPS
+from server.api.helpers import invalidateShopCache
+from server.db import db
+from server.db.models import Order, Shop, ShopGroup, ShopToPrice
+from server.utils.cache import shop_price_list_cache
 from server.utils.json import json_dumps
+from server.utils.price_list_encoding import from_columnar
 
 
 def test_shops_get_multi(test_client, shop_1, shop_2, superuser_token_headers):
@@ -17,6 +29,16 @@ def test_shops_get_multi_with_slash(test_client, shop_1, shop_2, superuser_token
     assert 2 == len(shops)
 
 
+def test_shops_get_multi_count_modes(test_client, shop_1, shop_2, superuser_token_headers):
+    response = test_client.get("/api/shops?count=none", headers=superuser_token_headers)
+    assert len(response.json()) == 2
+    assert response.headers["Content-Range"] == "shops 0-100/*"
+    response = test_client.get("/api/shops?count=estimated", headers=superuser_token_headers)
+    assert response.headers["Content-Range"].startswith("shops 0-100/~")
+    response = test_client.get("/api/shops?count=maybe", headers=superuser_token_headers)
+    assert HTTPStatus.UNPROCESSABLE_ENTITY == response.status_code
+
+
 def test_shop_get_by_id(shop_1, test_client):
     response = test_client.get(f"/api/shops/{shop_1.id}")
     assert HTTPStatus.OK == response.status_code
@@ -48,3 +70,244 @@ def test_shop_delete(shop_1, test_client, superuser_token_headers):
     assert HTTPStatus.NO_CONTENT == response.status_code
     shops = test_client.get("/api/shops", headers=superuser_token_headers).json()
     assert len(shops) == 1  # Changed to 1 because admin has 2 shops now
+
+
+def test_shop_get_by_id_is_cached(shop_with_products, test_client):
+    shop_price_list_cache.clear()
+    response = test_client.get(f"/api/shops/{shop_with_products.id}")
+    assert HTTPStatus.OK == response.status_code
+    assert len(response.json()["prices"]) == 3
+    cached = shop_price_list_cache.get(
+        shop_with_products.id, ("all", "application/json"), shop_with_products.modified_at
+    )
+    assert cached == response.content
+
+    # Other variants are cached separately
+    response = test_client.get(f"/api/shops/{shop_with_products.id}?is_horeca=true")
+    assert len(response.json()["prices"]) == 1
+    assert len(shop_price_list_cache) == 2
+
+
+def test_shop_get_by_id_cache_invalidation(shop_with_products, test_client):
+    shop_price_list_cache.clear()
+    test_client.get(f"/api/shops/{shop_with_products.id}")
+    invalidateShopCache(shop_with_products.id)
+    assert len(shop_price_list_cache) == 0
+
+    # A version bump from another worker makes the old entry stale as well
+    test_client.get(f"/api/shops/{shop_with_products.id}")
+    shop_with_products.modified_at = datetime.utcnow()
+    db.session.commit()
+    assert (
+        shop_price_list_cache.get(shop_with_products.id, ("all", "application/json"), shop_with_products.modified_at)
+        is None
+    )
+
+
+def test_shop_price_list_changes(shop_with_products, kind_1, test_client, superuser_token_headers):
+    response = test_client.get(f"/api/shops/{shop_with_products.id}/prices/changes")
+    assert HTTPStatus.OK == response.status_code
+    full_sync = response.json()
+    assert len(full_sync["prices"]) == 3
+    assert full_sync["deleted"] == []
+
+    # Nothing changed
+    response = test_client.get(f"/api/shops/{shop_with_products.id}/prices/changes?since={full_sync['cursor']}")
+    assert response.json() == {"cursor": full_sync["cursor"], "prices": [], "deleted": []}
+
+    # Toggle one item and delete another one
+    toggled, removed = [price for price in full_sync["prices"] if price["kind_id"]]
+    test_client.put(
+        f"/api/shops-to-prices/availability/{toggled['id']}",
+        data=json_dumps({"active": False}),
+        headers=superuser_token_headers,
+    )
+    test_client.delete(f"/api/shops-to-prices/{removed['id']}", headers=superuser_token_headers)
+
+    response = test_client.get(f"/api/shops/{shop_with_products.id}/prices/changes?since={full_sync['cursor']}")
+    delta = response.json()
+    assert delta["cursor"] != full_sync["cursor"]
+    changed = {price["id"]: price for price in delta["prices"]}
+    assert changed[toggled["id"]]["active"] is False
+    assert removed["id"] not in changed
+    assert delta["deleted"] == [removed["id"]]
+
+
+def test_shop_invalidation_pushes_price_list_patch(shop_with_products, kind_1, monkeypatch):
+    messages = []
+    monkeypatch.setattr("server.api.helpers.sendMessageToWebSocketServer", messages.append)
+
+    # The first push has no base version to diff against
+    invalidateShopCache(shop_with_products.id)
+    assert messages[0]["since"] == "0"
+    assert "patch" not in messages[0]
+
+    kind_1.name = "Renamed kind"
+    invalidateShopCache(shop_with_products.id)
+    message = messages[1]
+    assert message["connectionType"] == "shop"
+    assert message["since"] == messages[0]["cursor"]
+    assert message["cursor"] != message["since"]
+    assert {price["kind_name"] for price in message["patch"]["prices"]} == {"Renamed kind"}
+    assert message["patch"]["deleted"] == []
+
+    # Too large patches are left out, clients sync with the changes endpoint
+    monkeypatch.setattr("server.api.helpers.app_settings.WEBSOCKET_PATCH_MAX_BYTES", 10)
+    kind_1.name = "Renamed again"
+    invalidateShopCache(shop_with_products.id)
+    assert messages[2]["since"] == message["cursor"]
+    assert "patch" not in messages[2]
+
+
+def test_shop_price_list_changes_not_found(test_client):
+    response = test_client.get(f"/api/shops/{uuid.uuid4()}/prices/changes")
+    assert HTTPStatus.NOT_FOUND == response.status_code
+
+
+def test_shop_get_by_id_stream(shop_with_products, test_client):
+    expected = test_client.get(f"/api/shops/{shop_with_products.id}?is_horeca=false").json()
+
+    response = test_client.get(f"/api/shops/{shop_with_products.id}?is_horeca=false&stream=true")
+    assert HTTPStatus.OK == response.status_code
+    assert response.json() == expected
+
+
+def test_shop_get_by_id_fields(shop_with_products, test_client):
+    response = test_client.get(f"/api/shops/{shop_with_products.id}?fields=kind_name, one,category_name")
+    assert HTTPStatus.OK == response.status_code
+    shop = response.json()
+    assert shop["name"] == "Mississippi"
+    assert len(shop["prices"]) == 3
+    assert all(list(price) == ["id", "category_name", "kind_name", "one"] for price in shop["prices"])
+
+    response = test_client.get(f"/api/shops/{shop_with_products.id}?fields=kind_name,secret")
+    assert HTTPStatus.BAD_REQUEST == response.status_code
+
+
+def test_shop_get_by_id_msgpack(shop_with_products, test_client):
+    expected = test_client.get(f"/api/shops/{shop_with_products.id}").json()
+
+    response = test_client.get(f"/api/shops/{shop_with_products.id}", headers={"Accept": "application/msgpack"})
+    assert HTTPStatus.OK == response.status_code
+    assert response.headers["content-type"] == "application/msgpack"
+    assert response.headers["vary"] == "Accept, Accept-Encoding"
+    assert msgpack.unpackb(response.content) == expected
+
+    response = test_client.get(
+        f"/api/shops/{shop_with_products.id}", headers={"Accept": "application/vnd.pricelist.columnar+json"}
+    )
+    assert from_columnar(response.json()) == expected
+
+
+def test_shop_get_by_id_compressed(shop_with_products, test_client):
+    shop_price_list_cache.clear()
+    expected = test_client.get(f"/api/shops/{shop_with_products.id}", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in expected.headers
+
+    for encoding, decompress in (("br", brotli.decompress), ("gzip", gzip.decompress)):
+        response = test_client.get(
+            f"/api/shops/{shop_with_products.id}", headers={"Accept-Encoding": encoding}, stream=True
+        )
+        assert response.headers["content-encoding"] == encoding
+        assert decompress(response.raw.read(decode_content=False)) == expected.content
+        # Stored next to the uncompressed snapshot
+        cached = shop_price_list_cache.get(
+            shop_with_products.id, ("all", "application/json"), shop_with_products.modified_at, encoding
+        )
+        assert decompress(cached) == expected.content
+    assert len(shop_price_list_cache) == 1
+
+
+def test_shops_get_price_lists(shop_with_products, shop_2, shop_group_1, kind_1, price_1, category_1, test_client):
+    db.session.add(ShopToPrice(price_id=price_1.id, shop_id=shop_2.id, category_id=category_1.id, kind_id=kind_1.id))
+    db.session.commit()
+    single = test_client.get(f"/api/shops/{shop_with_products.id}").json()
+
+    for query in (f"ids={shop_with_products.id},{shop_2.id}", f"shop_group_id={shop_group_1.id}"):
+        response = test_client.get(f"/api/shops/prices?{query}")
+        assert HTTPStatus.OK == response.status_code
+        price_lists = response.json()
+        assert [shop["name"] for shop in price_lists["shops"]] == ["Mississippi", "Head Shop"]
+        assert [len(shop["prices"]) for shop in price_lists["shops"]] == [3, 1]
+        assert len(price_lists["categories"]) == 1
+        assert len(price_lists["kinds"]) == 2
+        assert len(price_lists["products"]) == 1
+
+        # Joining the lookups gives back the rows of the single shop endpoint
+        for price, expected in zip(price_lists["shops"][0]["prices"], single["prices"]):
+            row = {**price, **price_lists["categories"][price["category_id"]]}
+            if price["kind_id"]:
+                row.update(price_lists["kinds"][price["kind_id"]])
+            if price["product_id"]:
+                row.update(price_lists["products"][price["product_id"]])
+            assert row == {field: expected[field] for field in row}
+
+
+def test_shops_get_price_lists_invalid(shop_1, test_client):
+    assert HTTPStatus.BAD_REQUEST == test_client.get("/api/shops/prices").status_code
+    assert HTTPStatus.BAD_REQUEST == test_client.get("/api/shops/prices?ids=not-a-uuid").status_code
+    response = test_client.get(f"/api/shops/prices?ids={shop_1.id},{uuid.uuid4()}")
+    assert HTTPStatus.NOT_FOUND == response.status_code
+    too_many = ",".join(str(uuid.uuid4()) for _ in range(MAX_PRICE_LIST_SHOPS + 1))
+    assert HTTPStatus.BAD_REQUEST == test_client.get(f"/api/shops/prices?ids={too_many}").status_code
+
+    shops = [Shop(id=uuid.uuid4(), name=f"Shop {i}") for i in range(MAX_PRICE_LIST_SHOPS + 1)]
+    shop_group = ShopGroup(id=uuid.uuid4(), name="Large", shop_ids=[str(shop.id) for shop in shops])
+    db.session.add_all([*shops, shop_group])
+    db.session.commit()
+    response = test_client.get(f"/api/shops/prices?shop_group_id={shop_group.id}")
+    assert HTTPStatus.BAD_REQUEST == response.status_code
+
+
+def test_shop_stats(shop_1, test_client, superuser_token_headers):
+    kind_id = str(uuid.uuid4())
+    order_info = [{"description": "1 gram", "price": 10.0, "kind_id": kind_id, "kind_name": "Haze", "quantity": 3}]
+    for hour, status in ((9, "complete"), (9, "complete"), (11, "complete"), (11, "cancelled")):
+        db.session.add(
+            Order(
+                shop_id=shop_1.id,
+                status=status,
+                order_info=order_info,
+                total=30.0,
+                created_at=datetime(2026, 3, 1, hour, 30),
+            )
+        )
+    db.session.commit()
+    period = "start=2026-03-01T00:00:00&end=2026-03-02T00:00:00"
+
+    response = test_client.get(
+        f"/api/shops/{shop_1.id}/stats?granularity=hour&{period}", headers=superuser_token_headers
+    )
+    assert HTTPStatus.OK == response.status_code, response.json()
+    stats = response.json()
+    assert [(period["start"], period["orders"], period["revenue"]) for period in stats["periods"]] == [
+        ("2026-03-01T09:00:00", 2, 60.0),
+        ("2026-03-01T11:00:00", 1, 30.0),
+    ]
+    assert stats["products"] == [{"id": kind_id, "name": "Haze", "quantity": 9, "revenue": 90.0, "grams": 9.0}]
+
+    stats = test_client.get(f"/api/shops/{shop_1.id}/stats?{period}", headers=superuser_token_headers).json()
+    assert [(period["start"], period["orders"], period["grams"]) for period in stats["periods"]] == [
+        ("2026-03-01", 3, 9.0)
+    ]
+
+    # The end is exclusive: up to midnight in Amsterdam doesn't count the sales of March 1st
+    period = "start=2026-02-28T00:00:00&end=2026-02-28T23:00:00"
+    stats = test_client.get(f"/api/shops/{shop_1.id}/stats?{period}", headers=superuser_token_headers).json()
+    assert stats["periods"] == []
+    assert stats["products"] == []
+
+
+def test_shop_stats_invalid(shop_1, test_client, superuser_token_headers):
+    url = f"/api/shops/{shop_1.id}/stats"
+    assert HTTPStatus.UNAUTHORIZED == test_client.get(url).status_code
+    assert (
+        HTTPStatus.UNPROCESSABLE_ENTITY
+        == test_client.get(f"{url}?granularity=week", headers=superuser_token_headers).status_code
+    )
+    response = test_client.get(
+        f"{url}?start=2026-03-02T00:00:00&end=2026-03-01T00:00:00", headers=superuser_token_headers
+    )
+    assert HTTPStatus.BAD_REQUEST == response.status_code
+    response = test_client.get(f"/api/shops/{uuid.uuid4()}/stats", headers=superuser_token_headers)
+    assert HTTPStatus.NOT_FOUND == response.status_code
@@ -52,6 +52,7 @@ from server.pydantic_forms.exceptions import FormException
 from server.security import get_password_hash
 from server.settings import app_settings
 from server.types import UUIDstr
+from server.utils.cache import reference_caches
 from server.utils.date_utils import nowtz
 
 logger = structlog.getLogger(__name__)
@@ -182,6 +183,9 @@ def db_session(database):
             yield
         finally:
             trans.rollback()
+            # Rows cached in a test are gone with the rollback
+            for cache in reference_caches.values():
+                cache.invalidate()
 
 
 @pytest.fixture(scope="session", autouse=True)
@@ -0,0 +1,83 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from server.crud.crud_kind import kind_crud
+from server.crud.crud_order import order_crud
+from server.crud.crud_strain import strain_crud
+from server.db import db
+from server.db.filters import compile_filter
+from server.db.models import Kind, Order
+
+
+def compiled(column, value):
+    return str(compile_filter(column, value).compile(dialect=postgresql.dialect()))
+
+
+@pytest.mark.parametrize(
+    "column,value,sql",
+    [
+        (Kind.id, "8b4c5e5e-2a0e-4f8b-9d38-2d1a3c52f1a2", "kinds.id = %(id_1)s"),
+        (Kind.i, "ja", "kinds.i IS true"),
+        (Kind.i, "0", "kinds.i IS false"),
+        (Kind.name, "haze", "kinds.name ILIKE %(name_1)s"),
+        (Kind.name, "=Haze", "kinds.name = %(name_1)s"),
+        (Order.customer_order_id, "12", "orders.customer_order_id = %(customer_order_id_1)s"),
+        (Order.total, ">=10.5", "orders.total >= %(total_1)s"),
+        (Order.total, "10..20", "orders.total >= %(total_1)s AND orders.total <= %(total_2)s"),
+        (
+            Order.created_at,
+            "2026-03-01",
+            "orders.created_at >= %(created_at_1)s AND orders.created_at < %(created_at_2)s",
+        ),
+        (Order.order_info, "Haze", "CAST(orders.order_info AS VARCHAR) ILIKE %(param_1)s"),
+        (Kind.id, "8b4c5e5e", "false"),
+        (Kind.i, "maybe", "false"),
+        (
+            Kind.tsv,
+            "Haze",
+            "kinds.tsv @@ ((to_tsquery('simple'::regconfig, %(to_tsquery_1)s) || "
+            "to_tsquery('dutch'::regconfig, %(to_tsquery_2)s)) || to_tsquery('english'::regconfig, %(to_tsquery_3)s))",
+        ),
+        (Kind.tsv, "--", "false"),
+        (Order.total, "cheap", "false"),
+    ],
+)
+def test_compile_filter(column, value, sql):
+    assert compiled(column, value) == sql
+
+
+def test_filters_on_column_types(kind_1, kind_2, strain_1, strain_2, shop_1):
+    def names(filters):
+        result, _ = kind_crud.get_multi(filter_parameters=filters, sort_parameters=["name"])
+        return [kind.name for kind in result]
+
+    assert names([f"id:{kind_1.id}"]) == [kind_1.name]
+    assert names(["i:true"]) == [kind.name for kind in sorted((kind_1, kind_2), key=lambda kind: kind.name) if kind.i]
+    assert names([f"name:{kind_1.name[1:4].lower()}"]) == [kind_1.name]
+    assert names([f"name:{kind_1.name[:3]}*", f"id:{kind_2.id}"]) == []
+    assert names(["name:%"]) == []
+
+    result, _ = strain_crud.get_multi(filter_parameters=["haz"], sort_parameters=[])
+    assert [strain.name for strain in result] == ["Haze"]
+    # Kinds have a search vector: a bare value is a full-text search
+    assert names(["sativa-dominant"]) == [kind_1.name]
+    assert names(["tsv:really good"]) == [kind_2.name]
+    assert [kind.name for kind in Kind.query.search("indica", sort=True)] == [kind_1.name, kind_2.name]
+
+    for number, day in enumerate((1, 2, 3)):
+        db.session.add(
+            Order(shop_id=shop_1.id, customer_order_id=number, total=10.0 * day, created_at=datetime(2026, 3, day, 12))
+        )
+    db.session.commit()
+
+    def order_numbers(filters):
+        result, _ = order_crud.get_multi(filter_parameters=filters, sort_parameters=["customer_order_id"])
+        return [order.customer_order_id for order in result]
+
+    assert order_numbers(["created_at:2026-03-02"]) == [1]
+    assert order_numbers(["created_at:..2026-03-02"]) == [0, 1]
+    assert order_numbers(["created_at:>2026-03-01"]) == [1, 2]
+    assert order_numbers(["total:>15", "total:<=30"]) == [1, 2]
+    assert order_numbers(["total:lots"]) == []
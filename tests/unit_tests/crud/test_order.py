@@ -0,0 +1,92 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from server.crud.crud_order import order_crud
+from server.db import db
+from server.db.models import Order, ShopOrderCounter, Table
+from server.settings import app_settings
+from tests.unit_tests.crud.test_shop_to_price import count_queries
+
+
+def test_next_customer_order_id(shop_1, shop_2):
+    assert [order_crud.next_customer_order_id(shop_id=shop_1.id) for _ in range(3)] == [1, 2, 3]
+    assert order_crud.next_customer_order_id(shop_id=shop_2.id) == 1
+    assert order_crud.next_customer_order_id(shop_id=shop_1.id) == 4
+
+
+def move_counter_back(shop_id):
+    ShopOrderCounter.query.filter_by(shop_id=shop_id).update({"day": date.today() - timedelta(days=2)})
+
+
+def test_next_customer_order_id_daily_reset(shop_1, monkeypatch):
+    order_crud.next_customer_order_id(shop_id=shop_1.id)
+    order_crud.next_customer_order_id(shop_id=shop_1.id)
+    move_counter_back(shop_1.id)
+
+    # Without the reset the numbers keep increasing
+    assert order_crud.next_customer_order_id(shop_id=shop_1.id) == 3
+
+    monkeypatch.setattr(app_settings, "ORDER_NUMBER_DAILY_RESET", True)
+    assert order_crud.next_customer_order_id(shop_id=shop_1.id) == 4
+    move_counter_back(shop_1.id)
+    assert order_crud.next_customer_order_id(shop_id=shop_1.id) == 1
+    assert order_crud.next_customer_order_id(shop_id=shop_1.id) == 2
+
+
+def test_get_page_by_shop_id(shop_1, shop_2):
+    created_at = datetime(2026, 1, 1, 12)
+    orders = []
+    for number in range(7):
+        status = "cancelled" if number == 3 else "complete"
+        # Two orders at the same moment: the id breaks the tie
+        moment = created_at + timedelta(minutes=number // 2)
+        orders.append(Order(shop_id=shop_1.id, customer_order_id=number, status=status, created_at=moment))
+    db.session.add_all(orders)
+    db.session.add(Order(shop_id=shop_1.id, customer_order_id=7, status="pending", created_at=created_at))
+    db.session.add(Order(shop_id=shop_2.id, customer_order_id=1, status="complete", created_at=created_at))
+    db.session.commit()
+
+    pages = []
+    cursor = ""
+    while cursor is not None:
+        page, cursor = order_crud.get_page_by_shop_id(
+            shop_id=shop_1.id, statuses=("complete", "cancelled"), limit=3, cursor=cursor
+        )
+        pages.append([order.id for order in page])
+    assert [len(page) for page in pages] == [3, 3, 1]
+    expected = sorted(orders, key=lambda order: (order.created_at, order.id), reverse=True)
+    assert sum(pages, []) == [order.id for order in expected]
+
+    with pytest.raises(ValueError):
+        order_crud.get_page_by_shop_id(shop_id=shop_1.id, statuses=("complete",), limit=3, cursor="nonsense")
+
+
+def test_listing_query(shop_1, user_admin):
+    user_admin.first_name = "Ada"
+    table = Table(name="Table 1", shop_id=shop_1.id)
+    db.session.add(table)
+    db.session.flush()
+    statuses = ["complete", "cancelled", "pending", "complete"]
+    for number, status in enumerate(statuses):
+        db.session.add(
+            Order(
+                shop_id=shop_1.id,
+                customer_order_id=number,
+                status=status,
+                completed_by=user_admin.id,
+                table_id=table.id if number < 3 else None,
+            )
+        )
+    db.session.commit()
+
+    shop_id = shop_1.id
+    with count_queries() as statements:
+        rows = order_crud.listing_query().filter(Order.shop_id == shop_id).order_by(Order.customer_order_id).all()
+    assert len(statements) == 1
+    assert [(row.status, row.completed_by_name, row.table_name) for row in rows] == [
+        ("complete", "Ada", "Table 1"),
+        ("cancelled", "Ada", "Table 1"),
+        ("pending", None, "Table 1"),
+        ("complete", "Ada", None),
+    ]
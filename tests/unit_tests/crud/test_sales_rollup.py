@@ -0,0 +1,173 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from uuid import uuid4
+
+import pytest
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from server.crud.crud_order import TEST_TABLE_ID
+from server.crud.crud_sales_rollup import sales_rollup_crud
+from server.db import db
+from server.db.database import SESSION_ARGUMENTS, BaseModel
+from server.db.models import Order, Shop, ShopProductSalesRollup, ShopSalesRollup, Table
+
+KIND_ID = uuid4()
+PRODUCT_ID = uuid4()
+ORDER_INFO = [
+    {"description": "1 gram", "price": 10.0, "kind_id": str(KIND_ID), "kind_name": "Haze", "quantity": 2},
+    {"description": "joint", "price": 5.0, "kind_id": str(KIND_ID), "kind_name": "Haze", "quantity": 1},
+    {"description": "cola", "price": 2.5, "product_id": str(PRODUCT_ID), "product_name": "Cola", "quantity": 2},
+]
+
+
+def make_order(shop, status="pending", **kwargs):
+    order = Order(
+        shop_id=shop.id,
+        customer_order_id=1,
+        status=status,
+        order_info=ORDER_INFO,
+        total=30.0,
+        created_at=datetime(2026, 3, 1, 22, 40),
+        **kwargs,
+    )
+    db.session.add(order)
+    db.session.commit()
+    return order
+
+
+def hours(shop_id):
+    return [
+        (row.hour, row.orders, row.revenue, round(row.grams, 2))
+        for row in ShopSalesRollup.query.filter_by(shop_id=shop_id).order_by(ShopSalesRollup.hour)
+    ]
+
+
+def products(shop_id):
+    return {
+        row.item_id: (row.day, row.name, row.quantity, row.revenue, round(row.grams, 2))
+        for row in ShopProductSalesRollup.query.filter_by(shop_id=shop_id)
+    }
+
+
+def test_complete_order_is_rolled_up(shop_1):
+    order = make_order(shop_1)
+    assert hours(shop_1.id) == []
+
+    order.status = "complete"
+    order.completed_at = datetime(2026, 3, 1, 23, 5)
+    db.session.commit()
+
+    assert hours(shop_1.id) == [(datetime(2026, 3, 1, 23), 1, 30.0, 2.4)]
+    # 23:05 UTC is the next day in Amsterdam
+    assert products(shop_1.id) == {
+        KIND_ID: (date(2026, 3, 2), "Haze", 3, 25.0, 2.4),
+        PRODUCT_ID: (date(2026, 3, 2), "Cola", 2, 5.0, 0),
+    }
+
+    make_order(shop_1, status="complete", completed_at=datetime(2026, 3, 1, 23, 50))
+    assert hours(shop_1.id) == [(datetime(2026, 3, 1, 23), 2, 60.0, 4.8)]
+    assert products(shop_1.id)[KIND_ID] == (date(2026, 3, 2), "Haze", 6, 50.0, 4.8)
+
+
+def test_cancelling_and_deleting_take_off_the_sales(shop_1):
+    order = make_order(shop_1, status="complete")
+    other = make_order(shop_1, status="complete")
+    assert hours(shop_1.id) == [(datetime(2026, 3, 1, 22), 2, 60.0, 4.8)]
+
+    order.status = "cancelled"
+    db.session.commit()
+    assert hours(shop_1.id) == [(datetime(2026, 3, 1, 22), 1, 30.0, 2.4)]
+
+    db.session.delete(other)
+    db.session.commit()
+    assert hours(shop_1.id) == [(datetime(2026, 3, 1, 22), 0, 0.0, 0.0)]
+    assert {row[2] for row in products(shop_1.id).values()} == {0}
+
+
+def test_editing_a_complete_order_corrects_the_sales(shop_1):
+    order = make_order(shop_1, status="complete")
+    order.order_info = ORDER_INFO[:1]
+    order.total = 20.0
+    db.session.commit()
+
+    assert hours(shop_1.id) == [(datetime(2026, 3, 1, 22), 1, 20.0, 2.0)]
+    assert products(shop_1.id)[KIND_ID][2:] == (2, 20.0, 2.0)
+    assert products(shop_1.id)[PRODUCT_ID][2:] == (0, 0.0, 0)
+
+
+def test_test_table_orders_are_ignored(shop_1):
+    table = Table(id=TEST_TABLE_ID, name="Test", shop_id=shop_1.id)
+    db.session.add(table)
+    db.session.commit()
+    make_order(shop_1, status="complete", table_id=table.id)
+    assert hours(shop_1.id) == []
+
+
+def test_get_periods(shop_1):
+    make_order(shop_1, status="complete", completed_at=datetime(2026, 3, 1, 10, 15))
+    make_order(shop_1, status="complete", completed_at=datetime(2026, 3, 1, 12, 15))
+    make_order(shop_1, status="complete", completed_at=datetime(2026, 3, 1, 23, 15))
+    start, end = datetime(2026, 3, 1), datetime(2026, 3, 2)
+
+    by_hour = sales_rollup_crud.get_periods(shop_id=shop_1.id, granularity="hour", start=start, end=end)
+    assert [(row.start.hour, row.orders) for row in by_hour] == [(10, 1), (12, 1), (23, 1)]
+
+    by_day = sales_rollup_crud.get_periods(shop_id=shop_1.id, granularity="day", start=start, end=end)
+    assert [(row.start, row.orders, row.revenue) for row in by_day] == [
+        (date(2026, 3, 1), 2, 60.0),
+        (date(2026, 3, 2), 1, 30.0),
+    ]
+
+    top = sales_rollup_crud.get_products(shop_id=shop_1.id, start=date(2026, 3, 1), end=date(2026, 3, 2))
+    assert [(row.item_id, row.quantity) for row in top] == [(KIND_ID, 9), (PRODUCT_ID, 6)]
+
+
+@pytest.fixture
+def committed_order():
+    """A complete order of a shop, really committed: concurrent transactions use their own connections and don't see
+    the data of the test transaction."""
+    session_factory, scoped = db.session_factory, db.scoped_session
+    db.session_factory = sessionmaker(**SESSION_ARGUMENTS, bind=db.engine)
+    db.scoped_session = scoped_session(db.session_factory, db._scopefunc)
+    BaseModel.set_query(db.scoped_session.query_property())
+    try:
+        with db.database_scope():
+            shop = Shop(name=f"Concurrent {uuid4()}", description=str(uuid4()))
+            db.session.add(shop)
+            db.session.commit()
+            ids = shop.id, make_order(shop, status="complete").id
+        yield ids
+    finally:
+        with db.database_scope():
+            shop_id, _ = ids
+            Order.query.filter_by(shop_id=shop_id).delete()
+            # The rollups go with the shop
+            Shop.query.filter_by(id=shop_id).delete()
+            db.session.commit()
+        db.session_factory, db.scoped_session = session_factory, scoped
+        BaseModel.set_query(db.scoped_session.query_property())
+
+
+def cancel_order(order_id):
+    with db.database_scope():
+        Order.query.get(order_id).status = "cancelled"
+        db.session.commit()
+
+
+def test_concurrent_writes_of_an_order_take_off_the_sales_once(committed_order):
+    shop_id, order_id = committed_order
+
+    with db.database_scope():
+        Order.query.get(order_id).status = "cancelled"
+        db.session.flush()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            second = executor.submit(cancel_order, order_id)
+            # Let the second transaction read the order: it waits for the lock of this one
+            time.sleep(0.5)
+            assert not second.done()
+            db.session.commit()
+            second.result()
+
+    with db.database_scope():
+        assert hours(shop_id) == [(datetime(2026, 3, 1, 22), 0, 0.0, 0.0)]
@@ -0,0 +1,138 @@
+import uuid
+
+import pytest
+
+from server.crud.crud_shop_price_list import (
+    PRICE_LIST_FIELDS,
+    decode_changes_cursor,
+    encode_changes_cursor,
+    render_price_list_row,
+    shop_price_list_crud,
+)
+from server.crud.crud_shop_to_price import shop_to_price_crud
+from server.crud.crud_strain import strain_crud
+from server.db import db
+from server.db.models import KindToStrain, Shop, ShopPriceList, ShopPriceListDeletion, Strain
+from server.schemas.strain import StrainUpdate
+
+
+def read_rows(shop_id, is_horeca=None):
+    db.session.expunge_all()
+    return [
+        {field: getattr(row, field) for field in PRICE_LIST_FIELDS}
+        for row in shop_price_list_crud.get_by_shop_id(shop_id=shop_id, is_horeca=is_horeca)
+    ]
+
+
+def rendered_rows(shop_id, is_horeca=None):
+    db.session.expunge_all()
+    return [
+        render_price_list_row(pr)
+        for pr in shop_to_price_crud.get_price_list_by_shop_id(shop_id=shop_id, is_horeca=is_horeca)
+    ]
+
+
+def test_read_table_matches_rendered_price_list(shop_with_products):
+    shop_id = shop_with_products.id
+    for is_horeca in (None, True, False):
+        rows = read_rows(shop_id, is_horeca)
+        assert rows
+        assert [
+            {**row, "main_category_id": str(row["main_category_id"])} for row in rendered_rows(shop_id, is_horeca)
+        ] == rows
+
+
+def test_read_table_follows_source_changes(shop_with_products, kind_1, price_1, main_category_1):
+    shop_id = shop_with_products.id
+    kind_id = kind_1.id
+
+    kind_1.name = "Renamed kind"
+    price_1.one = 12.5
+    main_category_1.name = "Renamed main category"
+    db.session.commit()
+    row = next(row for row in read_rows(shop_id) if row["kind_id"] == kind_id)
+    assert row["kind_name"] == "Renamed kind"
+    assert row["one"] == 12.5
+    assert row["main_category_name"] == "Renamed main category"
+
+    strain = Strain(id=str(uuid.uuid4()), name="New strain")
+    db.session.add(strain)
+    db.session.add(KindToStrain(id=str(uuid.uuid4()), kind_id=kind_id, strain_id=strain.id))
+    db.session.commit()
+    row = next(row for row in read_rows(shop_id) if row["kind_id"] == kind_id)
+    assert {"name": "New strain"} in row["strains"]
+
+
+def test_read_table_rows_are_removed_with_their_source(shop_to_price_1):
+    shop_id = shop_to_price_1.shop_id
+    assert len(read_rows(shop_id)) == 1
+
+    shop_to_price_crud.delete(id=shop_to_price_1.id)
+    assert ShopPriceList.query.filter_by(shop_id=shop_id).count() == 0
+
+
+def test_moving_a_row_to_another_shop_leaves_a_tombstone(shop_to_price_1, shop_2):
+    old_shop_id, new_shop_id = shop_to_price_1.shop_id, shop_2.id
+    _, _, cursor = shop_price_list_crud.get_changes(shop_id=old_shop_id)
+
+    shop_to_price_1.shop_id = new_shop_id
+    db.session.commit()
+
+    rows, deleted, _ = shop_price_list_crud.get_changes(shop_id=old_shop_id, since=cursor)
+    assert rows == []
+    assert deleted == [shop_to_price_1.id]
+    rows, _, _ = shop_price_list_crud.get_changes(shop_id=new_shop_id)
+    assert [row.id for row in rows] == [shop_to_price_1.id]
+
+
+def test_read_table_follows_strain_renames(shop_with_products, kind_1):
+    shop_id = shop_with_products.id
+    kind_id = kind_1.id
+    strain = Strain(id=str(uuid.uuid4()), name="Old strain name")
+    db.session.add(strain)
+    db.session.add(KindToStrain(id=str(uuid.uuid4()), kind_id=kind_id, strain_id=strain.id))
+    db.session.commit()
+
+    strain_crud.update(db_obj=strain, obj_in=StrainUpdate(name="New strain name"))
+    row = next(row for row in read_rows(shop_id) if row["kind_id"] == kind_id)
+    assert {"name": "New strain name"} in row["strains"]
+    assert {"name": "Old strain name"} not in row["strains"]
+
+
+def test_changes_of_transactions_that_commit_out_of_order():
+    shop_id = uuid.uuid4()
+    with db.engine.connect() as connection:
+        connection.execute(Shop.__table__.insert().values(id=shop_id, name=f"Out of order {shop_id}"))
+    first, second = db.engine.connect(), db.engine.connect()
+    try:
+        _, _, cursor = shop_price_list_crud.get_changes(shop_id=shop_id)
+        first_transaction, second_transaction = first.begin(), second.begin()
+        first_id, second_id = uuid.uuid4(), uuid.uuid4()
+        first.execute(ShopPriceListDeletion.__table__.insert().values(id=first_id, shop_id=shop_id))
+        second.execute(ShopPriceListDeletion.__table__.insert().values(id=second_id, shop_id=shop_id))
+        second_transaction.commit()
+
+        # The second change has the higher version, but the first one is still in flight
+        _, deleted, cursor = shop_price_list_crud.get_changes(shop_id=shop_id, since=cursor)
+        assert deleted == []
+
+        first_transaction.commit()
+        _, deleted, cursor = shop_price_list_crud.get_changes(shop_id=shop_id, since=cursor)
+        assert deleted == [first_id, second_id]
+        _, deleted, _ = shop_price_list_crud.get_changes(shop_id=shop_id, since=cursor)
+        assert deleted == []
+    finally:
+        first.close()
+        second.close()
+        with db.engine.connect() as connection:
+            # The tombstones go with the shop
+            connection.execute(Shop.__table__.delete().where(Shop.__table__.c.id == shop_id))
+
+
+def test_changes_cursor():
+    assert decode_changes_cursor(encode_changes_cursor(12, 3456)) == (12, 3456)
+    # A plain version of before the horizon syncs everything again
+    assert decode_changes_cursor("12") == (12, 0)
+    for cursor in ("x", "1.y", "-1.2"):
+        with pytest.raises(ValueError):
+            decode_changes_cursor(cursor)
@@ -0,0 +1,83 @@
+import uuid
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from server.crud.crud_shop_price_list import render_price_list_row
+from server.crud.crud_shop_to_price import shop_to_price_crud
+from server.db import db
+from server.db.models import Kind, KindToStrain, Price, ShopToPrice, Strain
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+
+def add_kinds_to_shop(shop_id, category_id, amount):
+    for i in range(amount):
+        name = f"Kind {uuid.uuid4()}"
+        kind = Kind(id=str(uuid.uuid4()), name=name)
+        price = Price(id=str(uuid.uuid4()), internal_product_id=name, one=10.0 + i, five=45.0)
+        db.session.add_all([kind, price])
+        for strain_number in range(2):
+            strain = Strain(id=str(uuid.uuid4()), name=f"{name} strain {strain_number}")
+            db.session.add(strain)
+            db.session.add(KindToStrain(id=str(uuid.uuid4()), kind_id=kind.id, strain_id=strain.id))
+        db.session.add(ShopToPrice(shop_id=shop_id, category_id=category_id, kind_id=kind.id, price_id=price.id))
+    db.session.commit()
+
+
+def render_price_list(shop_id):
+    db.session.expunge_all()
+    return [
+        render_price_list_row(pr)
+        for pr in shop_to_price_crud.get_price_list_by_shop_id(shop_id=shop_id, is_horeca=None)
+    ]
+
+
+def test_get_price_list_by_shop_id_query_count_is_constant(shop_with_products, category_1):
+    shop_id = shop_with_products.id
+    category_id = category_1.id
+    with count_queries() as statements:
+        prices = render_price_list(shop_id)
+    assert len(prices) == 3
+    small_menu_queries = len(statements)
+    assert small_menu_queries == 2
+
+    add_kinds_to_shop(shop_id, category_id, 25)
+
+    with count_queries() as statements:
+        prices = render_price_list(shop_id)
+    assert len(prices) == 28
+    assert len(statements) == small_menu_queries
+    assert all(len(price["strains"]) == 2 for price in prices if (price["kind_name"] or "").startswith("Kind "))
+
+
+def test_get_availability_by_shop_id(shop_with_products, kind_1, kind_2, product_1):
+    availability = shop_to_price_crud.get_availability_by_shop_id(shop_id=shop_with_products.id)
+    assert availability == {
+        "kinds": {
+            str(kind_1.id): {"half", "one", "five", "joint"},
+            str(kind_2.id): {"one", "five", "joint"},
+        },
+        "products": {str(product_1.id): {"piece"}},
+    }
+
+    shop_to_price = ShopToPrice.query.filter_by(shop_id=shop_with_products.id, kind_id=kind_2.id).one()
+    shop_to_price.active = False
+    shop_to_price = ShopToPrice.query.filter_by(shop_id=shop_with_products.id, kind_id=kind_1.id).one()
+    shop_to_price.use_half = False
+    db.session.commit()
+
+    availability = shop_to_price_crud.get_availability_by_shop_id(shop_id=shop_with_products.id)
+    assert availability["kinds"] == {str(kind_1.id): {"one", "five", "joint"}}
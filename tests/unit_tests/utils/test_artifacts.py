@@ -0,0 +1,68 @@
+import json
+import os
+
+import pytest
+
+from server.api.helpers import invalidateShopCache
+from server.settings import app_settings
+from server.utils.artifacts import ArtifactStorage, LocalArtifactStorage, publish_price_list
+
+
+def test_publish_price_list(shop_with_products, test_client, tmp_path):
+    storage = LocalArtifactStorage(str(tmp_path))
+    keys = publish_price_list(shop_with_products, storage)
+    assert set(keys) == {"all", "horeca", "cannabis"}
+
+    for variant, is_horeca in (("all", ""), ("horeca", "?is_horeca=true"), ("cannabis", "?is_horeca=false")):
+        with open(os.path.join(tmp_path, keys[variant]), "rb") as f:
+            assert f.read() == test_client.get(f"/api/shops/{shop_with_products.id}{is_horeca}").content
+
+    with open(
+        os.path.join(tmp_path, app_settings.PRICE_LIST_ARTIFACTS_PREFIX, str(shop_with_products.id), "manifest.json")
+    ) as f:
+        manifest = json.load(f)
+    assert manifest["variants"] == {variant: os.path.basename(key) for variant, key in keys.items()}
+
+    # Unchanged content is published under the same name
+    assert publish_price_list(shop_with_products, storage) == keys
+
+
+def test_invalidate_shop_cache_publishes_price_list(shop_with_products, kind_1, tmp_path, monkeypatch):
+    monkeypatch.setattr(app_settings, "PRICE_LIST_ARTIFACTS_ENABLED", True)
+    monkeypatch.setattr(app_settings, "PRICE_LIST_ARTIFACTS_DIR", str(tmp_path))
+    shop_id = shop_with_products.id
+    shop_dir = os.path.join(tmp_path, app_settings.PRICE_LIST_ARTIFACTS_PREFIX, str(shop_id))
+
+    invalidateShopCache(shop_id)
+    published = set(os.listdir(shop_dir))
+    assert len(published) == 4
+
+    kind_1.name = "Renamed kind"
+    invalidateShopCache(shop_id)
+    # New files next to the old ones for the variants with kinds
+    assert len(set(os.listdir(shop_dir)) - published) == 2
+
+
+def test_incomplete_storage_cannot_be_created():
+    class WriteOnlyStorage(ArtifactStorage):
+        def write(self, key, content, cache_control):
+            pass
+
+    with pytest.raises(TypeError):
+        WriteOnlyStorage()
+
+
+def test_local_storage_write(tmp_path, monkeypatch):
+    storage = LocalArtifactStorage(str(tmp_path))
+    storage.write("shops/1.json", b"{}", "no-cache")
+    assert (tmp_path / "shops" / "1.json").read_bytes() == b"{}"
+    assert os.stat(tmp_path / "shops" / "1.json").st_mode & 0o777 == 0o644
+
+    # A failed write leaves no temporary file behind
+    def fail(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", fail)
+    with pytest.raises(OSError):
+        storage.write("shops/2.json", b"{}", "no-cache")
+    assert os.listdir(tmp_path / "shops") == ["1.json"]
@@ -0,0 +1,47 @@
+from server.utils import cache as cache_module
+from server.utils.cache import ReferenceCache, reference_caches
+
+
+def test_reference_cache():
+    cache = ReferenceCache("test", max_entries=2, ttl=0)
+    loads = []
+
+    def load(value):
+        loads.append(value)
+        return value
+
+    assert cache.get_or_load("a", lambda: load(1)) == 1
+    assert cache.get_or_load("a", lambda: load(2)) == 1
+    # A missing row is cached as well
+    assert cache.get_or_load("b", lambda: load(None)) is None
+    assert cache.get_or_load("b", lambda: load(3)) is None
+    assert loads == [1, None]
+    assert cache.stats() == {"entries": 2, "hits": 2, "misses": 2}
+    assert reference_caches["test"] is cache
+
+    # The least recently used entry is evicted first
+    cache.get_or_load("a", lambda: load(4))
+    cache.get_or_load("c", lambda: load(5))
+    assert cache.get_or_load("b", lambda: load(6)) == 6
+    assert cache.get_or_load("a", lambda: load(7)) == 7
+
+    cache.invalidate()
+    assert len(cache) == 0
+    del reference_caches["test"]
+
+
+def test_reference_cache_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache_module, "monotonic", lambda: now[0])
+    cache = ReferenceCache("test", ttl=60)
+    assert cache.get_or_load("a", lambda: 1) == 1
+    now[0] += 60
+    assert cache.get_or_load("a", lambda: 2) == 1
+    now[0] += 1
+    assert cache.get_or_load("a", lambda: 3) == 3
+
+    disabled = ReferenceCache("test", enabled=False)
+    assert disabled.get_or_load("a", lambda: 1) == 1
+    assert disabled.get_or_load("a", lambda: 2) == 2
+    assert len(disabled) == 0
+    del reference_caches["test"]
@@ -0,0 +1,100 @@
+import gzip
+
+import brotli
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.testclient import TestClient
+
+from server.utils.cache import SnapshotCache
+from server.utils.compression import CompressionMiddleware, negotiate_encoding
+
+BODY = "price list " * 200
+
+
+@pytest.fixture
+def cache():
+    return SnapshotCache(max_entries=10, ttl=0)
+
+
+@pytest.fixture
+def client(cache):
+    app = Starlette()
+
+    @app.route("/text")
+    def text(request):
+        return PlainTextResponse(BODY)
+
+    @app.route("/cached/text")
+    def cached_text(request):
+        return PlainTextResponse(BODY)
+
+    @app.route("/small")
+    def small(request):
+        return PlainTextResponse("small")
+
+    @app.route("/image")
+    def image(request):
+        return Response(BODY.encode(), media_type="image/png")
+
+    @app.route("/stream")
+    def stream(request):
+        return StreamingResponse((BODY for _ in range(10)), media_type="application/json")
+
+    app.add_middleware(CompressionMiddleware, minimum_size=100, cacheable_paths=["/cached"], cache=cache)
+    return TestClient(app)
+
+
+def raw_get(client, path, encoding):
+    response = client.get(path, headers={"Accept-Encoding": encoding}, stream=True)
+    return response, response.raw.read(decode_content=False)
+
+
+@pytest.mark.parametrize(
+    "accept_encoding,expected",
+    [
+        (None, None),
+        ("identity", None),
+        ("gzip, deflate", "gzip"),
+        ("gzip, deflate, br", "br"),
+        ("br;q=0.5, gzip", "gzip"),
+        ("br;q=0, gzip;q=0", None),
+    ],
+)
+def test_negotiate_encoding(accept_encoding, expected):
+    assert negotiate_encoding(accept_encoding) == expected
+
+
+@pytest.mark.parametrize("encoding,decompress", [("br", brotli.decompress), ("gzip", gzip.decompress)])
+def test_compression(client, encoding, decompress):
+    response, body = raw_get(client, "/text", encoding)
+    assert response.headers["content-encoding"] == encoding
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) == len(body)
+    assert decompress(body).decode() == BODY
+
+    response, body = raw_get(client, "/stream", encoding)
+    assert response.headers["content-encoding"] == encoding
+    assert decompress(body).decode() == BODY * 10
+
+
+@pytest.mark.parametrize("path", ["/small", "/image"])
+def test_no_compression(client, path):
+    response, _ = raw_get(client, path, "br")
+    assert "content-encoding" not in response.headers
+
+    response = client.get("/text", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.text == BODY
+
+
+def test_cacheable_paths(client, cache):
+    _, body = raw_get(client, "/cached/text", "br")
+    assert len(cache) == 1
+    _, cached_body = raw_get(client, "/cached/text", "br")
+    assert cached_body == body
+    raw_get(client, "/cached/text", "gzip")
+    assert len(cache) == 1
+
+    raw_get(client, "/text", "br")
+    assert len(cache) == 1
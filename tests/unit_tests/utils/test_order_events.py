@@ -0,0 +1,42 @@
+import asyncio
+import uuid
+
+from server.db import db
+from server.db.models import Order
+from server.utils.order_events import OrderEvents, order_events
+
+
+def test_order_events_fan_out():
+    events = OrderEvents()
+    shop_id, other_shop_id, order_id = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+
+    async def receive():
+        subscription = events.subscribe(shop_id)
+        other = events.subscribe(other_shop_id)
+        events.publish(shop_id, order_id)
+        received = await asyncio.wait_for(subscription.queue.get(), 1)
+        events.unsubscribe(subscription)
+        events.unsubscribe(other)
+        return received, other.queue.empty()
+
+    assert asyncio.new_event_loop().run_until_complete(receive()) == (order_id, True)
+    # Nobody listens anymore
+    events.publish(shop_id, order_id)
+
+
+def test_order_events_published_on_commit(shop_1):
+    async def receive():
+        subscription = order_events.subscribe(shop_1.id)
+        try:
+            order = Order(shop_id=shop_1.id, customer_order_id=1, total=10.0, order_info=[])
+            db.session.add(order)
+            db.session.flush()
+            assert subscription.queue.empty()
+            db.session.commit()
+            await asyncio.sleep(0)
+            return order.id, subscription.queue.get_nowait()
+        finally:
+            order_events.unsubscribe(subscription)
+
+    order_id, published = asyncio.new_event_loop().run_until_complete(receive())
+    assert published == order_id
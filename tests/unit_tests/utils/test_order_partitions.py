@@ -0,0 +1,60 @@
+from datetime import date, datetime
+
+from sqlalchemy import text
+
+from server.db import db
+from server.db.models import Order
+from server.utils.order_partitions import add_months, archive_partitions, ensure_partitions, get_partitions
+
+
+def partition_of(order_id):
+    return db.session.execute(
+        text("SELECT tableoid::regclass::text FROM orders WHERE id = :id"), {"id": order_id}
+    ).scalar()
+
+
+def add_order(shop, created_at, status="complete"):
+    order = Order(shop_id=shop.id, customer_order_id=1, status=status, order_info=[], created_at=created_at)
+    db.session.add(order)
+    db.session.commit()
+    return order.id
+
+
+def test_add_months():
+    assert add_months(date(2026, 11, 1), 2) == date(2027, 1, 1)
+    assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+    assert add_months(date(2026, 3, 1), -15) == date(2024, 12, 1)
+
+
+def test_ensure_partitions(shop_1):
+    order_id = add_order(shop_1, datetime(2031, 6, 15))
+    assert partition_of(order_id) == "orders_default"
+
+    created = ensure_partitions(2, today=date(2031, 5, 10))
+    assert created == [date(2031, 5, 1), date(2031, 6, 1), date(2031, 7, 1)]
+    assert set(created) <= set(get_partitions())
+    # Moved out of the default partition and still found through the model
+    assert partition_of(order_id) == "orders_2031_06"
+    assert Order.query.get(order_id).shop_id == shop_1.id
+
+    assert ensure_partitions(2, today=date(2031, 5, 10)) == []
+    assert partition_of(add_order(shop_1, datetime(2031, 7, 1))) == "orders_2031_07"
+
+
+def test_archive_partitions(shop_1):
+    ensure_partitions(1, today=date(2031, 5, 1))
+    pending_id = add_order(shop_1, datetime(2031, 5, 2), status="pending")
+    complete_id = add_order(shop_1, datetime(2031, 6, 2))
+
+    # Partitions with pending orders stay attached
+    archived = archive_partitions(1, "archive", today=date(2031, 8, 20))
+    assert date(2031, 5, 1) not in archived
+    assert date(2031, 6, 1) in archived
+    assert Order.query.get(complete_id) is None
+    archived_ids = db.session.execute(text("SELECT id FROM archive.orders_2031_06")).fetchall()
+    assert [row.id for row in archived_ids] == [complete_id]
+
+    Order.query.get(pending_id).status = "complete"
+    db.session.commit()
+    assert archive_partitions(1, "", today=date(2031, 8, 20)) == [date(2031, 5, 1)]
+    assert [month for month in get_partitions() if month < date(2031, 6, 1)] == []
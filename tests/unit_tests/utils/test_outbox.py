@@ -0,0 +1,144 @@
+import threading
+import uuid
+
+import pytest
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+from server.db import db
+from server.db.database import SESSION_ARGUMENTS, BaseModel
+from server.db.models import Order, OutboxMessage, Shop
+from server.utils.outbox import dispatch_outbox
+
+
+def add_order(shop, **kwargs):
+    order = Order(shop_id=shop.id, customer_order_id=1, total=10.0, order_info=[], **kwargs)
+    db.session.add(order)
+    db.session.commit()
+    return order
+
+
+def websocket_server(sent, down_for=None):
+    """A stand in for `sendMessageToWebSocketServer()` that fails for the shop `down_for`."""
+
+    def send(payload):
+        sent.append(payload)
+        return down_for is None or payload["shopId"] != str(down_for.id)
+
+    return send
+
+
+def test_order_writes_are_queued(shop_1):
+    order = add_order(shop_1)
+    test_order = add_order(shop_1, status="complete")
+    order.status = "complete"
+    db.session.commit()
+
+    messages = OutboxMessage.query.order_by(OutboxMessage.id).all()
+    assert [(message.topic, message.order_id) for message in messages] == [
+        ("pending_orders", order.id),
+        ("completed_orders", test_order.id),
+        ("completed_orders", order.id),
+    ]
+
+
+def test_dispatch_outbox(shop_1, shop_2, monkeypatch):
+    sent = []
+    monkeypatch.setattr("server.utils.outbox.sendMessageToWebSocketServer", websocket_server(sent))
+    modified_at = shop_1.modified_at
+    orders = [add_order(shop_1) for _ in range(3)]
+    other = add_order(shop_2)
+    orders[0].status = "complete"
+    db.session.commit()
+
+    assert dispatch_outbox() == 5
+    assert sorted(sent, key=lambda message: (message["shopId"], message["connectionType"])) == sorted(
+        [
+            {"connectionType": "pending_orders", "shopId": str(shop_1.id)},
+            {"connectionType": "completed_orders", "shopId": str(shop_1.id)},
+            {"connectionType": "pending_orders", "shopId": str(shop_2.id)},
+        ],
+        key=lambda message: (message["shopId"], message["connectionType"]),
+    )
+    db.session.expire_all()
+    assert shop_1.last_pending_order == str(orders[-1].id)
+    assert shop_1.last_completed_order == str(orders[0].id)
+    assert shop_1.modified_at == modified_at
+    assert shop_2.last_pending_order == str(other.id)
+
+    assert OutboxMessage.query.count() == 0
+    assert dispatch_outbox() == 0
+
+
+def test_dispatch_outbox_keeps_undelivered_messages(shop_1, shop_2, monkeypatch):
+    sent = []
+    monkeypatch.setattr("server.utils.outbox.sendMessageToWebSocketServer", websocket_server(sent, down_for=shop_1))
+    add_order(shop_1)
+    add_order(shop_1)
+    add_order(shop_2)
+
+    assert dispatch_outbox() == 1
+    assert [message.shop_id for message in OutboxMessage.query.all()] == [shop_1.id, shop_1.id]
+
+    # Retried by the next run
+    monkeypatch.setattr("server.utils.outbox.sendMessageToWebSocketServer", websocket_server(sent))
+    assert dispatch_outbox() == 2
+    assert sent[-1] == {"connectionType": "pending_orders", "shopId": str(shop_1.id)}
+    assert OutboxMessage.query.count() == 0
+
+
+@pytest.fixture
+def committed_shop_with_order():
+    """A shop with a pending order and its outbox message, really committed: concurrent dispatchers use their own
+    connections and don't see the data of the test transaction."""
+    session_factory, scoped = db.session_factory, db.scoped_session
+    db.session_factory = sessionmaker(**SESSION_ARGUMENTS, bind=db.engine)
+    db.scoped_session = scoped_session(db.session_factory, db._scopefunc)
+    BaseModel.set_query(db.scoped_session.query_property())
+    try:
+        with db.database_scope():
+            shop = Shop(name=f"Concurrent {uuid.uuid4()}", description=str(uuid.uuid4()))
+            db.session.add(shop)
+            db.session.commit()
+            shop_id = shop.id
+            add_order(shop)
+        yield shop_id
+    finally:
+        with db.database_scope():
+            Order.query.filter_by(shop_id=shop_id).delete()
+            # The outbox messages go with the shop
+            Shop.query.filter_by(id=shop_id).delete()
+            db.session.commit()
+        db.session_factory, db.scoped_session = session_factory, scoped
+        BaseModel.set_query(db.scoped_session.query_property())
+
+
+def test_concurrent_dispatchers_send_a_message_once(committed_shop_with_order, monkeypatch):
+    sent, sending, release = [], threading.Event(), threading.Event()
+
+    def send(payload):
+        sent.append(payload)
+        sending.set()
+        # Hold the first send until the second dispatcher has run
+        release.wait(5)
+        return True
+
+    monkeypatch.setattr("server.utils.outbox.sendMessageToWebSocketServer", send)
+
+    def dispatch(results):
+        with db.database_scope():
+            results.append(dispatch_outbox())
+
+    first_results, second_results = [], []
+    first = threading.Thread(target=dispatch, args=(first_results,))
+    first.start()
+    try:
+        assert sending.wait(5)
+        dispatch(second_results)
+    finally:
+        release.set()
+        first.join()
+
+    assert (first_results, second_results) == ([1], [0])
+    assert sent == [{"connectionType": "pending_orders", "shopId": str(committed_shop_with_order)}]
+    with db.database_scope():
+        assert OutboxMessage.query.filter_by(shop_id=committed_shop_with_order).count() == 0
@@ -0,0 +1,57 @@
+import msgpack
+import pytest
+
+from server.utils.price_list_encoding import (
+    COLUMNAR_JSON_MEDIA_TYPE,
+    JSON_MEDIA_TYPE,
+    MSGPACK_MEDIA_TYPE,
+    from_columnar,
+    negotiate_media_type,
+    to_columnar,
+)
+
+
+def price_row(id, category, kind):
+    return {
+        "id": id,
+        "category_id": f"category-{category}",
+        "category_name": f"Category {category}",
+        "main_category_id": "Unknown",
+        "main_category_name": "Unknown",
+        "kind_name": kind,
+        "one": 10.0,
+    }
+
+
+def test_columnar_round_trip():
+    document = {
+        "name": "Shop",
+        "description": "Description",
+        "id": "shop-1",
+        "prices": [price_row("1", 1, "Indica"), price_row("2", 1, "Sativa"), price_row("3", 2, None)],
+    }
+    columnar = to_columnar(document)
+    assert len(columnar["categories"]) == 2
+    assert columnar["prices"]["category"] == [0, 0, 1]
+    assert columnar["prices"]["kind_name"] == ["Indica", "Sativa", None]
+    assert "category_name" not in columnar["prices"]
+    assert from_columnar(columnar) == document
+
+    empty = {"name": "Shop", "description": "Description", "id": "shop-1", "prices": []}
+    assert from_columnar(to_columnar(empty)) == empty
+
+
+@pytest.mark.parametrize(
+    "accept,expected",
+    [
+        (None, JSON_MEDIA_TYPE),
+        ("*/*", JSON_MEDIA_TYPE),
+        ("application/msgpack", MSGPACK_MEDIA_TYPE),
+        ("application/json;q=0.5, application/msgpack", MSGPACK_MEDIA_TYPE),
+        ("application/msgpack;q=0.1, application/json", JSON_MEDIA_TYPE),
+        ("application/vnd.pricelist.columnar+json, application/json", COLUMNAR_JSON_MEDIA_TYPE),
+        ("application/msgpack;q=0", JSON_MEDIA_TYPE),
+    ],
+)
+def test_negotiate_media_type(accept, expected):
+    assert negotiate_media_type(accept) == expected